@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# Wrapper for 'python -m fstools align': align cluster labels across K and replicates.
+import sys
+
+from fstools.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main(['align'] + sys.argv[1:]))
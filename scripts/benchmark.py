@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# Wrapper for 'python -m fstools bench': benchmark every analysis stage on synthetic results.
+import sys
+
+from fstools.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main(['bench'] + sys.argv[1:]))
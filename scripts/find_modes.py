@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# Wrapper for 'python -m fstools modes': group the replicate runs of each K into modes.
+import sys
+
+from fstools.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main(['modes'] + sys.argv[1:]))
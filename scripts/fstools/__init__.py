@@ -0,0 +1,13 @@
+"""
+Shared core of the FastStructure analysis tools.
+
+Every tool is a subcommand of one CLI (fstools.cli):
+
+    python -m fstools choosek --input=faststructure_K
+    python -m fstools plot --k 1-10
+
+The scripts in this directory (chooseK.py, plot_tighter_stacked_bars.py,
+...) are thin wrappers around the same commands. The package only needs to
+sit next to them, or be installed with 'pip install .' from the repository
+root. Python 3 only.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from fstools.cli import main
+
+sys.exit(main())
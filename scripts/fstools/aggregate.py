@@ -0,0 +1,98 @@
+"""
+Per-K summaries over replicate runs.
+
+All statistics are computed over flat per-run arrays with grouped NumPy
+reductions (bincount / reduceat), so the cost does not depend on how the
+runs are spread over K.
+"""
+import numpy as np
+
+
+def _as_float(values):
+    """
+    Converts a list that may contain None into a float array with NaN gaps.
+    """
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def summarize_by_K(Ks, likelihoods, k_phi_stars):
+    """
+    Aggregates per-run results into one row per K.
+
+    Returns a dict of arrays, all of length n_K (sorted by K):
+        K            the K value
+        n_runs       number of runs seen for this K
+        n_ll         runs with a final likelihood
+        ll_mean      mean marginal likelihood (NaN if none)
+        ll_sd        sample standard deviation (NaN if fewer than two)
+        ll_min       smallest likelihood
+        ll_max       largest likelihood
+        kphi_mode    most frequent K_phi_star (ties go to the smaller value,
+                     like chooseK's bincount/argmax; -1 if none)
+    plus 'kphi_counts', an n_K x (max K_phi_star + 1) array whose column j
+    counts the runs with K_phi_star == j.
+
+    Arguments:
+        Ks : sequence of int
+            K of each run
+        likelihoods : sequence of float or None
+            final marginal likelihood of each run
+        k_phi_stars : sequence of int or None
+            K_phi_star of each run
+    """
+    Ks = np.asarray(Ks, dtype=np.int64)
+    ll = _as_float(likelihoods)
+    kphi = _as_float(k_phi_stars)
+
+    uniq_K, inv = np.unique(Ks, return_inverse=True)
+    n_groups = uniq_K.size
+    n_runs = np.bincount(inv, minlength=n_groups)
+
+    # --- Likelihood moments: grouped sums over runs that have a value ---
+    has_ll = ~np.isnan(ll)
+    ll_inv, ll_val = inv[has_ll], ll[has_ll]
+    n_ll = np.bincount(ll_inv, minlength=n_groups)
+    s1 = np.bincount(ll_inv, weights=ll_val, minlength=n_groups)
+    safe_n = np.maximum(n_ll, 1)
+    ll_mean = np.where(n_ll > 0, s1 / safe_n, np.nan)
+    # Two-pass variance around the group mean is stable for large |LLBO|
+    dev2 = np.bincount(ll_inv, weights=(ll_val - ll_mean[ll_inv]) ** 2, minlength=n_groups)
+    ll_sd = np.where(n_ll > 1, np.sqrt(dev2 / np.maximum(n_ll - 1, 1)), np.nan)
+
+    # --- Min / max: one sort by (group, value), then segment ends ---
+    ll_min = np.full(n_groups, np.nan)
+    ll_max = np.full(n_groups, np.nan)
+    if ll_val.size:
+        order = np.lexsort((ll_val, ll_inv))
+        sorted_inv, sorted_val = ll_inv[order], ll_val[order]
+        starts = np.flatnonzero(np.r_[True, sorted_inv[1:] != sorted_inv[:-1]])
+        ends = np.r_[starts[1:], sorted_inv.size] - 1
+        ll_min[sorted_inv[starts]] = sorted_val[starts]
+        ll_max[sorted_inv[starts]] = sorted_val[ends]
+
+    # --- K_phi_star distribution as a 2-D histogram ---
+    has_kphi = ~np.isnan(kphi)
+    kphi_val = kphi[has_kphi].astype(np.int64)
+    width = int(kphi_val.max()) + 1 if kphi_val.size else 1
+    flat = inv[has_kphi] * width + kphi_val
+    kphi_counts = np.bincount(flat, minlength=n_groups * width).reshape(n_groups, width)
+    kphi_mode = np.where(kphi_counts.sum(1) > 0, np.argmax(kphi_counts, axis=1), -1)
+
+    return {
+        'K': uniq_K,
+        'n_runs': n_runs,
+        'n_ll': n_ll,
+        'll_mean': ll_mean,
+        'll_sd': ll_sd,
+        'll_min': ll_min,
+        'll_max': ll_max,
+        'kphi_mode': kphi_mode,
+        'kphi_counts': kphi_counts,
+    }
+
+
+def format_kphi_counts(counts):
+    """
+    Formats one row of kphi_counts as 'value:count;...' for non-zero counts.
+    """
+    return ';'.join('%d:%d' % (value, n) for value, n in enumerate(counts) if n)
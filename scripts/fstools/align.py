@@ -0,0 +1,265 @@
+"""
+Cluster-label alignment across K.
+
+fastStructure numbers the components of every run arbitrarily, so the same
+ancestry can be column 0 at K=3 and column 2 at K=4 and end up with a
+different colour in each plot. Alignment walks up the K range: the
+reference run at each K has its columns permuted to best match the aligned
+reference at K-1, and every other replicate at K is matched to that
+reference. Matching uses the cosine similarity of Q columns (one matrix
+product) and an optimal one-to-one assignment.
+
+The permutations are saved as cluster_alignment.json in the results
+directory, keyed by .meanQ file name, and load_aligned_meanQ applies them
+whenever a script reads a Q-matrix.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+from fstools.qmatrix import load_meanQ
+
+ALIGNMENT_FILENAME = 'cluster_alignment.json'
+
+
+def linear_sum_assignment(cost):
+    """
+    Solves the rectangular assignment problem (Hungarian algorithm): picks
+    one column per row, all different, minimizing the total cost.
+
+    Returns (rows, cols) index arrays sorted by row, like
+    scipy.optimize.linear_sum_assignment. Written out here because the
+    matrices are only K x K and scipy is not otherwise needed.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Potentials and matching, 1-based with 0 as a virtual start column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.intp)   # row matched to each column
+    way = np.zeros(m + 1, dtype=np.intp)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(match[1:])
+    rows = match[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def column_similarity(A, B):
+    """
+    Returns the Ka x Kb cosine similarity between the columns of two
+    N x K matrices, computed as one matrix product.
+    """
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    norm_a = np.linalg.norm(A, axis=0)
+    norm_b = np.linalg.norm(B, axis=0)
+    norm_a[norm_a == 0] = 1.0
+    norm_b[norm_b == 0] = 1.0
+    return np.dot(A.T, B) / np.outer(norm_a, norm_b)
+
+
+def match_columns(reference, Q):
+    """
+    Returns the column permutation perm such that Q[:, perm] best matches
+    reference column by column. Q may have more columns than reference
+    (aligning K to K-1); its unmatched columns go last, largest total
+    ancestry first.
+    """
+    S = column_similarity(reference, Q)
+    rows, cols = linear_sum_assignment(-S)
+    perm = list(cols[np.argsort(rows)])
+    extra = [j for j in np.argsort(-np.asarray(Q).sum(0), kind='stable') if j not in perm]
+    return np.array(perm + extra, dtype=np.intp)
+
+
+def align_runs(runs):
+    """
+    Computes aligned column orders for every run with a .meanQ file.
+
+    Arguments:
+        runs : OrderedDict
+            (K, seed) -> run dict with 'meanQ' and 'likelihood', as returned
+            by fstools.index.load_runs
+
+    Returns {meanQ path: (perm, reference path or None)}. The reference at
+    each K is its highest-likelihood run (lowest seed if none has one),
+    aligned to the reference of the next smaller K.
+    """
+    by_K = {}
+    for (K, seed), run in runs.items():
+        if run.get('meanQ'):
+            by_K.setdefault(K, []).append(run)
+
+    result = {}
+    previous = None   # aligned reference Q of the previous K
+    previous_path = None
+    for K in sorted(by_K):
+        replicates = by_K[K]
+        reference = max(replicates, key=lambda r: (r.get('likelihood') is not None,
+                                                   r.get('likelihood') or 0.0, -r['seed']))
+        Q_ref = load_meanQ(reference['meanQ'])
+        if Q_ref.shape[1] != K:
+            sys.stderr.write("Warning: %s has %d columns, expected %d. Skipping K=%d.\n"
+                             % (reference['meanQ'], Q_ref.shape[1], K, K))
+            continue
+
+        if previous is not None and previous.shape[0] == Q_ref.shape[0] and previous.shape[1] <= K:
+            perm = match_columns(previous, Q_ref)
+            result[reference['meanQ']] = (perm, previous_path)
+        else:
+            perm = np.arange(K)
+            result[reference['meanQ']] = (perm, None)
+        aligned_ref = Q_ref[:, perm]
+
+        for run in replicates:
+            if run is reference:
+                continue
+            Q = load_meanQ(run['meanQ'])
+            if Q.shape != Q_ref.shape:
+                sys.stderr.write("Warning: %s does not have the shape of %s. Not aligned.\n"
+                                 % (run['meanQ'], reference['meanQ']))
+                continue
+            result[run['meanQ']] = (match_columns(aligned_ref, Q), reference['meanQ'])
+
+        previous, previous_path = aligned_ref, reference['meanQ']
+    return result
+
+
+def _file_stamp(path):
+    """
+    Size and mtime of a file, used to notice .meanQ files edited after
+    alignment. The path is left out so a results directory can be moved.
+    """
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def save_alignment(alignment, results_dir):
+    """
+    Writes the permutations to cluster_alignment.json in results_dir, with
+    the size/mtime of each .meanQ so edits to it can be detected.
+    """
+    entries = {}
+    for path, (perm, reference) in alignment.items():
+        entries[os.path.basename(path)] = {
+            'perm': [int(j) for j in perm],
+            'reference': os.path.basename(reference) if reference else None,
+            'source': _file_stamp(path),
+        }
+    out_path = os.path.join(results_dir or '.', ALIGNMENT_FILENAME)
+    with open(out_path, 'w') as handle:
+        json.dump(entries, handle, indent=1, sort_keys=True)
+    return out_path
+
+
+def read_alignment(results_dir):
+    """
+    Returns the saved alignment entries for results_dir, or {} if none.
+    """
+    path = os.path.join(results_dir or '.', ALIGNMENT_FILENAME)
+    try:
+        with open(path, 'r') as handle:
+            return json.load(handle)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def alignment_perm(path):
+    """
+    Returns the saved column order of a .meanQ file, or None when the
+    alignment is missing for this file or was computed before the file last
+    changed (with a warning). The same order applies to the columns of the
+    run's .meanP/.varQ and to both halves of its .varP.
+    """
+    entry = read_alignment(os.path.dirname(path)).get(os.path.basename(path))
+    if entry is None:
+        return None
+    if entry['source'] != _file_stamp(path):
+        sys.stderr.write("Warning: %s changed since clusters were aligned. Re-run align_clusters.py; "
+                         "using unaligned columns.\n" % path)
+        return None
+    return entry['perm']
+
+
+def load_aligned_meanQ(path):
+    """
+    Loads a .meanQ file (through the sidecar cache) with its columns in
+    the saved aligned order. Falls back to the file's own order, with a
+    warning, when the alignment is missing for this file or was computed
+    before the file last changed.
+    """
+    Q = load_meanQ(path)
+    perm = alignment_perm(path)
+    if perm is None or len(perm) != Q.shape[1]:
+        return Q
+    return Q[:, perm]
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+
+
+def run(args):
+    """
+    The align command: aligns every run and saves cluster_alignment.json
+    next to the results, where the plot command picks it up automatically.
+    """
+    from fstools.index import load_runs
+    from fstools.profiling import stage
+
+    # Likelihoods pick the reference replicate at each K
+    runs = load_runs(args.input, jobs=args.jobs)
+    if not any(run['meanQ'] for run in runs.values()):
+        print("Error: No .meanQ files found matching '%s<K>.<seed>.meanQ'." % args.input)
+        return 1
+
+    with stage('align'):
+        alignment = align_runs(runs)
+    out_path = save_alignment(alignment, os.path.dirname(args.input))
+
+    print('%-40s %-30s aligned to' % ('file', 'column order'))
+    # Runs are sorted by (K, seed)
+    for path in [run['meanQ'] for run in runs.values() if run['meanQ'] in alignment]:
+        perm, reference = alignment[path]
+        print('%-40s %-30s %s' % (os.path.basename(path), ' '.join(str(j) for j in perm),
+                                  os.path.basename(reference) if reference else '-'))
+    print("Alignment for %d runs saved to %s" % (len(alignment), out_path))
+    return 0
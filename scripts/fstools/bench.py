@@ -0,0 +1,313 @@
+"""
+Benchmark harness: wall time and peak memory of named stages.
+
+A stage is a (name, setup, func) triple. setup (may be None) runs before
+every timed call and is not timed itself, e.g. to clear a cache so a
+"cold" stage really starts cold. Each stage is timed `repeat` times, and
+the fastest time is kept as the least noisy estimate. It is then run once
+more under tracemalloc to record the peak memory allocated through Python
+and NumPy; that run is not timed because tracing slows allocation down.
+
+Results are plain dicts saved as JSON together with the machine, library
+versions and git commit, so two files from different commits can be
+compared with compare_results. build_stages defines the standard suite
+run by the bench command over synthetic results trees.
+"""
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# A stage is reported as slower/faster when its time changes by more than this
+DEFAULT_TOLERANCE = 0.10
+
+
+def measure(func, setup=None, repeat=3):
+    """
+    Times func() repeat times and measures its peak traced memory once.
+
+    Returns {'wall_s': fastest time, 'wall_all': all times, 'peak_mb': peak
+    traced allocation in MiB}.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / float(1 << 20)
+    finally:
+        tracemalloc.stop()
+    return {'wall_s': min(times), 'wall_all': times, 'peak_mb': peak}
+
+
+def run_stages(stages, params, repeat=3, log=None):
+    """
+    Measures every stage and returns one result dict per stage: the stage
+    name, the measurements and a copy of params (the data size).
+
+    Arguments:
+        stages : list of (name, setup, func)
+        params : dict
+            describes the input, e.g. {'N': 1000, 'L': 5000, 'reps': 1}
+        repeat : int
+            timed calls per stage
+        log : file-like or None
+            progress lines are written here
+    """
+    results = []
+    for name, setup, func in stages:
+        result = dict(params, stage=name)
+        result.update(measure(func, setup, repeat))
+        results.append(result)
+        if log is not None:
+            log.write('%-24s %-28s %10.4f s %9.1f MiB\n' % (
+                name, format_params(params), result['wall_s'], result['peak_mb']))
+            log.flush()
+    return results
+
+
+def format_params(params):
+    """
+    'N=1000 L=5000 reps=1' style summary of a params dict.
+    """
+    return ' '.join('%s=%s' % (key, params[key]) for key in sorted(params))
+
+
+def _git_commit():
+    """
+    Short hash of the commit the scripts are checked out at, or None
+    outside a git checkout.
+    """
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    Describes where the benchmark ran, for the JSON header.
+    """
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def save_results(results, path):
+    """
+    Writes {'environment': ..., 'results': [...]} to path as JSON.
+    """
+    with open(path, 'w') as handle:
+        json.dump({'environment': environment(), 'results': results}, handle, indent=1, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, 'r') as handle:
+        return json.load(handle)
+
+
+def _result_key(result):
+    """
+    Identifies a measurement across files: stage name plus its parameters.
+    """
+    return tuple(sorted((key, value) for key, value in result.items()
+                        if key not in ('wall_s', 'wall_all', 'peak_mb')))
+
+
+def compare_results(old, new, tolerance=DEFAULT_TOLERANCE):
+    """
+    Pairs up the measurements of two saved benchmark files.
+
+    Returns a list of (result, old_wall, new_wall, ratio, verdict) for every
+    stage/size present in both; verdict is 'slower', 'faster' or '' when
+    the ratio new/old is within tolerance of 1.
+    """
+    before = dict((_result_key(r), r) for r in old['results'])
+    rows = []
+    for result in new['results']:
+        match = before.get(_result_key(result))
+        if match is None:
+            continue
+        ratio = result['wall_s'] / match['wall_s'] if match['wall_s'] > 0 else float('inf')
+        if ratio > 1.0 + tolerance:
+            verdict = 'slower'
+        elif ratio < 1.0 - tolerance:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        rows.append((result, match['wall_s'], result['wall_s'], ratio, verdict))
+    return rows
+
+
+def print_comparison(rows, out=sys.stdout):
+    out.write('%-24s %-28s %10s %10s %7s\n' % ('stage', 'size', 'before', 'after', 'ratio'))
+    for result, old_wall, new_wall, ratio, verdict in rows:
+        params = dict((k, v) for k, v in result.items()
+                      if k not in ('stage', 'wall_s', 'wall_all', 'peak_mb'))
+        out.write('%-24s %-28s %9.4fs %9.4fs %6.2fx %s\n' % (
+            result['stage'], format_params(params), old_wall, new_wall, ratio, verdict))
+
+
+def build_stages(tree, Ks, reps, plot=True, full=False):
+    """
+    Returns the (name, setup, func) stages for one results tree. Stages run
+    in this order: the '_cached'/'_indexed' ones reuse what the stage
+    before them left on disk. full adds the per-locus statistics of the
+    largest K, which need the --full outputs.
+    """
+    from fstools.align import align_runs
+    from fstools.index import INDEX_FILENAME, load_runs
+    from fstools.ingest import discover_runs, parse_log_file, parse_meanQ_file, run_seeds
+    from fstools.metrics import compile_metrics
+    from fstools.modes import find_modes
+    from fstools.qmatrix import CACHE_DIRNAME
+    from fstools.store import STORE_DIRNAME, ResultsStore, build_store
+    from fstools.synthetic import LABEL_FILENAME
+
+    filetag = os.path.join(tree, 'faststructure_K')
+    runs = discover_runs(filetag)
+    logs = [run['log'] for run in runs.values()]
+    meanQs = [run['meanQ'] for run in runs.values()]
+
+    def clear_cache():
+        shutil.rmtree(os.path.join(tree, CACHE_DIRNAME), ignore_errors=True)
+
+    def clear_index():
+        if os.path.exists(os.path.join(tree, INDEX_FILENAME)):
+            os.remove(os.path.join(tree, INDEX_FILENAME))
+
+    stages = [
+        ('glob', None, lambda: discover_runs(filetag)),
+        ('parse_logs', None, lambda: [parse_log_file(path) for path in logs]),
+        ('parse_varQs_cold', clear_cache, lambda: [parse_meanQ_file(path) for path in meanQs]),
+        ('parse_varQs_cached', None, lambda: [parse_meanQ_file(path) for path in meanQs]),
+        ('compile_metrics', clear_index, lambda: compile_metrics(filetag)),
+        ('compile_metrics_indexed', None, lambda: compile_metrics(filetag)),
+    ]
+
+    results = load_runs(filetag)
+    stages.append(('align_clusters', None, lambda: align_runs(results)))
+
+    store_dir = os.path.join(tree, STORE_DIRNAME)
+
+    def read_store():
+        # Touch every value, as a consumer of all runs would
+        store = ResultsStore(store_dir)
+        return [float(store.stack(K).sum()) for K in store.Ks]
+
+    stages.append(('build_store', None, lambda: build_store(filetag, store_dir)))
+    stages.append(('read_store', None, read_store))
+    if reps > 1:
+        by_K = {}
+        for run in results.values():
+            by_K.setdefault(run['K'], []).append(run)
+        stages.append(('find_modes', None, lambda: [find_modes(by_K[K]) for K in sorted(by_K)]))
+
+    if full:
+        from fstools.perlocus import locus_statistics
+        prefix = os.path.join(tree, 'faststructure_K%d.%d' % (max(Ks), run_seeds(max(Ks), reps)[0]))
+        stages.append(('locus_stats_K%d' % max(Ks), None, lambda: locus_statistics(prefix)))
+
+    if plot:
+        # Plotting pulls in pandas and matplotlib; --no-plot never loads them
+        from fstools import plotting
+        label_path = os.path.join(tree, LABEL_FILENAME)
+        K = max(Ks)
+        seed = run_seeds(K, reps)[0]
+        shared = {}
+
+        def group_sort():
+            shared['labels'], shared['grouping'] = plotting.load_sample_order(label_path)
+
+        def plot_largest_K():
+            # plot_k reads and writes relative to the working directory
+            cwd = os.getcwd()
+            os.chdir(tree)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    plotting.plot_k(K, shared['labels'], shared['grouping'], seed=seed)
+            finally:
+                os.chdir(cwd)
+
+        stages.append(('group_sort', None, group_sort))
+        stages.append(('plot_K%d' % K, None, plot_largest_K))
+    return stages
+
+
+def add_arguments(parser):
+    parser.add_argument('--samples', default='1000,10000', help="comma-separated sample counts N (default: %(default)s)")
+    parser.add_argument('--loci', type=int, default=5000, help="number of loci L (default: %(default)s)")
+    parser.add_argument('--k', dest='k_range', default='1-10', help="K values (default: %(default)s)")
+    parser.add_argument('--reps', type=int, default=1, help="replicate runs per K (default: %(default)s)")
+    parser.add_argument('--full', action='store_true', help="also write --full outputs into the trees")
+    parser.add_argument('--repeat', type=int, default=3, help="timed calls per stage, fastest is kept (default: %(default)s)")
+    parser.add_argument('--no-plot', dest='plot', action='store_false', help="skip the sorting and plotting stages")
+    parser.add_argument('--workdir', help="where to generate the trees (default: a temporary directory)")
+    parser.add_argument('--keep', action='store_true', help="keep the generated trees")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file to write (default: %(default)s)")
+    parser.add_argument('--compare', metavar='JSON', help="earlier results to compare against")
+
+
+def run(args):
+    """
+    The bench command: generates one synthetic tree per sample count and
+    times every stage on it.
+    """
+    from fstools.ingest import parse_k_range
+    from fstools.synthetic import write_synthetic_results
+
+    try:
+        sizes = [int(n) for n in args.samples.split(',')]
+        Ks = parse_k_range(args.k_range)
+    except ValueError:
+        print("Error: --samples and --k take integers, e.g. --samples 1000,10000 --k 1-10.")
+        return 1
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='fstools_bench_')
+    results = []
+    try:
+        for N in sizes:
+            tree = os.path.join(workdir, 'N%d' % N)
+            print("Generating N=%d, L=%d, K=%s, %d per K in %s" % (N, args.loci, args.k_range, args.reps, tree))
+            write_synthetic_results(tree, N=N, L=args.loci, Ks=Ks, reps=args.reps, full=args.full)
+            params = {'N': N, 'L': args.loci, 'Ks': args.k_range, 'reps': args.reps, 'full': args.full}
+            results.extend(run_stages(build_stages(tree, Ks, args.reps, args.plot, args.full), params,
+                                      repeat=args.repeat, log=sys.stdout))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    save_results(results, args.output)
+    print("Results for %d stage/size pairs saved to %s" % (len(results), args.output))
+
+    if args.compare:
+        print("\nCompared with %s:" % args.compare)
+        print_comparison(compare_results(load_results(args.compare), load_results(args.output)))
+    return 0
@@ -0,0 +1,300 @@
+"""
+The bootstrap command: how sure are the two K answers of choosek?
+
+choosek reports the K of the run with the highest marginal likelihood and
+the most common K_phi_star over all runs, as point estimates. This
+resamples both rules thousands of times:
+
+    individuals   the samples are drawn with replacement (the same draw for
+                  every run), and each run's K_phi_star is recomputed from
+                  its resampled column sums
+    replicates    the runs of each K are drawn with replacement; both rules
+                  are then applied to the drawn runs
+
+(the likelihood is one number per run, so only the replicate resampling
+moves it). The share of bootstrap draws picking each K, and a percentile
+interval, are reported for both rules, and per K the interval of
+K_phi_star.
+
+A K_phi_star only needs the column sums of the row-normalized Q, so a
+draw of the samples is a vector of multiplicities w and the sums are
+w . Q. A batch of draws is made as one index array, turned into
+multiplicities with a single np.bincount, and multiplied with the columns
+of every run at once: one matrix product per batch covers all runs and K.
+Batches have their own random streams (spawned from --seed), so the
+result does not depend on --jobs.
+"""
+import sys
+
+import numpy as np
+
+from fstools.profiling import stage
+
+DEFAULT_BOOTSTRAPS = 1000
+
+# Memory for one batch's multiplicities and sums
+BATCH_MEMORY_MB = 128
+
+OUTPUT_FILENAME = 'bootstrap_k.txt'
+
+RESAMPLE_CHOICES = ('both', 'individuals', 'replicates')
+
+
+def k_phi_stars(sums, N):
+    """
+    K_phi_star of every row of sums (draws x K column sums of normalized
+    Q-matrices over N samples): as qmatrix.k_phi_star, the number of
+    components, largest first, needed to explain N - 1 individuals.
+    """
+    C = np.cumsum(np.sort(sums, axis=1)[:, ::-1], axis=1)
+    return (C < N - 1).sum(axis=1) + 1
+
+
+def resample_sums(columns, draws, rng):
+    """
+    Column sums of columns (N x M) over draws bootstrap samples of its
+    rows: returns a draws x M array.
+    """
+    N = len(columns)
+    with stage('draw_indices'):
+        index = rng.randint(0, N, size=(draws, N))
+        # Multiplicity of each sample in each draw, from one bincount over all draws
+        index += (np.arange(draws) * N)[:, None]
+        weights = np.bincount(index.ravel(), minlength=draws * N).reshape(draws, N)
+    with stage('column_sums'):
+        return np.dot(weights.astype(np.float64), columns)
+
+
+def modal(values, top):
+    """
+    Most common value (1..top) of every row of an int array; ties go to
+    the smaller value, like chooseK's bincount/argmax.
+    """
+    counts = (values[:, :, None] == np.arange(1, top + 1)).sum(axis=1)
+    return counts.argmax(axis=1) + 1
+
+
+class Sweep(object):
+    """
+    What a batch of draws needs, shared with the worker processes: the
+    normalized columns of every run side by side (N x sum of K), and per
+    run its K, its column span and its likelihood (NaN if none).
+    """
+
+    def __init__(self, stacks, likelihoods):
+        blocks, Ks, spans, lls = [], [], [], []
+        column = 0
+        for K, seeds, stack in stacks:
+            for seed, Q in zip(seeds, stack):
+                Q = np.asarray(Q, dtype=np.float64)
+                totals = Q.sum(axis=1, keepdims=True)
+                totals[totals == 0] = 1.0
+                blocks.append(Q / totals)
+                Ks.append(K)
+                spans.append((column, column + K))
+                ll = likelihoods.get((K, seed))
+                lls.append(np.nan if ll is None else ll)
+                column += K
+        if len(set(len(block) for block in blocks)) > 1:
+            raise ValueError("runs have different numbers of samples")
+        self.columns = np.hstack(blocks) if blocks else np.zeros((0, 0))
+        self.N = self.columns.shape[0]
+        self.Ks = np.array(Ks, dtype=np.int64)
+        self.spans = spans
+        self.likelihoods = np.array(lls)
+        self.max_K = int(self.Ks.max()) if len(Ks) else 0
+
+    def k_phi_stars(self, sums):
+        """
+        draws x runs K_phi_star values from draws x columns sums.
+        """
+        return np.column_stack([k_phi_stars(sums[:, a:b], self.N) for a, b in self.spans])
+
+    def point(self):
+        """
+        K_phi_star of every run without resampling.
+        """
+        return self.k_phi_stars(self.columns.sum(axis=0)[None, :])[0]
+
+    def run_batch(self, draws, rng, individuals=True, replicates=True):
+        """
+        Applies both rules to draws bootstrap samples. Returns (best_mle,
+        modal_kphi, kphi): the K picked by each rule per draw (0 where the
+        likelihood rule has nothing to go on) and the draws x runs K_phi_star
+        values before replicate resampling.
+        """
+        if individuals:
+            kphi = self.k_phi_stars(resample_sums(self.columns, draws, rng))
+        else:
+            kphi = np.repeat(self.point()[None, :], draws, axis=0)
+
+        with stage('apply_rules'):
+            Ks = np.unique(self.Ks)
+            picked_kphi, best_ll = [], np.full((draws, len(Ks)), -np.inf)
+            for j, K in enumerate(Ks):
+                runs = np.flatnonzero(self.Ks == K)
+                choice = rng.randint(0, len(runs), size=(draws, len(runs))) if replicates \
+                    else np.broadcast_to(np.arange(len(runs)), (draws, len(runs)))
+                chosen = runs[choice]
+                picked_kphi.append(np.take_along_axis(kphi, chosen, axis=1) if replicates else kphi[:, runs])
+                ll = self.likelihoods[chosen]
+                ll = np.where(np.isnan(ll), -np.inf, ll)
+                best_ll[:, j] = ll.max(axis=1)
+            best_mle = np.where(np.isfinite(best_ll).any(axis=1), Ks[best_ll.argmax(axis=1)], 0)
+            modal_kphi = modal(np.hstack(picked_kphi), self.max_K)
+        return best_mle, modal_kphi, kphi
+
+
+# Set in each worker process by _init_worker
+_shared = {}
+
+
+def _init_worker(sweep, options):
+    _shared.update(sweep=sweep, options=options)
+
+
+def _batch_worker(item):
+    draws, seed_sequence = item
+    options = _shared['options']
+    return _shared['sweep'].run_batch(draws, np.random.RandomState(np.random.MT19937(seed_sequence)),
+                                      options['individuals'], options['replicates'])
+
+
+def bootstrap(sweep, n_boot=DEFAULT_BOOTSTRAPS, seed=0, individuals=True, replicates=True, jobs=1,
+              batch=None):
+    """
+    Runs n_boot bootstrap draws of both rules.
+
+    Arguments:
+        sweep : Sweep
+            the runs
+        n_boot : int
+            number of bootstrap draws
+        seed : int
+            random seed; the same seed gives the same draws for any jobs
+        individuals, replicates : bool
+            what to resample
+        jobs : int
+            worker processes (0 = one per CPU)
+        batch : int or None
+            draws per batch (default: what fits BATCH_MEMORY_MB)
+
+    Returns (best_mle, modal_kphi, kphi) as Sweep.run_batch, for all draws.
+    """
+    from fstools.ingest import resolve_jobs
+
+    if batch is None:
+        batch = max(1, min(n_boot, BATCH_MEMORY_MB * (1 << 20) // (8 * 2 * max(sweep.N, sweep.columns.shape[1]))))
+    sizes = [min(batch, n_boot - start) for start in range(0, n_boot, batch)]
+    items = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    options = {'individuals': individuals, 'replicates': replicates}
+
+    jobs = min(resolve_jobs(jobs), len(items))
+    with stage('bootstrap'):
+        if jobs <= 1:
+            _init_worker(sweep, options)
+            results = [_batch_worker(item) for item in items]
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(sweep, options))
+            try:
+                results = pool.map(_batch_worker, items)
+            finally:
+                pool.close()
+                pool.join()
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def interval(values, level):
+    """
+    Lower and upper percentile bounds of values for a central interval of
+    the given level, rounded to values that occur (K is discrete).
+    """
+    tail = 100.0 * (1.0 - level) / 2.0
+    return (int(np.percentile(values, tail, method='lower')),
+            int(np.percentile(values, 100.0 - tail, method='higher')))
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--store', metavar='DIR', help="read the runs from a results store ('fstools store')")
+    parser.add_argument('--bootstraps', type=int, default=DEFAULT_BOOTSTRAPS,
+                        help="bootstrap draws (default: %(default)s)")
+    parser.add_argument('--resample', choices=RESAMPLE_CHOICES, default='both',
+                        help="draw individuals, replicate runs, or both (default: %(default)s)")
+    parser.add_argument('--level', type=float, default=0.95, help="interval coverage (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="worker processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--batch', type=int, help="draws per batch (default: sized to %d MB)" % BATCH_MEMORY_MB)
+    parser.add_argument('--output', default=OUTPUT_FILENAME,
+                        help="share of draws picking each K, per rule (default: %(default)s)")
+
+
+def run(args):
+    from fstools.choosek import select_k
+    from fstools.store import iter_stacks, open_store
+
+    if args.bootstraps < 1 or not 0 < args.level < 1:
+        print("Error: --bootstraps must be at least 1 and --level between 0 and 1.")
+        return 1
+
+    store = None
+    try:
+        if args.store:
+            store = open_store(args.store)
+            runs = store.runs()
+        else:
+            from fstools.index import load_runs
+            runs = load_runs(args.input, jobs=args.jobs)
+        likelihoods = dict((key, run['likelihood']) for key, run in runs.items())
+        with stage('read_stacks'):
+            sweep = Sweep(iter_stacks(args.input, store), likelihoods)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+    if not len(sweep.Ks):
+        print("Error: No .meanQ files found matching '%s<K>.<seed>.meanQ'." % args.input)
+        return 1
+
+    individuals = args.resample in ('both', 'individuals')
+    replicates = args.resample in ('both', 'replicates')
+    if replicates and all(np.sum(sweep.Ks == K) == 1 for K in np.unique(sweep.Ks)):
+        sys.stderr.write("Warning: one run per K; resampling replicates changes nothing, and the likelihood "
+                         "rule has no uncertainty without replicate runs.\n")
+
+    best_mle, modal_kphi, kphi = bootstrap(sweep, args.bootstraps, args.seed, individuals, replicates,
+                                           args.jobs, args.batch)
+    point_mle, point_kphi = select_k([{'K': int(K), 'likelihood': None if np.isnan(ll) else ll, 'k_phi_star': int(k)}
+                                      for K, ll, k in zip(sweep.Ks, sweep.likelihoods, sweep.point())])
+
+    print("%d bootstrap draws over %d runs (%d samples), resampling %s"
+          % (args.bootstraps, len(sweep.Ks), sweep.N, args.resample))
+    print('\n%-28s %6s %14s  %s' % ('rule', 'K', '%d%% interval' % round(100 * args.level), 'share of draws'))
+    rows = []
+    for name, point, draws in (('max marginal likelihood', point_mle, best_mle),
+                               ('modal K_phi_star', point_kphi, modal_kphi)):
+        draws = draws[draws > 0]
+        if point is None or not len(draws):
+            print('%-28s %6s' % (name, '-'))
+            continue
+        values, counts = np.unique(draws, return_counts=True)
+        shares = counts / float(len(draws))
+        low, high = interval(draws, args.level)
+        print('%-28s %6d %14s  %s' % (name, point, '%d-%d' % (low, high),
+                                      ', '.join('K=%d %.1f%%' % (v, 100 * s) for v, s in zip(values, shares)
+                                                if s >= 0.005)))
+        rows += [(name, point, v, s) for v, s in zip(values, shares)]
+
+    print('\n%4s %5s %12s %14s' % ('K', 'runs', 'K_phi_star', '%d%% interval' % round(100 * args.level)))
+    point = sweep.point()
+    for K in np.unique(sweep.Ks):
+        mask = sweep.Ks == K
+        low, high = interval(kphi[:, mask].ravel(), args.level)
+        print('%4d %5d %12s %14s' % (K, mask.sum(), ','.join(str(k) for k in point[mask]), '%d-%d' % (low, high)))
+
+    with open(args.output, 'w') as handle:
+        handle.write('Rule,Point_K,K,Share\n')
+        for name, point_K, K, share in rows:
+            handle.write('%s,%d,%d,%.4f\n' % (name, point_K, K, share))
+    print("\nShares saved to %s" % args.output)
+    return 0
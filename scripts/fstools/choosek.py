@@ -0,0 +1,146 @@
+"""
+The choosek command: picks K from a sweep of fastStructure runs.
+
+Two answers are reported, as in fastStructure's own chooseK.py: the K whose
+run has the highest final marginal likelihood, and the most common
+K_phi_star (the number of components the runs actually use). Parsed values
+come from the results index, so a warm call touches no NumPy at all and
+starts in a few tens of milliseconds.
+"""
+import sys
+from collections import Counter
+
+from fstools import profiling
+from fstools.index import DEFAULT_SETTLE, load_runs
+from fstools.ingest import map_files
+
+
+def parse_logs(files, jobs=1):
+    """
+    Parses through log files to extract the FINAL, converged marginal
+    likelihood estimates.
+
+    Arguments:
+        files : list
+            list of .log file names
+        jobs : int
+            number of worker processes (0 means one per CPU)
+    """
+    # Files are spread over a process pool; values come back in file order
+    values = map_files([('log', file) for file in files], jobs)
+    return [mle for mle in values if mle is not None]
+
+
+def parse_varQs(files, jobs=1):
+    """
+    Parses through multiple .meanQ files to extract the mean
+    admixture proportions estimated by executing the
+    variational inference algorithm on a dataset. This is then used
+    to identify the number of model components (best K) used to explain
+    structure in the data, for each .meanQ file.
+
+    Arguments:
+        files : list
+            list of .meanQ file names
+        jobs : int
+            number of worker processes (0 means one per CPU)
+    """
+    values = map_files([('meanQ', file) for file in files], jobs)
+    return [bestK for bestK in values if bestK is not None]
+
+
+def select_k(runs):
+    """
+    Returns (best_K_mle, modal_k_phi_star) for a list of run dicts. Either
+    is None when no run has a likelihood / K_phi_star.
+
+    Ties go the same way as np.argmax: the first run with the highest
+    likelihood, and the smallest of the most frequent K_phi_star values.
+    """
+    # K comes from the same run as its likelihood, so the two can never misalign
+    parsed = [(run['K'], run['likelihood']) for run in runs if run['likelihood'] is not None]
+    best_K_mle = None
+    if parsed:
+        best_K_mle = max(parsed, key=lambda item: item[1])[0]
+
+    counts = Counter(run['k_phi_star'] for run in runs if run['k_phi_star'] is not None)
+    modal = None
+    if counts:
+        modal = max(counts, key=lambda value: (counts[value], -value))
+    return best_K_mle, modal
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', metavar='FILETAG',
+                        help="output file tag, e.g. faststructure_K or results/faststructure_K (required without --store)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--no-index', dest='use_index', action='store_false',
+                        help="re-parse every file instead of using the results index")
+    parser.add_argument('--watch', action='store_true', help="keep polling while the job array runs; Ctrl-C to stop")
+    parser.add_argument('--interval', type=float, default=30.0,
+                        help="seconds between polls in --watch mode (default: %(default)s)")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE,
+                        help="seconds a file must be unmodified before it is read (default: %(default)s)")
+    parser.add_argument('--expect', type=int, help="runs expected per K, for the --watch progress table")
+    parser.add_argument('--store', metavar='DIR', help="read the runs from a results store ('fstools store')")
+
+
+def run(args):
+    filetag = args.input
+    if not filetag and not args.store:
+        print("Error: The --input filetag is required.")
+        return 2
+
+    # --- Live mode: follow the job array as tasks finish ---
+
+    if args.watch:
+        # Watching follows the files themselves; a store is a fixed snapshot
+        if not filetag:
+            print("Error: --watch follows the output files and needs --input; a --store cannot be watched.")
+            return 2
+        if args.store:
+            sys.stderr.write("Warning: --store is ignored with --watch; following %s instead.\n" % filetag)
+        from fstools.watch import watch
+        watch(filetag, interval=args.interval, settle=args.settle, expect=args.expect, jobs=args.jobs)
+        return 0
+
+    # --- Parse every run ---
+
+    # Find all outputs (e.g., 'faststructure_K5.5.log' / '.meanQ'), keyed by (K, seed).
+    # Only files that are new or changed since the last call are parsed (across
+    # --jobs worker processes); everything else comes from the results index.
+    # With --store they all come from its manifest instead.
+    if args.store:
+        from fstools.store import open_store
+        try:
+            results = open_store(args.store).runs()
+        except (IOError, OSError, ValueError) as e:
+            print("Error: Cannot open results store: %s" % e)
+            return 1
+    else:
+        results = load_runs(filetag, jobs=args.jobs, use_index=args.use_index)
+    runs = list(results.values())
+
+    if not any(run['log'] for run in runs):
+        print("Error: No log files found matching pattern '%s*.log'" % (filetag or args.store))
+        return 1
+
+    if not any(run['meanQ'] for run in runs):
+        print("Error: No .meanQ files found matching pattern '%s*.meanQ'" % (filetag or args.store))
+        # Continue as we still have the MLE result
+
+    with profiling.stage('select_K'):
+        best_K_mle, most_frequent_K = select_k(runs)
+
+    if best_K_mle is None:
+        print("Error: No marginal likelihoods were successfully extracted from log files.")
+        return 1
+
+    # --- Final Output ---
+
+    print("Model complexity that maximizes marginal likelihood = %d" % best_K_mle)
+    if most_frequent_K is not None:
+        print("Model components used to explain structure in data (modal bestK) = %d" % most_frequent_K)
+    else:
+        print("Cannot determine model components from .meanQ files as no data was parsed.")
+    return 0
@@ -0,0 +1,73 @@
+"""
+Single command-line entry point: python -m fstools <command> [options]
+(or just 'fstools <command>' once the package is installed).
+
+Only the module of the command being run is imported, so starting a command
+never loads another command's dependencies; pandas and matplotlib are only
+imported once a plot is drawn. Each command module provides
+add_arguments(parser) and run(args), which returns the exit status.
+"""
+import argparse
+import importlib
+import sys
+from collections import OrderedDict
+
+from fstools import profiling
+
+# name -> (module, one-line description)
+COMMANDS = OrderedDict([
+    ('choosek', ('fstools.choosek', "pick K by marginal likelihood and by modal K_phi_star")),
+    ('bootstrap', ('fstools.bootstrap', "bootstrap intervals for the best K by likelihood and the modal K_phi_star")),
+    ('metrics', ('fstools.metrics', "compile LLBO and K_phi_star for every K and replicate")),
+    ('plot', ('fstools.plotting', "admixture bar plots grouped by State/County or a metadata table")),
+    ('report', ('fstools.report', "one offline HTML page: likelihood curve, K_phi_star, convergence and zoomable admixture panels")),
+    ('groupstats', ('fstools.groupstats', "per-group mean, sd, quantiles and homogeneity of every component, for all K and runs")),
+    ('align', ('fstools.align', "permute the columns of every .meanQ so components match across K")),
+    ('modes', ('fstools.modes', "find which replicate runs of each K converged to the same solution")),
+    ('converge', ('fstools.convergence', "iterations, final delta and wall time of every run, and what other tolerances would cost")),
+    ('loci', ('fstools.perlocus', "per-locus allele-frequency divergence from the --full outputs, streamed in chunks")),
+    ('store', ('fstools.store', "pack every Q-matrix into one memory-mapped store for fast repeated reads")),
+    ('convert', ('fstools.convert', "stream a VCF or PLINK .tped into structure.py .str/.bed input, with locus filters")),
+    ('thin', ('fstools.thin', "write random or spaced locus subsets of a .str input for quick pilot sweeps")),
+    ('sweep', ('fstools.sweep', "run structure.py over a K x seed grid, on SLURM or locally, skipping finished runs")),
+    ('resources', ('fstools.resources', "runtime and peak memory of finished tasks, and per-K --mem/--time for the next sweep")),
+    ('synth', ('fstools.synthetic', "write synthetic fastStructure outputs for testing")),
+    ('bench', ('fstools.bench', "time each analysis stage on synthetic results of several sizes")),
+])
+
+
+def build_parser(command=None):
+    """
+    Returns the argument parser. Every command is listed, but only the
+    options of command (if given) are declared, which needs its module.
+    """
+    parser = argparse.ArgumentParser(prog='fstools', description="FastStructure output analysis tools.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for name, (module_name, description) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=description, description=description[0].upper() + description[1:] + '.')
+        if name == command:
+            module = importlib.import_module(module_name)
+            module.add_arguments(sub)
+            profiling.add_arguments(sub)
+            sub.set_defaults(run=module.run)
+    return parser
+
+
+def main(argv=None):
+    """
+    Parses argv (default: sys.argv[1:]), runs the command and returns its
+    exit status.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # The command is the first word that is not an option
+    command = next((arg for arg in argv if not arg.startswith('-')), None)
+    parser = build_parser(command if command in COMMANDS else None)
+    args = parser.parse_args(argv)
+    if getattr(args, 'run', None) is None:
+        parser.print_help()
+        return 2
+
+    profiling.enable_from_args(args)
+    status = args.run(args)
+    profiling.finish(args.profile_out)
+    return status
@@ -0,0 +1,214 @@
+"""
+The converge command: convergence traces of every run.
+
+Every .log is read once (memory-mapped, see logs.read_trace) into arrays of
+the logged iterations, likelihoods, deltas and iteration times. From these
+it reports, per K and replicate, the iterations to convergence, the final
+delta and the wall time, and per K the share of the total compute time.
+
+To help pick a convergence tolerance, it also replays each trace against
+looser (or tighter) tolerances: the iteration and time at which delta first
+fell below each one, how far the likelihood there was from the final value,
+and which K would have won by likelihood had every run stopped there.
+Tolerances tighter than the one the runs used are only reached by runs that
+happened to overshoot.
+
+All traces can be saved together as one .npz of flat arrays (one run after
+another, with offsets), for plotting or further analysis.
+"""
+import sys
+
+import numpy as np
+
+from fstools.ingest import resolve_jobs
+from fstools.logs import read_trace
+from fstools.profiling import stage
+
+DEFAULT_TOLERANCES = '1e-4,1e-5,1e-6'
+
+
+def _read_trace_task(path):
+    """
+    Pool worker: returns the Trace of path, or None (with a warning).
+    """
+    try:
+        return read_trace(path)
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write("Error: Could not read trace from %s: %s. Skipping.\n" % (path, e))
+        return None
+
+
+def read_traces(paths, jobs=1):
+    """
+    Reads the traces of paths, in order, on jobs processes (0 = one per CPU).
+    """
+    paths = list(paths)
+    jobs = min(resolve_jobs(jobs), len(paths))
+    with stage('read_traces'):
+        if jobs <= 1:
+            return [_read_trace_task(path) for path in paths]
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        try:
+            return pool.map(_read_trace_task, paths, max(1, len(paths) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+
+
+def _elapsed(trace):
+    """
+    Cumulative seconds after each logged iteration. Logs without iteration
+    times spread the total time evenly over the logged iterations.
+    """
+    if len(trace.seconds) and not np.isnan(trace.seconds).all():
+        return np.cumsum(np.nan_to_num(trace.seconds))
+    total = trace.total_time if trace.total_time is not None else np.nan
+    return total * np.arange(1, len(trace.iteration) + 1) / max(len(trace.iteration), 1)
+
+
+def summarize_trace(trace):
+    """
+    Returns the per-run summary of a Trace: iterations, final_delta,
+    wall_s, final_likelihood and converged (the log has its closing
+    likelihood line, i.e. the run finished).
+    """
+    if trace.total_iterations is not None:
+        iterations = trace.total_iterations
+    else:
+        iterations = int(trace.iteration[-1]) + 1 if len(trace.iteration) else 0
+    if trace.total_time is not None:
+        wall = trace.total_time
+    else:
+        wall = float(_elapsed(trace)[-1]) if len(trace.iteration) else np.nan
+    final = trace.final_likelihood
+    if final is None and len(trace.likelihood):
+        final = float(trace.likelihood[-1])
+    return {
+        'iterations': iterations,
+        'final_delta': float(trace.delta[-1]) if len(trace.delta) else np.nan,
+        'wall_s': wall,
+        'final_likelihood': final,
+        'converged': trace.final_likelihood is not None,
+    }
+
+
+def replay_tolerance(trace, tolerance):
+    """
+    Where the run would have stopped with this tolerance: returns
+    (iterations, seconds, likelihood) at the first logged iteration whose
+    delta is below tolerance, or None if it never got there.
+    """
+    below = np.flatnonzero(np.abs(trace.delta) < tolerance)
+    if below.size == 0:
+        return None
+    i = below[0]
+    return int(trace.iteration[i]) + 1, float(_elapsed(trace)[i]), float(trace.likelihood[i])
+
+
+def pack_traces(keys, traces):
+    """
+    Concatenates traces into flat arrays: 'K' and 'seed' per run, 'offsets'
+    (run r spans offsets[r]:offsets[r+1]), and 'iteration', 'likelihood',
+    'delta', 'seconds' for every logged iteration.
+    """
+    lengths = [len(trace.iteration) for trace in traces]
+    packed = {
+        'K': np.array([K for K, _ in keys], dtype=np.int64),
+        'seed': np.array([seed for _, seed in keys], dtype=np.int64),
+        'offsets': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+    }
+    for field in ('iteration', 'likelihood', 'delta', 'seconds'):
+        arrays = [getattr(trace, field) for trace in traces]
+        packed[field] = np.concatenate(arrays) if arrays else np.zeros(0)
+    return packed
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--tolerances', default=DEFAULT_TOLERANCES,
+                        help="comma-separated tolerances to replay the traces against (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--output', default='convergence.txt', help="per-run table to write (default: %(default)s)")
+    parser.add_argument('--traces', metavar='NPZ', help="also save every trace as flat arrays in this .npz file")
+
+
+def run(args):
+    from fstools.choosek import select_k
+    from fstools.ingest import discover_runs
+
+    try:
+        tolerances = [float(value) for value in args.tolerances.split(',')]
+    except ValueError:
+        print("Error: --tolerances takes numbers, e.g. --tolerances 1e-5,1e-6.")
+        return 1
+
+    runs = discover_runs(args.input, extensions=('log',))
+    keys = [key for key, run in runs.items() if run['log']]
+    if not keys:
+        print("Error: No log files found matching pattern '%s*.log'" % args.input)
+        return 1
+
+    traces = read_traces([runs[key]['log'] for key in keys], jobs=args.jobs)
+    readable = [(key, trace) for key, trace in zip(keys, traces) if trace is not None]
+    if not readable:
+        print("Error: None of the log files could be read.")
+        return 1
+    keys, traces = zip(*readable)
+    summaries = [summarize_trace(trace) for trace in traces]
+
+    # --- Per run ---
+
+    with open(args.output, 'w') as handle:
+        handle.write('K,Seed,Iterations,Final_Delta,Wall_Time_s,Final_LLBO,Converged\n')
+        for (K, seed), s in zip(keys, summaries):
+            handle.write('%d,%d,%d,%.6g,%.4f,%.10f,%d\n' % (
+                K, seed, s['iterations'], s['final_delta'], s['wall_s'],
+                np.nan if s['final_likelihood'] is None else s['final_likelihood'], s['converged']))
+
+    # --- Per K: where the compute time goes ---
+
+    Ks = np.array([K for K, _ in keys])
+    wall = np.array([s['wall_s'] for s in summaries], dtype=np.float64)
+    iterations = np.array([s['iterations'] for s in summaries], dtype=np.float64)
+    total = np.nansum(wall)
+    print('%4s %5s %10s %12s %12s %12s %7s' % ('K', 'runs', 'converged', 'mean iters', 'max delta',
+                                               'hours', 'share'))
+    for K in np.unique(Ks):
+        mask = Ks == K
+        hours = np.nansum(wall[mask]) / 3600.0
+        print('%4d %5d %10d %12.1f %12.3g %12.3f %6.1f%%' % (
+            K, mask.sum(), sum(summaries[i]['converged'] for i in np.flatnonzero(mask)),
+            iterations[mask].mean(), np.nanmax([summaries[i]['final_delta'] for i in np.flatnonzero(mask)]),
+            hours, 100.0 * np.nansum(wall[mask]) / total if total > 0 else 0.0))
+    print("Total: %.3f hours over %d runs" % (total / 3600.0, len(keys)))
+
+    # --- Replaying other tolerances ---
+
+    finished = [{'K': K, 'likelihood': s['final_likelihood'], 'k_phi_star': None}
+                for (K, _), s in zip(keys, summaries)]
+    actual_best = select_k(finished)[0]
+    print('\n%10s %8s %10s %8s %14s %7s' % ('tolerance', 'reached', 'hours', 'of now', 'max LL change', 'best K'))
+    for tolerance in tolerances:
+        replays = [replay_tolerance(trace, tolerance) for trace in traces]
+        reached = [i for i, replay in enumerate(replays) if replay is not None]
+        seconds = sum(replays[i][1] for i in reached)
+        # Runs that never reached the tolerance keep their actual time and result
+        seconds += np.nansum([wall[i] for i in range(len(traces)) if replays[i] is None])
+        gaps = [abs(summaries[i]['final_likelihood'] - replays[i][2]) for i in reached
+                if summaries[i]['final_likelihood'] is not None]
+        stopped = [{'K': keys[i][0], 'k_phi_star': None,
+                    'likelihood': replays[i][2] if replays[i] is not None else summaries[i]['final_likelihood']}
+                   for i in range(len(traces))]
+        best = select_k(stopped)[0]
+        print('%10.0e %4d/%-3d %10.3f %7.1f%% %14.3g %7s%s' % (
+            tolerance, len(reached), len(traces), seconds / 3600.0, 100.0 * seconds / total if total > 0 else 0.0,
+            max(gaps) if gaps else np.nan, best if best is not None else '-',
+            '' if best == actual_best else '  (now %s)' % actual_best))
+
+    print("\nPer-run convergence saved to %s" % args.output)
+    if args.traces:
+        with stage('save_traces'):
+            np.savez_compressed(args.traces, **pack_traces(keys, traces))
+        print("Traces saved to %s" % args.traces)
+    return 0
@@ -0,0 +1,396 @@
+"""
+The convert command: VCF or PLINK text genotypes to a structure.py input.
+
+Reads a VCF (plain or .gz) or a PLINK transposed text set (.tped + .tfam)
+and writes structure.py's --format=str or --format=bed input, with the
+sample-order file the plot label file has to follow.
+
+Both inputs list one locus per line, and the input is streamed in chunks
+of --chunk-loci loci. Each chunk is parsed into a loci x 2N array of allele
+codes (0 missing, 1 first allele, 2 second), filtered, and written out, so
+memory is bounded by the chunk size whatever the number of loci:
+
+    bed  is locus-major as well; each chunk is packed two bits per
+         genotype and appended to the .bed
+    str  is sample-major (two rows per sample, one column per locus), so
+         the kept chunks go to a temporary locus-major file of one byte per
+         allele, which is then transposed a block of output rows at a time
+         through a memory map, the block sized to fit --memory MB
+
+Only biallelic loci are kept. On the fly, --max-missing drops loci with
+more than that fraction of samples uncalled and --min-maf loci whose minor
+allele frequency is lower. Besides the genotypes, the output prefix gets
+
+    <prefix>.samples   sample IDs, one per line, in the row order of the
+                       .meanQ files structure.py will write
+    <prefix>.bim       the kept loci (chromosome, ID, position, alleles),
+                       also usable as 'fstools thin --positions'
+    <prefix>.fam       for bed output
+"""
+import gzip
+import os
+import sys
+
+import numpy as np
+
+from fstools.profiling import stage
+
+# Loci parsed and filtered at a time
+CHUNK_LOCI = 10000
+
+# Megabytes for the blocks of the .str transpose
+TRANSPOSE_MEMORY_MB = 256
+
+BED_MAGIC = b'\x6c\x1b\x01'
+
+SAMPLES_SUFFIX = '.samples'
+
+# VCF allele characters -> codes: '0' first allele, '1' second, anything else missing
+_VCF_CODES = np.zeros(256, dtype=np.int8)
+_VCF_CODES[ord('0')] = 1
+_VCF_CODES[ord('1')] = 2
+
+# Allele codes -> fixed-width .str tokens, so a whole row is one lookup
+_STR_TOKENS = np.frombuffer(b' -9  1  2', dtype=np.uint8).reshape(3, 3)
+
+# Copies of the second allele -> PLINK .bed genotype bits
+_BED_CODES = np.array([0b00, 0b10, 0b11], dtype=np.uint8)
+_BED_MISSING = 0b01
+
+# Bytes of a fixed-width 'a/b<tab>' genotype cell
+_TAB, _SLASH, _PIPE = ord('\t'), ord('/'), ord('|')
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def input_format(path):
+    """
+    'vcf' or 'tped' from the file name; raises ValueError otherwise.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.vcf'):
+        return 'vcf'
+    if name.endswith('.tped'):
+        return 'tped'
+    raise ValueError("%s is neither a .vcf(.gz) nor a .tped file" % path)
+
+
+def _vcf_alleles(rest, N, gt_index, fast):
+    """
+    Allele codes (2N int8) of one VCF record from its sample columns.
+    """
+    if fast:
+        # FORMAT is just GT and every call is 'a/b': N fixed-width 4-byte cells
+        # (the tab after the last one added)
+        cells = np.frombuffer(rest + b'\t', dtype=np.uint8)
+        if cells.size == 4 * N:
+            cells = cells.reshape(N, 4)
+            # Cells of other widths can add up to the same size ('0' and '0/1/1'),
+            # so the tabs and separators must sit where fixed-width cells put them
+            if (cells[:, 3] == _TAB).all() and ((cells[:, 1] == _SLASH) | (cells[:, 1] == _PIPE)).all():
+                return _VCF_CODES[cells[:, [0, 2]]].ravel()
+    # Other fields, haploid or odd calls: split every cell (haploid calls count as missing)
+    calls = [cell.split(b':')[gt_index][:3].ljust(3, b'.') for cell in rest.split(b'\t')]
+    if len(calls) != N:
+        raise ValueError("record has %d samples, the header %d" % (len(calls), N))
+    return _VCF_CODES[np.frombuffer(b''.join(calls), dtype=np.uint8).reshape(N, 3)[:, [0, 2]]].ravel()
+
+
+def read_vcf(path):
+    """
+    Streams a VCF. Returns (samples, records), records yielding
+    (chromosome, id, position, allele1, allele2, codes) for every biallelic
+    locus; a count of skipped multiallelic loci is kept in records.skipped.
+    """
+    handle = _open(path)
+    samples = None
+    for line in handle:
+        if line.startswith(b'##'):
+            continue
+        if line.startswith(b'#CHROM'):
+            fields = line.rstrip(b'\r\n').split(b'\t')
+            if len(fields) < 10 or fields[8] != b'FORMAT':
+                raise ValueError("%s has no sample columns" % path)
+            samples = [name.decode() for name in fields[9:]]
+            break
+    if samples is None:
+        handle.close()
+        raise ValueError("%s has no #CHROM header line" % path)
+    return samples, _VCFRecords(handle, path, len(samples))
+
+
+class _VCFRecords(object):
+    """Iterator over the loci of an open VCF (see read_vcf)."""
+
+    def __init__(self, handle, path, N):
+        self.handle = handle
+        self.path = path
+        self.N = N
+        self.skipped = 0
+
+    def __iter__(self):
+        N = self.N
+        with self.handle:
+            for number, line in enumerate(self.handle, 1):
+                chrom, pos, ident, ref, alt, _, _, _, fmt, rest = line.rstrip(b'\r\n').split(b'\t', 9)
+                if b',' in alt:
+                    self.skipped += 1
+                    continue
+                keys = fmt.split(b':')
+                if b'GT' not in keys:
+                    raise ValueError("%s record %d has no GT field" % (self.path, number))
+                try:
+                    codes = _vcf_alleles(rest, N, keys.index(b'GT'), fmt == b'GT')
+                except ValueError as e:
+                    raise ValueError("%s record %d: %s" % (self.path, number, e))
+                yield (chrom.decode(), ident.decode(), int(pos), ref.decode(), alt.decode() if alt != b'.' else '0',
+                       codes)
+
+
+def read_tped(path):
+    """
+    Streams a PLINK .tped with its .tfam, like read_vcf. Missing alleles
+    are '0' (or '-9'); the first and second allele of each locus are its
+    alleles in sorted order.
+    """
+    fam = os.path.splitext(path[:-3] if path.endswith('.gz') else path)[0] + '.tfam'
+    with open(fam, 'r') as handle:
+        samples = [line.split()[1] for line in handle if line.strip()]
+    return samples, _TPEDRecords(path, len(samples))
+
+
+class _TPEDRecords(object):
+    """Iterator over the loci of a .tped (see read_tped)."""
+
+    def __init__(self, path, N):
+        self.path = path
+        self.N = N
+        self.skipped = 0
+
+    def __iter__(self):
+        with _open(self.path) as handle:
+            for number, line in enumerate(handle, 1):
+                fields = line.split()
+                if not fields:
+                    continue
+                if len(fields) != 4 + 2 * self.N:
+                    raise ValueError("%s line %d has %d alleles, the .tfam lists %d samples"
+                                     % (self.path, number, len(fields) - 4, self.N))
+                tokens = np.array(fields[4:])
+                alleles = [a for a in np.unique(tokens).tolist() if a not in (b'0', b'-9')]
+                if len(alleles) > 2:
+                    self.skipped += 1
+                    continue
+                codes = np.zeros(len(tokens), dtype=np.int8)
+                for code, allele in enumerate(alleles, 1):
+                    codes[tokens == allele] = code
+                # Monomorphic (or uncalled) loci still need two allele names in the .bim
+                alleles += [b'0'] * (2 - len(alleles))
+                yield (fields[0].decode(), fields[1].decode(), int(fields[3]),
+                       alleles[0].decode(), alleles[1].decode(), codes)
+
+
+def filter_chunk(codes, max_missing=1.0, min_maf=0.0):
+    """
+    Boolean mask of the loci (rows of a loci x 2N code array) to keep: at
+    most max_missing of the samples uncalled, minor allele frequency at
+    least min_maf, and at least one called allele.
+    """
+    missing = ((codes[:, 0::2] == 0) | (codes[:, 1::2] == 0)).mean(axis=1)
+    called = (codes > 0).sum(axis=1)
+    second = (codes == 2).sum(axis=1)
+    frequency = np.divide(second, called, out=np.zeros(len(codes)), where=called > 0)
+    maf = np.minimum(frequency, 1.0 - frequency)
+    return (called > 0) & (missing <= max_missing) & (maf >= min_maf)
+
+
+def pack_bed(codes):
+    """
+    Packs a loci x 2N code array into .bed bytes: per locus, four samples
+    per byte, two bits each, low bits first.
+    """
+    first, second = codes[:, 0::2], codes[:, 1::2]
+    genotypes = _BED_CODES[(first == 2).astype(np.int8) + (second == 2)]
+    genotypes[(first == 0) | (second == 0)] = _BED_MISSING
+    N = genotypes.shape[1]
+    padded = np.zeros((len(codes), -(-N // 4) * 4), dtype=np.uint8)
+    padded[:, :N] = genotypes
+    quads = padded.reshape(len(codes), -1, 4)
+    return (quads[..., 0] | quads[..., 1] << 2 | quads[..., 2] << 4 | quads[..., 3] << 6).tobytes()
+
+
+def transpose_to_str(locus_path, L, samples, out_path, memory_mb=TRANSPOSE_MEMORY_MB):
+    """
+    Writes a .str file from a locus-major file of L x 2N allele codes,
+    reading it through a memory map one block of output rows at a time.
+    """
+    N2 = 2 * len(samples)
+    codes = np.memmap(locus_path, dtype=np.int8, mode='r', shape=(L, N2))
+    # The block, its tokens (3 bytes per allele) and slack
+    rows = max(1, min(N2, memory_mb * (1 << 20) // (5 * L)))
+    with open(out_path, 'wb') as handle:
+        for start in range(0, N2, rows):
+            with stage('transpose'):
+                block = np.ascontiguousarray(codes[:, start:start + rows].T)
+            with stage('write_str'):
+                text = _STR_TOKENS[block]
+                for i, row in enumerate(text):
+                    handle.write(('%s 0 0 0 0 0' % samples[(start + i) // 2]).encode())
+                    handle.write(row.tobytes())
+                    handle.write(b'\n')
+    del codes
+
+
+def convert(path, prefix, fmt='str', max_missing=1.0, min_maf=0.0, chunk_loci=CHUNK_LOCI,
+            memory_mb=TRANSPOSE_MEMORY_MB):
+    """
+    Converts a VCF/.tped to structure.py input at prefix.
+
+    Arguments:
+        path : str
+            .vcf, .vcf.gz or .tped (with its .tfam alongside)
+        prefix : str
+            output prefix, i.e. structure.py --input
+        fmt : str
+            'str' or 'bed'
+        max_missing : float
+            largest fraction of uncalled samples a kept locus may have
+        min_maf : float
+            smallest minor allele frequency a kept locus may have
+        chunk_loci : int
+            loci parsed and filtered at a time
+        memory_mb : int
+            memory for the blocks of the .str transpose
+
+    Returns a dict of counts: 'samples', 'loci_read', 'kept', 'multiallelic'.
+    Outputs are written under temporary names and renamed when complete.
+    """
+    reader = read_vcf if input_format(path) == 'vcf' else read_tped
+    samples, records = reader(path)
+    for sample in samples:
+        if not sample or any(c.isspace() for c in sample):
+            raise ValueError("sample ID %r cannot be written to a whitespace-separated file" % sample)
+
+    genotypes_path = prefix + ('.bed' if fmt == 'bed' else '.str')
+    # str: the locus-major allele codes, transposed at the end
+    staging = prefix + ('.bed.tmp' if fmt == 'bed' else '.codes.tmp')
+    counts = {'samples': len(samples), 'loci_read': 0, 'kept': 0}
+    written = [staging, prefix + '.bim.tmp']
+    try:
+        with open(staging, 'wb') as out, open(prefix + '.bim.tmp', 'w') as bim:
+            if fmt == 'bed':
+                out.write(BED_MAGIC)
+            chunk, loci = [], []
+
+            def flush():
+                with stage('filter'):
+                    codes = np.vstack(chunk)
+                    keep = filter_chunk(codes, max_missing, min_maf)
+                with stage('write_chunk'):
+                    out.write(pack_bed(codes[keep]) if fmt == 'bed' else codes[keep].tobytes())
+                    for locus in np.flatnonzero(keep):
+                        bim.write('%s\t%s\t0\t%d\t%s\t%s\n' % loci[locus])
+                counts['loci_read'] += len(chunk)
+                counts['kept'] += int(keep.sum())
+                del chunk[:], loci[:]
+
+            with stage('parse_input'):
+                for chrom, ident, pos, first, second, codes in records:
+                    chunk.append(codes)
+                    loci.append((chrom, ident if ident != '.' else '%s:%d' % (chrom, pos), pos, first, second))
+                    if len(chunk) >= chunk_loci:
+                        flush()
+                if chunk:
+                    flush()
+        counts['multiallelic'] = records.skipped
+        if counts['kept'] == 0:
+            raise ValueError("no loci passed the filters (%d read)" % counts['loci_read'])
+
+        if fmt == 'str':
+            written.append(genotypes_path + '.tmp')
+            transpose_to_str(staging, counts['kept'], samples, genotypes_path + '.tmp', memory_mb)
+            os.remove(staging)
+        else:
+            os.replace(staging, genotypes_path + '.tmp')
+            written.append(genotypes_path + '.tmp')
+            with open(prefix + '.fam.tmp', 'w') as fam:
+                written.append(prefix + '.fam.tmp')
+                for sample in samples:
+                    fam.write('%s\t%s\t0\t0\t0\t-9\n' % (sample, sample))
+    except BaseException:
+        for tmp in written:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+
+    with open(prefix + SAMPLES_SUFFIX, 'w') as handle:
+        handle.write('\n'.join(samples) + '\n')
+    # Genotypes last, as the sweep takes a run's input to be complete once it exists
+    os.replace(prefix + '.bim.tmp', prefix + '.bim')
+    if fmt == 'bed':
+        os.replace(prefix + '.fam.tmp', prefix + '.fam')
+    os.replace(genotypes_path + '.tmp', genotypes_path)
+    return counts
+
+
+def check_labels(samples, label_file):
+    """
+    Warns on stderr when a plot label file does not list the samples in
+    the order of the converted input.
+    """
+    with open(label_file, 'r') as handle:
+        labels = [line.strip() for line in handle if line.strip()]
+    if labels == samples:
+        return
+    if len(labels) != len(samples):
+        sys.stderr.write("Warning: %s has %d lines but the input has %d samples.\n"
+                         % (label_file, len(labels), len(samples)))
+    else:
+        i = next(i for i, (a, b) in enumerate(zip(labels, samples)) if a != b)
+        sys.stderr.write("Warning: %s differs from the sample order at line %d (%s vs %s); plot labels "
+                         "must follow the %s file.\n" % (label_file, i + 1, labels[i], samples[i], SAMPLES_SUFFIX))
+
+
+def add_arguments(parser):
+    parser.add_argument('source', help="input genotypes: .vcf, .vcf.gz or .tped (with its .tfam)")
+    parser.add_argument('--output', default='input_for_faststructure',
+                        help="output prefix, i.e. structure.py --input (default: %(default)s)")
+    parser.add_argument('--format', dest='fmt', default='str', choices=['str', 'bed'],
+                        help="structure.py --format to write (default: %(default)s)")
+    parser.add_argument('--max-missing', type=float, default=1.0,
+                        help="drop loci with more than this fraction of samples uncalled (default: keep all)")
+    parser.add_argument('--min-maf', type=float, default=0.0,
+                        help="drop loci with a lower minor allele frequency (default: keep all)")
+    parser.add_argument('--chunk-loci', type=int, default=CHUNK_LOCI,
+                        help="loci parsed at a time (default: %(default)s)")
+    parser.add_argument('--memory', type=int, default=TRANSPOSE_MEMORY_MB, metavar='MB',
+                        help="memory for the .str transpose blocks (default: %(default)s)")
+    parser.add_argument('--labels', help="plot label file to check against the sample order")
+
+
+def run(args):
+    if not 0 <= args.max_missing <= 1 or not 0 <= args.min_maf <= 0.5:
+        print("Error: --max-missing must be in [0, 1] and --min-maf in [0, 0.5].")
+        return 1
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        counts = convert(args.source, args.output, args.fmt, args.max_missing, args.min_maf,
+                         max(1, args.chunk_loci), max(1, args.memory))
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+
+    print("%d samples, %d loci read, %d kept%s"
+          % (counts['samples'], counts['loci_read'], counts['kept'],
+             ', %d multiallelic skipped' % counts['multiallelic'] if counts['multiallelic'] else ''))
+    print("Wrote %s.%s, %s.bim and the sample order in %s%s"
+          % (args.output, args.fmt, args.output, args.output, SAMPLES_SUFFIX))
+    if args.labels:
+        with open(args.output + SAMPLES_SUFFIX, 'r') as handle:
+            check_labels([line.strip() for line in handle if line.strip()], args.labels)
+    print("Run it with: python run_faststructure.py --data %s --format %s" % (args.output, args.fmt))
+    return 0
@@ -0,0 +1,190 @@
+"""
+Table-driven sample grouping and ordering for the admixture plots.
+
+Every sample gets one value per hierarchy level (e.g. state, county, site).
+Values come either from a metadata table (TSV with a 'sample' column plus
+one column per level) or, for label files like 'Sample2_Nebraska_Douglas',
+from a list of substring rules. Each level is turned into integer category
+codes, and the plotting order is a single np.lexsort over those codes, so
+there is no per-sample Python work and any number of levels is supported.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Group name given to samples that match no rule / are missing from the table
+OTHER = 'Other'
+
+# order:      permutation that puts samples in plotting order
+# codes:      N x D int array of category codes per level, in plotting order
+# categories: per level, the category names indexed by code
+# levels:     names of the D levels
+Grouping = namedtuple('Grouping', ['order', 'codes', 'categories', 'levels'])
+
+
+def read_metadata(path, levels=None):
+    """
+    Reads a metadata TSV with a header line. It must have a 'sample' column;
+    the other columns (or just those named in levels, in that order) are the
+    hierarchy levels, outermost first.
+
+    Returns (samples, table) where table is a DataFrame of level values.
+    """
+    meta = pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+    if 'sample' not in meta.columns:
+        raise ValueError("metadata file %s has no 'sample' column" % path)
+    if meta['sample'].duplicated().any():
+        dupes = meta.loc[meta['sample'].duplicated(), 'sample'].tolist()[:5]
+        raise ValueError("metadata file %s lists samples more than once: %s" % (path, ', '.join(dupes)))
+
+    if levels is None:
+        levels = [c for c in meta.columns if c != 'sample']
+    missing = [level for level in levels if level not in meta.columns]
+    if missing:
+        raise ValueError("metadata file %s has no column(s): %s" % (path, ', '.join(missing)))
+    if not levels:
+        raise ValueError("metadata file %s has no grouping columns besides 'sample'" % path)
+    return meta['sample'], meta[list(levels)]
+
+
+def groups_from_metadata(labels, samples, table):
+    """
+    Looks every label up in the metadata through a hash index and returns
+    the level values per label as a DataFrame of ordered Categoricals.
+    Categories are ordered by first appearance in the metadata table;
+    labels missing from it are put in an 'Other' group at the end.
+    """
+    rows = pd.Index(samples).get_indexer(labels)
+    found = rows >= 0
+
+    columns = {}
+    for i, level in enumerate(table.columns):
+        values = table[level].to_numpy(dtype=object)
+        categories = list(pd.unique(values))
+        filler = OTHER if i == 0 else ''
+        if not found.all() and filler not in categories:
+            categories.append(filler)
+        column = np.full(len(labels), filler, dtype=object)
+        column[found] = values[rows[found]]
+        columns[level] = pd.Categorical(column, categories=categories, ordered=True)
+    return pd.DataFrame(columns, columns=list(table.columns))
+
+
+def groups_from_label_rules(labels, rules, group_order, levels):
+    """
+    Assigns level values from substrings of the labels.
+
+    Arguments:
+        labels : sequence of str
+        rules : list of (substring, values)
+            checked in order; the first rule whose substring occurs in a
+            label gives its values (one per level)
+        group_order : list of tuples
+            plotting order of the value tuples; unlisted groups follow
+            in rule order, then 'Other'
+        levels : list of str
+            level names
+
+    Returns a DataFrame of ordered Categoricals, one column per level.
+    """
+    series = pd.Series(labels, dtype=object)
+    # One vectorized substring test per rule; np.select keeps the first match
+    matches = [series.str.contains(pattern, regex=False).to_numpy() for pattern, _ in rules]
+    choice = np.select(matches, np.arange(len(rules)), default=len(rules))
+
+    all_groups = [tuple(values) for _, values in rules] + [(OTHER,) + ('',) * (len(levels) - 1)]
+    ranked = list(group_order) + [g for g in all_groups if g not in group_order]
+
+    columns = {}
+    for d, level in enumerate(levels):
+        # Categories in the order they first appear in the ranked group list
+        categories = list(pd.unique(np.array([g[d] for g in ranked], dtype=object)))
+        values = np.array([g[d] for g in all_groups], dtype=object)[choice]
+        columns[level] = pd.Categorical(values, categories=categories, ordered=True)
+    return pd.DataFrame(columns, columns=list(levels))
+
+
+def sort_samples(labels, table):
+    """
+    Returns the Grouping for a level table: samples are ordered by each
+    level's category code (outermost first), then by label string.
+    """
+    codes = np.column_stack([table[level].cat.codes.to_numpy() for level in table.columns])
+    # np.lexsort sorts by the LAST key first
+    keys = [np.asarray(labels)] + [codes[:, d] for d in reversed(range(codes.shape[1]))]
+    order = np.lexsort(keys)
+    categories = [list(table[level].cat.categories) for level in table.columns]
+    return Grouping(order, codes[order], categories, list(table.columns))
+
+
+def group_segments(codes, depth):
+    """
+    Splits the sorted samples into runs that share the first depth levels.
+
+    Returns (starts, ends): index of the first sample of each run and one
+    past its last sample.
+    """
+    prefix = codes[:, :depth]
+    changed = np.any(prefix[1:] != prefix[:-1], axis=1)
+    starts = np.flatnonzero(np.r_[True, changed])
+    ends = np.r_[starts[1:], len(codes)]
+    return starts, ends
+
+
+# Within-group orders for order_within_groups; 'label' is the order sort_samples gives
+WITHIN_ORDERS = ('label', 'dominant', 'embedding')
+
+
+def order_within_groups(grouping, Q, method='dominant'):
+    """
+    Re-sorts the samples inside each finest-level group by their ancestry,
+    leaving the groups where they are. Returns a new Grouping; its codes
+    are unchanged, as only samples with equal codes trade places.
+
+    Methods:
+        dominant   by the sample's largest component, the group's most
+                   common components first, then by decreasing share of it
+        embedding  along the first principal axis of all rows of Q, a 1-D
+                   embedding that places samples with similar mixtures together
+        label      as sort_samples (grouping is returned as is)
+
+    Ties keep the label order. One np.lexsort over integer and float keys;
+    with column-aligned Q-matrices the order from one K can be reused for
+    every other K.
+    """
+    if method == 'label':
+        return grouping
+    if method not in WITHIN_ORDERS:
+        raise ValueError("unknown within-group order '%s' (choose from %s)" % (method, ', '.join(WITHIN_ORDERS)))
+    Q = np.asarray(Q, dtype=np.float64)
+    if len(Q) != len(grouping.order):
+        raise ValueError("Q-matrix has %d rows but %d samples are grouped" % (len(Q), len(grouping.order)))
+
+    # Everything below works in the current plotting order
+    Q = Q[grouping.order]
+    totals = Q.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1.0
+    Q = Q / totals
+    starts, ends = group_segments(grouping.codes, grouping.codes.shape[1])
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    rank = np.arange(len(Q))
+
+    if method == 'dominant':
+        dominant = Q.argmax(axis=1)
+        share = Q[rank, dominant]
+        # Rank of each component within its group by mean share (0 = most common)
+        means = np.add.reduceat(Q, starts, axis=0)
+        component_rank = np.argsort(np.argsort(-means, axis=1, kind='stable'), axis=1)
+        keys = [rank, -share, component_rank[group, dominant], group]
+    else:
+        centered = Q - Q.mean(axis=0)
+        # K x K covariance: cheap whatever N
+        _, vectors = np.linalg.eigh(np.dot(centered.T, centered))
+        axis = vectors[:, -1]
+        # Fix the sign, so the same data always runs the same way
+        axis = axis if axis[np.argmax(np.abs(axis))] > 0 else -axis
+        keys = [rank, np.dot(centered, axis), group]
+
+    within = np.lexsort(keys)
+    return grouping._replace(order=grouping.order[within])
@@ -0,0 +1,245 @@
+"""
+The groupstats command: ancestry summaries per sample group, for every K
+and replicate.
+
+Samples are grouped as in the plots (State/County label rules, or the
+levels of a metadata table). For each group, at each level of the
+hierarchy, and for each run and component this gives the mean, standard
+deviation and quantiles of the admixture proportions, and per group and
+run a homogeneity score: 1 minus the mean total variation distance
+between a sample's ancestry and the group mean (1 when every sample has
+the same ancestry, 0 when they share nothing).
+
+Everything is computed without a Python loop over groups or samples. The
+samples are put in group order once (the plots' lexsort), which makes every
+group a contiguous block of rows; the replicates of a K are laid side by
+side as columns, so one np.add.reduceat per statistic covers all groups
+and runs of that K. Quantiles come from a single np.sort of all columns,
+with each group's rows offset so that groups stay in place.
+
+The result is one tidy table, a row per (K, seed, level, group, component):
+
+    K,Seed,Level,Group,N,Component,Mean,SD,Q05,Q25,Median,Q75,Q95,Homogeneity
+
+Homogeneity is a property of the group and run, repeated on its K rows.
+The grouping and the table use pandas (the 'groups' extra).
+"""
+import sys
+
+import numpy as np
+
+from fstools.profiling import stage
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+QUANTILE_COLUMNS = ('Q05', 'Q25', 'Median', 'Q75', 'Q95')
+
+OUTPUT_FILENAME = 'group_summary.txt'
+
+
+def segment_quantiles(X, starts, ends, quantiles=QUANTILES):
+    """
+    Quantiles (linear interpolation, as np.quantile) of every column of X
+    within each block of rows starts[i]:ends[i]; the blocks must cover X
+    in order and its values lie in [0, 1]. Returns a
+    len(quantiles) x n_blocks x n_columns array.
+    """
+    block = np.repeat(np.arange(len(starts)), ends - starts)
+    # Offsetting each block by 2 keeps its values apart from the others', so one
+    # sort of every column sorts all blocks in place
+    offset = 2.0 * block[:, None]
+    ordered = np.sort(X + offset, axis=0) - offset
+    last = ends - starts - 1
+    result = np.empty((len(quantiles), len(starts), X.shape[1]))
+    for i, q in enumerate(quantiles):
+        position = starts + q * last
+        low = np.floor(position).astype(np.intp)
+        high = np.minimum(low + 1, ends - 1)
+        fraction = (position - low)[:, None]
+        result[i] = ordered[low] * (1.0 - fraction) + ordered[high] * fraction
+    return result
+
+
+def group_columns(stack, order):
+    """
+    Lays the runs of one K side by side in group order: returns the
+    N x (reps * K) array whose columns r*K .. r*K + K - 1 are run r, rows
+    normalized to sum to 1 per run.
+    """
+    reps, N, K = stack.shape
+    with stage('stack_columns'):
+        X = np.transpose(stack[:, order, :], (1, 0, 2)).astype(np.float64)
+        totals = X.sum(axis=2, keepdims=True)
+        totals[totals == 0] = 1.0
+        X /= totals
+    return X.reshape(N, reps * K)
+
+
+def summarize_groups(X, reps, starts, ends, quantiles=QUANTILES):
+    """
+    Per-group statistics of every run of one K.
+
+    Arguments:
+        X : array
+            the runs as columns, in group order (see group_columns)
+        reps : int
+            number of runs in X
+        starts, ends : arrays
+            first row and one past the last row of each group
+
+    Returns a dict of arrays, indexed [group, run, component] (homogeneity
+    [group, run]): 'mean', 'sd' (NaN for single-sample groups), 'quantiles'
+    (first axis per quantile) and 'homogeneity'; plus 'n' per group.
+    """
+    N = X.shape[0]
+    K = X.shape[1] // reps
+    n = ends - starts
+    with stage('reduceat'):
+        mean = np.add.reduceat(X, starts, axis=0) / n[:, None]
+        deviation = X - np.repeat(mean, n, axis=0)
+        squares = np.add.reduceat(deviation * deviation, starts, axis=0)
+        sd = np.sqrt(squares / np.maximum(n - 1, 1)[:, None])
+        sd[n < 2] = np.nan
+        # Total variation distance to the group mean, per sample and run
+        distance = 0.5 * np.abs(deviation).reshape(N, reps, K).sum(axis=2)
+        homogeneity = 1.0 - np.add.reduceat(distance, starts, axis=0) / n[:, None]
+    with stage('quantiles'):
+        q = segment_quantiles(X, starts, ends, quantiles)
+
+    shape = (len(starts), reps, K)
+    return {
+        'n': n,
+        'mean': mean.reshape(shape),
+        'sd': sd.reshape(shape),
+        'quantiles': q.reshape((len(quantiles),) + shape),
+        'homogeneity': homogeneity,
+    }
+
+
+def group_names(grouping, starts, depth):
+    """
+    'Nebraska/Douglas'-style names of the groups starting at starts, from
+    their first depth levels (empty level values left out).
+    """
+    names = []
+    for row in grouping.codes[starts, :depth]:
+        parts = [grouping.categories[d][code] for d, code in enumerate(row)]
+        names.append('/'.join(part for part in parts if part))
+    return names
+
+
+def tidy_rows(K, seeds, level, names, stats):
+    """
+    The summary of one K at one level as a DataFrame in the tidy layout
+    (see the module docstring), rows ordered by seed, group, component.
+    """
+    import pandas as pd
+
+    n_groups, reps, n_components = stats['mean'].shape
+    # Axes in output order: run, group, component
+    size = reps * n_groups * n_components
+    run = np.repeat(np.arange(reps), n_groups * n_components)
+    group = np.tile(np.repeat(np.arange(n_groups), n_components), reps)
+    component = np.tile(np.arange(n_components), reps * n_groups)
+
+    columns = {
+        'K': np.full(size, K),
+        'Seed': np.asarray(seeds)[run],
+        'Level': np.full(size, level, dtype=object),
+        'Group': np.asarray(names, dtype=object)[group],
+        'N': stats['n'][group],
+        'Component': component + 1,
+        'Mean': stats['mean'][group, run, component],
+        'SD': stats['sd'][group, run, component],
+    }
+    for name, values in zip(QUANTILE_COLUMNS, stats['quantiles']):
+        columns[name] = values[group, run, component]
+    columns['Homogeneity'] = stats['homogeneity'][group, run]
+    return pd.DataFrame(columns)
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--store', metavar='DIR', help="read Q-matrices (and sample IDs) from a results store")
+    parser.add_argument('--k', dest='k_range', help="K values to summarize (default: all)")
+    parser.add_argument('--label-file', default='name_and_state_county.txt',
+                        help="sample labels, one per line in .meanQ row order (default: %(default)s)")
+    parser.add_argument('--metadata', help="TSV with a 'sample' column and one column per grouping level "
+                                           "(default: the State/County label rules of the plots)")
+    parser.add_argument('--levels', help="comma-separated metadata columns to group by (default: all but 'sample')")
+    parser.add_argument('--output', default=OUTPUT_FILENAME, help="summary table to write (default: %(default)s)")
+
+
+def run(args):
+    # The grouping and the table need pandas; say so before any work is done
+    try:
+        import pandas
+    except ImportError:
+        print("Error: groupstats needs pandas for the sample grouping; install it with "
+              "'pip install pandas' (or 'pip install fstools[groups]').")
+        return 1
+
+    from fstools.groups import group_segments
+    from fstools.ingest import parse_k_range
+    from fstools.plotting import load_sample_order
+    from fstools.store import iter_stacks, open_store
+
+    store = None
+    if args.store:
+        try:
+            store = open_store(args.store)
+        except (IOError, OSError, ValueError) as e:
+            print("Error: Cannot open results store: %s" % e)
+            return 1
+    try:
+        Ks = parse_k_range(args.k_range) if args.k_range else None
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-10.")
+        return 1
+
+    try:
+        labels, grouping = load_sample_order(args.label_file, args.metadata,
+                                             args.levels.split(',') if args.levels else None,
+                                             labels=store.samples if store is not None else None)
+    except FileNotFoundError as e:
+        print("Error: File not found: %s" % e.filename)
+        return 1
+    except ValueError as e:
+        print("Error: %s" % e)
+        return 1
+
+    # Group blocks at every level, outermost first; the same for all K
+    segments = []
+    for depth in range(1, len(grouping.levels) + 1):
+        starts, ends = group_segments(grouping.codes, depth)
+        segments.append((grouping.levels[depth - 1], starts, ends, group_names(grouping, starts, depth)))
+
+    header = True
+    n_runs = 0
+    try:
+        with open(args.output, 'w') as handle:
+            for K, seeds, stack in iter_stacks(args.input, store, Ks):
+                if stack.shape[1] != len(labels):
+                    sys.stderr.write("Warning: K=%d has %d samples but there are %d labels. Skipping.\n"
+                                     % (K, stack.shape[1], len(labels)))
+                    continue
+                X = group_columns(stack, grouping.order)
+                for level, starts, ends, names in segments:
+                    stats = summarize_groups(X, len(seeds), starts, ends)
+                    with stage('write_table'):
+                        tidy_rows(K, seeds, level, names, stats).to_csv(handle, header=header, index=False,
+                                                                       float_format='%.6g')
+                    header = False
+                # The finest level: the least homogeneous group of the first run
+                h = stats['homogeneity'][:, 0]
+                print("K=%-3d %d run(s), %d groups; least homogeneous: %s (%.3f)"
+                      % (K, len(seeds), len(names), names[int(np.argmin(h))] or '(all)', h.min()))
+                n_runs += len(seeds)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+
+    if n_runs == 0:
+        print("Error: No runs to summarize.")
+        return 1
+    print("Group summaries of %d runs saved to %s" % (n_runs, args.output))
+    return 0
@@ -0,0 +1,165 @@
+"""
+Persistent, incremental index of parsed fastStructure outputs.
+
+The index is a small SQLite file in the results directory with one row per
+.log/.meanQ file: its name, size, mtime, K, seed and the parsed value (final
+likelihood or K_phi_star). On each call only files that are new or whose
+size/mtime changed are parsed again, so re-running chooseK after one more
+array task finished costs one stat per file plus one parse.
+"""
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+from fstools.ingest import PARSERS, discover_runs, ingest_runs, parse_by_kind, run_pattern
+from fstools.profiling import stage
+
+INDEX_FILENAME = '.fstools_index.sqlite'
+
+# Files modified more recently than this are assumed to be mid-write (the
+# min_age used by chooseK --watch)
+DEFAULT_SETTLE = 10.0
+
+# Bump when the table layout changes; older index files are then rebuilt
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name        TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    K           INTEGER NOT NULL,
+    seed        INTEGER NOT NULL,
+    likelihood  REAL,
+    k_phi_star  INTEGER
+)
+"""
+
+
+class ResultsIndex(object):
+    """
+    SQLite manifest of the outputs in one results directory.
+
+    Arguments:
+        results_dir : str
+            directory holding the .log/.meanQ files (and the index)
+    """
+
+    def __init__(self, results_dir):
+        self.results_dir = results_dir or '.'
+        self.path = os.path.join(self.results_dir, INDEX_FILENAME)
+        self.conn = sqlite3.connect(self.path)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS files')
+            self.conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _stored(self):
+        """
+        Returns {name: (size, mtime)} for every file in the index.
+        """
+        rows = self.conn.execute('SELECT name, size, mtime FROM files')
+        return dict((name, (size, mtime)) for name, size, mtime in rows)
+
+    def refresh(self, filetag, jobs=1, min_age=0):
+        """
+        Brings the index up to date with the files on disk for filetag and
+        returns the runs in the same form as fstools.ingest.ingest_runs.
+
+        Arguments:
+            filetag : str
+                output prefix, e.g. 'results/faststructure_K'
+            jobs : int
+                worker processes used to parse new or changed files
+            min_age : float
+                files modified less than this many seconds ago are treated
+                as still being written: they are not parsed and their path
+                is reported as None
+        """
+        runs = discover_runs(filetag)
+        stored = self._stored()
+        now = time.time()
+
+        # Work out which files are new or changed since the last refresh
+        stale, seen = [], set()
+        with stage('stat_files'):
+            for (K, seed), run in runs.items():
+                for kind in PARSERS:
+                    path = run.get(kind)
+                    if not path:
+                        continue
+                    name = os.path.basename(path)
+                    seen.add(name)
+                    st = os.stat(path)
+                    if min_age and now - st.st_mtime < min_age:
+                        run[kind] = None
+                        continue
+                    if stored.get(name) != (st.st_size, st.st_mtime):
+                        stale.append((name, kind, st.st_size, st.st_mtime, K, seed, path))
+
+        if stale:
+            values = parse_by_kind([(kind, path) for _, kind, _, _, _, _, path in stale], jobs)
+            rows = []
+            for (name, kind, size, mtime, K, seed, _), value in zip(stale, values):
+                rows.append((name, kind, size, mtime, K, seed,
+                             value if kind == 'log' else None,
+                             value if kind == 'meanQ' else None))
+            self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        # Drop rows for this tag's files that no longer exist. Ownership is
+        # decided by the same pattern that found the files, as another tag in
+        # the directory (faststructure_K_pilot) can share this one's prefix.
+        pattern = run_pattern(filetag)
+        gone = [(name,) for name in stored if pattern.match(name) and name not in seen]
+        if gone:
+            self.conn.executemany('DELETE FROM files WHERE name = ?', gone)
+        self.conn.commit()
+
+        return self._collect(runs)
+
+    def _collect(self, runs):
+        """
+        Fills likelihood / k_phi_star into each run from the index.
+        """
+        values = {}
+        for name, likelihood, k_phi_star in self.conn.execute('SELECT name, likelihood, k_phi_star FROM files'):
+            values[name] = (likelihood, k_phi_star)
+
+        results = OrderedDict()
+        for key, run in runs.items():
+            result = dict(run, likelihood=None, k_phi_star=None)
+            if run.get('log'):
+                result['likelihood'] = values.get(os.path.basename(run['log']), (None, None))[0]
+            if run.get('meanQ'):
+                result['k_phi_star'] = values.get(os.path.basename(run['meanQ']), (None, None))[1]
+            results[key] = result
+        return results
+
+
+def load_runs(filetag, jobs=1, use_index=True, min_age=0):
+    """
+    Returns every parsed run for filetag, keyed by (K, seed).
+
+    With use_index=True the results come from the SQLite index in the
+    results directory, parsing only new or changed files. If the index
+    cannot be opened or written (e.g. a read-only directory), every file is
+    parsed instead.
+    """
+    if use_index:
+        try:
+            index = ResultsIndex(os.path.dirname(filetag))
+            try:
+                return index.refresh(filetag, jobs=jobs, min_age=min_age)
+            finally:
+                index.close()
+        except sqlite3.Error as e:
+            sys.stderr.write("Warning: Results index unavailable (%s). Parsing all files.\n" % e)
+    return ingest_runs(discover_runs(filetag), jobs=jobs)
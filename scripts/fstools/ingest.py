@@ -0,0 +1,248 @@
+"""
+Discovery and parallel parsing of all fastStructure outputs for a file tag.
+
+Output files are named '<filetag><K>.<seed>.log' / '.meanQ'. Note that when
+structure.py is run directly it appends K itself (faststructure_K5.5.log), so
+for those runs the 'seed' is simply K again. Replicate sweeps keep that name
+for their first replicate and number the others around it (see
+replicate_run). Every run is identified by its (K, seed) pair.
+"""
+import glob
+import os
+import re
+import sys
+from collections import OrderedDict
+
+from fstools.logs import read_final_likelihood
+from fstools.profiling import stage
+
+# File kinds produced by a run that the analysis scripts care about
+RUN_EXTENSIONS = ('log', 'meanQ')
+
+
+def run_pattern(filetag):
+    """
+    Returns a compiled regex that matches output basenames for filetag and
+    captures K, seed and extension.
+    """
+    prefix = re.escape(os.path.basename(filetag))
+    return re.compile(r'^%s(\d+)\.(\d+)\.(%s)$' % (prefix, '|'.join(RUN_EXTENSIONS)))
+
+
+def parse_k_range(text):
+    """
+    Parses '5', '1-20' or '2,4,6-8' into a sorted list of K values.
+    Raises ValueError on anything else.
+    """
+    Ks = set()
+    for part in text.split(','):
+        if '-' in part:
+            start, end = part.split('-', 1)
+            Ks.update(range(int(start), int(end) + 1))
+        else:
+            Ks.add(int(part))
+    return sorted(Ks)
+
+
+def replicate_run(K, replicate):
+    """
+    Run number in the file names of replicate (1-based) of K.
+
+    Replicate 1 is the plain structure.py run (faststructure_K5.5), so an
+    existing single-run output counts as the first replicate. The others
+    take the remaining numbers in order, skipping K: for K=5 replicates
+    2, 3, ... are runs 1, 2, 3, 4, 6, 7, ... The mapping does not depend on
+    how many replicates are asked for, so a later, larger sweep finds the
+    earlier runs under the same names.
+    """
+    if replicate < 1:
+        raise ValueError("replicate numbers start at 1, got %d" % replicate)
+    if replicate == 1:
+        return K
+    return replicate - 1 if replicate - 1 < K else replicate
+
+
+def run_seeds(K, reps):
+    """
+    Run numbers used in the file names for replicates 1..reps of K, in
+    replicate order (see replicate_run).
+    """
+    return [replicate_run(K, replicate) for replicate in range(1, reps + 1)]
+
+
+def discover_runs(filetag, extensions=RUN_EXTENSIONS):
+    """
+    Finds every output file for filetag and groups them by run.
+
+    Returns an OrderedDict keyed by (K, seed), sorted by K then seed, whose
+    values are dicts with 'K', 'seed' and one path (or None) per extension.
+
+    Arguments:
+        filetag : str
+            output prefix, e.g. 'faststructure_K' or 'results/faststructure_K'
+        extensions : tuple
+            which file kinds to look for
+    """
+    pattern = run_pattern(filetag)
+    runs = {}
+    with stage('glob'):
+        for ext in extensions:
+            for path in glob.glob('%s*.%s' % (filetag, ext)):
+                match = pattern.match(os.path.basename(path))
+                if not match:
+                    sys.stderr.write("Warning: Could not read K and seed from filename: %s. Skipping.\n" % path)
+                    continue
+                K, seed = int(match.group(1)), int(match.group(2))
+                run = runs.setdefault((K, seed), dict([('K', K), ('seed', seed)] + [(e, None) for e in extensions]))
+                run[ext] = path
+
+    return OrderedDict((key, runs[key]) for key in sorted(runs))
+
+
+def best_run(runs):
+    """
+    The run to show for one K, from its run dicts ('seed', 'likelihood'):
+    the only run, else the one with the highest final likelihood (the
+    lowest seed on a tie). Raises ValueError if there are several runs and
+    none of them has a likelihood, rather than picking one at random.
+    """
+    runs = sorted(runs, key=lambda run: run['seed'])
+    if len(runs) == 1:
+        return runs[0]
+    scored = [run for run in runs if run.get('likelihood') is not None]
+    if not scored:
+        raise ValueError("K=%d has %d runs (seeds %s) but no final likelihood to choose between them; "
+                         "give a seed" % (runs[0]['K'], len(runs), ', '.join(str(run['seed']) for run in runs)))
+    return max(scored, key=lambda run: (run['likelihood'], -run['seed']))
+
+
+def parse_log_file(path):
+    """
+    Returns the final marginal likelihood in a single .log file, or None
+    (with a warning) if it is missing or cannot be read.
+    """
+    try:
+        final_mle = read_final_likelihood(path)
+    except IOError:
+        sys.stderr.write("Error: Could not open file: %s. Skipping.\n" % path)
+        return None
+    except ValueError:
+        sys.stderr.write("Error parsing likelihood in file: %s. Skipping.\n" % path)
+        return None
+
+    if final_mle is None:
+        sys.stderr.write("Warning: Could not find final Marginal Likelihood in file: %s. Skipping for MLE analysis.\n" % path)
+    return final_mle
+
+
+def parse_meanQ_file(path):
+    """
+    Returns K_phi_star for a single .meanQ file, or None (with a warning) if
+    it is empty or cannot be read.
+    """
+    # Imported here so commands answered from the results index never load NumPy
+    from fstools.qmatrix import k_phi_star, load_meanQ
+    try:
+        Q = load_meanQ(path)
+        if Q.size == 0:
+            sys.stderr.write("Warning: Empty or improperly formatted .meanQ file: %s. Skipping.\n" % path)
+            return None
+        return k_phi_star(Q)
+
+    except IOError:
+        sys.stderr.write("Error: Could not open file: %s. Skipping.\n" % path)
+    except Exception as e:
+        sys.stderr.write("Error processing .meanQ file %s: %s. Skipping.\n" % (path, e))
+    return None
+
+
+# Per-file parser for each output kind, the result field it fills in and the
+# --profile stage its files are parsed under
+PARSERS = {
+    'log': (parse_log_file, 'likelihood', 'parse_logs'),
+    'meanQ': (parse_meanQ_file, 'k_phi_star', 'parse_varQs'),
+}
+
+
+def _parse_task(task):
+    """
+    Pool worker: task is (kind, path); returns the parsed value.
+    """
+    kind, path = task
+    return PARSERS[kind][0](path)
+
+
+def resolve_jobs(jobs):
+    """
+    Turns a --jobs value into a worker count; 0 or None means one per CPU.
+    """
+    if not jobs:
+        return os.cpu_count()
+    return max(1, int(jobs))
+
+
+def map_files(tasks, jobs=1):
+    """
+    Parses (kind, path) tasks and returns the values in the same order.
+
+    With jobs > 1 the files are spread over a process pool; the result order
+    never depends on which worker finishes first.
+    """
+    tasks = list(tasks)
+    jobs = min(resolve_jobs(jobs), len(tasks))
+    if jobs <= 1:
+        return [_parse_task(task) for task in tasks]
+
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # Several small files per round trip keeps IPC overhead low
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        return pool.map(_parse_task, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parse_by_kind(tasks, jobs=1):
+    """
+    Same as map_files, but parses one file kind at a time so each kind is
+    timed as its own --profile stage ('parse_logs', 'parse_varQs').
+    """
+    tasks = list(tasks)
+    values = [None] * len(tasks)
+    for kind in sorted(set(kind for kind, _ in tasks)):
+        slots = [i for i, task in enumerate(tasks) if task[0] == kind]
+        with stage(PARSERS[kind][2]):
+            for i, value in zip(slots, map_files([tasks[i] for i in slots], jobs)):
+                values[i] = value
+    return values
+
+
+def ingest_runs(runs, jobs=1):
+    """
+    Parses every .log and .meanQ file of the given runs.
+
+    Returns an OrderedDict with the same (K, seed) keys and order as runs,
+    whose values are copies of the run dicts with 'likelihood' and
+    'k_phi_star' added (None where a file is missing or unreadable).
+
+    Arguments:
+        runs : OrderedDict
+            output of discover_runs
+        jobs : int
+            number of worker processes; 0 means one per CPU
+    """
+    tasks, slots = [], []
+    for key, run in runs.items():
+        for kind in PARSERS:
+            if run.get(kind):
+                tasks.append((kind, run[kind]))
+                slots.append((key, PARSERS[kind][1]))
+
+    results = OrderedDict()
+    for key, run in runs.items():
+        results[key] = dict(run, likelihood=None, k_phi_star=None)
+    for (key, field), value in zip(slots, parse_by_kind(tasks, jobs)):
+        results[key][field] = value
+    return results
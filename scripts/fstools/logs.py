@@ -0,0 +1,152 @@
+"""
+Readers for fastStructure .log files.
+"""
+import mmap
+import os
+import re
+from collections import namedtuple
+
+# The tag for the FINAL converged value. Per-iteration lines look like
+# 'Iteration=10, Marginal Likelihood=...' and never start with this tag.
+FINAL_LIKELIHOOD_TAG = 'Marginal Likelihood = '
+
+# fastStructure writes the final likelihood a couple of lines from the end of
+# the log, so a small block almost always reaches it in a single read.
+BLOCK_SIZE = 64 * 1024
+
+# How far back from the end we are willing to seek before giving up on the
+# tail and scanning the whole file forwards instead.
+MAX_TAIL_BYTES = 4 * 1024 * 1024
+
+# Every line read_trace cares about, in one alternation so the log is scanned
+# once: per-iteration lines (groups 1-4), then the final likelihood, total
+# time and total iterations lines (groups 5-7)
+TRACE_PATTERN = re.compile(
+    rb'^(?:Iteration=(\d+), Marginal Likelihood=([^,\s]+), delta=([^,\s]+)(?:, Iteration time=([^,\s]+))?'
+    rb'|Marginal Likelihood = (\S+)|Total time = (\S+)|Total iterations = (\d+))', re.M)
+
+# iteration, likelihood, delta, seconds: per logged iteration, as NumPy arrays
+#     (seconds is NaN where the log has no iteration time)
+# final_likelihood, total_time, total_iterations: the closing lines, or None
+Trace = namedtuple('Trace', ['iteration', 'likelihood', 'delta', 'seconds',
+                             'final_likelihood', 'total_time', 'total_iterations'])
+
+
+def _parse_final_line(line):
+    """
+    Returns the likelihood on a stripped line if it carries the final tag,
+    otherwise None. Raises ValueError if the value after '=' is malformed.
+    """
+    if line.startswith(FINAL_LIKELIHOOD_TAG):
+        return float(line.split('=')[1].strip())
+    return None
+
+
+def _scan_forward(handle):
+    """
+    Reads the whole file line by line and keeps the LAST final-likelihood
+    value, exactly like the original parse_logs loop.
+    """
+    handle.seek(0)
+    final_mle = None
+    for raw in handle:
+        value = _parse_final_line(raw.decode('utf-8', 'replace').strip())
+        if value is not None:
+            final_mle = value
+    return final_mle
+
+
+def _scan_backward(handle, size, block_size, max_tail_bytes):
+    """
+    Reads the file backwards in blocks and returns the value on the last
+    final-likelihood line. Returns None if the tag is not found within
+    max_tail_bytes of the end.
+    """
+    position = size
+    # Bytes of the (possibly incomplete) first line of the previous block
+    carry = b''
+    while position > 0 and size - position < max_tail_bytes:
+        step = min(block_size, position)
+        position -= step
+        handle.seek(position)
+        chunk = handle.read(step) + carry
+
+        lines = chunk.split(b'\n')
+        # Unless we are at the start of the file, the first piece may be the
+        # tail end of a line that started in an earlier block.
+        carry = lines.pop(0) if position > 0 else b''
+
+        for raw in reversed(lines):
+            value = _parse_final_line(raw.decode('utf-8', 'replace').strip())
+            if value is not None:
+                return value
+    return None
+
+
+def read_final_likelihood(path, block_size=BLOCK_SIZE, max_tail_bytes=MAX_TAIL_BYTES):
+    """
+    Returns the FINAL converged marginal likelihood recorded in a
+    fastStructure log, or None if the file has no final-likelihood line.
+
+    The file is read from the end in blocks and the search stops at the first
+    matching line, so the cost does not grow with the length of the
+    per-iteration trace. If the tag is not found near the end, the whole file
+    is scanned forwards so the result always matches a full read.
+
+    Arguments:
+        path : str
+            path to the .log file
+        block_size : int
+            number of bytes read per backward step
+        max_tail_bytes : int
+            how far from the end to search before falling back to a
+            forward scan
+
+    Raises IOError if the file cannot be opened and ValueError if the final
+    line does not hold a number.
+    """
+    with open(path, 'rb') as handle:
+        size = os.fstat(handle.fileno()).st_size
+        final_mle = _scan_backward(handle, size, block_size, max_tail_bytes)
+        if final_mle is None and size > max_tail_bytes:
+            final_mle = _scan_forward(handle)
+    return final_mle
+
+
+def read_trace(path):
+    """
+    Returns the convergence Trace of a fastStructure log.
+
+    The file is memory-mapped and matched against one regular expression
+    that covers every line kind, so it is scanned once and never decoded or
+    split into lines in Python.
+
+    Raises IOError if the file cannot be opened and ValueError if a
+    matched value is not a number.
+    """
+    import numpy as np
+
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            found = []
+        else:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                found = TRACE_PATTERN.findall(data)
+
+    rows = [match[:4] for match in found if match[0]]
+    if rows:
+        iteration = np.array([row[0] for row in rows], dtype=np.int64)
+        values = np.array([row[1:3] for row in rows], dtype=np.float64)
+        seconds = np.array([row[3] or 'nan' for row in rows], dtype=np.float64)
+    else:
+        iteration = np.zeros(0, dtype=np.int64)
+        values = np.zeros((0, 2))
+        seconds = np.zeros(0)
+
+    def last(group, convert):
+        # The closing lines should appear once; keep the last like the other readers
+        matched = [match[group] for match in found if match[group]]
+        return convert(matched[-1]) if matched else None
+
+    return Trace(iteration, values[:, 0], values[:, 1], seconds,
+                 last(4, float), last(5, float), last(6, int))
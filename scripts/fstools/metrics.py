@@ -0,0 +1,122 @@
+"""
+The metrics command: per-run and per-K LLBO and K_phi_star tables.
+
+Writes k_metrics_data.txt (one row per K, replicates aggregated) and
+k_metrics_runs.txt (one row per run) in the working directory.
+"""
+import sys
+
+import numpy as np
+
+from fstools import profiling
+from fstools.aggregate import format_kphi_counts, summarize_by_K
+from fstools.index import load_runs
+from fstools.ingest import parse_log_file, parse_meanQ_file
+
+
+def parse_logs(file):
+    """
+    Reads a single log file and returns the final converged Marginal Likelihood.
+    Returns None if not found.
+    """
+    return parse_log_file(file)
+
+
+def parse_varQs(file):
+    """
+    Reads a single meanQ file and returns the estimated bestK (K_phi_star).
+    Returns None if parsing fails.
+    """
+    return parse_meanQ_file(file)
+
+
+# --- Main Compilation Logic ---
+
+def compile_metrics(filetag="faststructure_K", jobs=1, use_index=True, store=None):
+    """
+    Parses every run of every K found for filetag and aggregates the
+    replicates of each K. With store (a store directory), the runs are read
+    from its manifest instead.
+
+    Returns (runs, summary): runs is an R x 4 array of [K, seed, LLBO,
+    K_phi_star] (NaN where a value is missing), one row per run sorted by
+    K then seed; summary is the per-K dict from fstools.aggregate.summarize_by_K.
+    """
+    # Every '<filetag><K>.<seed>.log/.meanQ' file is picked up, so any K range
+    # and any number of seeds per K work. Only new or changed files are parsed
+    # (over --jobs processes); the rest come from the results index.
+    if store:
+        from fstools.store import open_store
+        results = open_store(store).runs()
+    else:
+        results = load_runs(filetag, jobs=jobs, use_index=use_index)
+
+    for (K, seed), run in results.items():
+        if not run['log'] or not run['meanQ']:
+            missing = '.meanQ' if run['log'] else '.log'
+            sys.stderr.write(f"Warning: No {missing} file for K={K}, seed={seed}. Its other metric is still used.\n")
+
+    runs = list(results.values())
+    Ks = [r['K'] for r in runs]
+    llbos = [r['likelihood'] for r in runs]
+    k_phi_stars = [r['k_phi_star'] for r in runs]
+
+    run_table = np.array([[r['K'], r['seed'],
+                           np.nan if r['likelihood'] is None else r['likelihood'],
+                           np.nan if r['k_phi_star'] is None else r['k_phi_star']] for r in runs],
+                         dtype=np.float64).reshape(-1, 4)
+
+    # Replicate statistics are grouped reductions over these flat arrays
+    with profiling.stage('aggregate'):
+        summary = summarize_by_K(Ks, llbos, k_phi_stars)
+    return run_table, summary
+
+
+def write_summary(summary, path):
+    """
+    Writes the per-K summary as CSV. K_Phi_Star_Counts lists 'value:count'
+    pairs, e.g. '3:7;4:3' means seven runs with K_phi_star=3 and three with 4.
+    """
+    with open(path, 'w') as handle:
+        handle.write('K,N_Runs,LLBO_Mean,LLBO_SD,LLBO_Min,LLBO_Max,K_Phi_Star_Mode,K_Phi_Star_Counts\n')
+        for i, K in enumerate(summary['K']):
+            handle.write('%d,%d,%.6f,%.6f,%.6f,%.6f,%d,%s\n' % (
+                K, summary['n_runs'][i], summary['ll_mean'][i], summary['ll_sd'][i],
+                summary['ll_min'][i], summary['ll_max'][i], summary['kphi_mode'][i],
+                format_kphi_counts(summary['kphi_counts'][i])))
+
+
+def add_arguments(parser):
+    # The filetag is 'faststructure_K' based on your analysis
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--no-index', dest='use_index', action='store_false',
+                        help="re-parse every file instead of using the results index")
+    parser.add_argument('--store', metavar='DIR', help="read the runs from a results store ('fstools store')")
+
+
+def run(args):
+    try:
+        run_table, summary = compile_metrics(filetag=args.input, jobs=args.jobs, use_index=args.use_index,
+                                             store=args.store)
+    except (IOError, OSError, ValueError) as e:
+        # Only a results store given with --store can fail to open
+        print("Error: Cannot open results store: %s" % e)
+        return 1
+
+    if run_table.size == 0:
+        print("Error: No runs found matching '%s<K>.<seed>.log/.meanQ'." % args.input)
+        return 1
+
+    with profiling.stage('write_output'):
+        # Save the compiled metrics to files for easy plotting: one row per K ...
+        write_summary(summary, 'k_metrics_data.txt')
+
+        # ... and one row per run, for anyone who wants the raw replicates
+        np.savetxt('k_metrics_runs.txt', run_table, fmt='%d,%d,%.6f,%.0f',
+                   header='K,Seed,LLBO_Value,K_Phi_Star', delimiter=',')
+
+    print("Metrics for %d K values (%d runs) compiled and saved to k_metrics_data.txt"
+          % (len(summary['K']), len(run_table)))
+    print("Per-run values saved to k_metrics_runs.txt")
+    return 0
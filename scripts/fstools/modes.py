@@ -0,0 +1,182 @@
+"""
+Replicate mode detection.
+
+Replicates of the same K can converge to different solutions ("modes").
+All replicates of a K are label-aligned to a reference run and stacked into
+a reps x N x K array. Their pairwise similarity then comes from one Gram
+matrix product over the flattened replicates (a single BLAS call, no
+per-pair loop). Replicates are grouped into modes by linking every pair
+whose similarity reaches a threshold.
+
+Similarity is the CLUMPP-style G' = 1 - ||Qa - Qb||_F / sqrt(2N), which is
+1 for identical matrices and 0 for maximally different ones.
+"""
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from fstools.align import match_columns
+from fstools.profiling import stage
+from fstools.qmatrix import load_meanQ, normalize_rows
+
+# Pairs at or above this similarity are put in the same mode
+DEFAULT_THRESHOLD = 0.9
+
+# size:           number of replicates in the mode
+# members:        indices (into the stacked replicates) of its runs
+# representative: index of the member most similar to the rest of the mode
+# mean_similarity: mean pairwise similarity within the mode (1.0 if alone)
+Mode = namedtuple('Mode', ['size', 'members', 'representative', 'mean_similarity'])
+
+
+def stack_replicates(paths, reference=0, dtype=np.float32):
+    """
+    Loads the .meanQ files in paths, aligns every one to paths[reference]
+    and returns them as a reps x N x K array (rows normalized).
+
+    Raises ValueError if the matrices do not all have the same shape.
+    """
+    ref = normalize_rows(load_meanQ(paths[reference]))
+    stack = np.empty((len(paths),) + ref.shape, dtype=dtype)
+    for i, path in enumerate(paths):
+        Q = ref if i == reference else normalize_rows(load_meanQ(path))
+        if Q.shape != ref.shape:
+            raise ValueError("%s has shape %s, expected %s like %s"
+                             % (path, Q.shape, ref.shape, paths[reference]))
+        stack[i] = Q if i == reference else Q[:, match_columns(ref, Q)]
+    return stack
+
+
+def pairwise_similarity(stack):
+    """
+    Returns the reps x reps G' similarity matrix of a reps x N x K stack.
+
+    Squared distances come from the Gram matrix of the flattened
+    replicates, ||a||^2 + ||b||^2 - 2 a.b, so the heavy lifting is one
+    matrix product.
+    """
+    reps, N = stack.shape[0], stack.shape[1]
+    X = stack.reshape(reps, -1)
+    gram = np.dot(X, X.T).astype(np.float64)
+    sq = np.diag(gram)
+    dist2 = np.maximum(sq[:, None] + sq[None, :] - 2.0 * gram, 0.0)
+    S = 1.0 - np.sqrt(dist2) / np.sqrt(2.0 * N)
+    np.fill_diagonal(S, 1.0)
+    return S
+
+
+def cluster_modes(S, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups replicates into modes: the connected components of the graph
+    linking pairs with similarity >= threshold.
+
+    Returns (labels, modes): the mode index of each replicate, and the
+    list of Mode tuples sorted by decreasing size.
+    """
+    reps = S.shape[0]
+    linked = S >= threshold
+    labels = np.arange(reps)
+    # Propagate the smallest index through each component
+    while True:
+        new = np.min(np.where(linked, labels[None, :], reps), axis=1)
+        if np.array_equal(new, labels):
+            break
+        labels = new
+
+    modes = []
+    for root in np.unique(labels):
+        members = np.flatnonzero(labels == root)
+        block = S[np.ix_(members, members)]
+        if members.size > 1:
+            # Mean similarity to the other members, excluding self
+            to_others = (block.sum(1) - 1.0) / (members.size - 1)
+            mean_similarity = (block.sum() - members.size) / (members.size * (members.size - 1))
+        else:
+            to_others = np.ones(1)
+            mean_similarity = 1.0
+        representative = int(members[np.argmax(to_others)])
+        modes.append(Mode(int(members.size), members, representative, float(mean_similarity)))
+
+    modes.sort(key=lambda m: (-m.size, m.members[0]))
+    # Relabel so mode 0 is the largest
+    relabel = np.empty(reps, dtype=np.intp)
+    for i, mode in enumerate(modes):
+        relabel[mode.members] = i
+    return relabel, modes
+
+
+def find_modes(runs, threshold=DEFAULT_THRESHOLD):
+    """
+    Detects the replicate modes among the runs of one K.
+
+    Arguments:
+        runs : list of dict
+            run dicts of ONE K (with 'meanQ', 'seed' and 'likelihood')
+        threshold : float
+            similarity needed to link two replicates
+
+    Returns (runs, S, labels, modes) with runs in stacking order. The
+    best-likelihood run is the alignment reference.
+    """
+    runs = [run for run in runs if run.get('meanQ')]
+    ref = max(range(len(runs)), key=lambda i: (runs[i].get('likelihood') is not None,
+                                               runs[i].get('likelihood') or 0.0, -runs[i]['seed']))
+    with stage('stack_replicates'):
+        stack = stack_replicates([run['meanQ'] for run in runs], reference=ref)
+    with stage('pairwise_similarity'):
+        S = pairwise_similarity(stack)
+    with stage('cluster_modes'):
+        labels, modes = cluster_modes(S, threshold)
+    return runs, S, labels, modes
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="G' similarity at which two replicates share a mode (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--output', default='replicate_modes.txt', help="mode table to write (default: %(default)s)")
+
+
+def run(args):
+    """
+    The modes command: prints the modes of every K and writes them as CSV.
+    """
+    from fstools.index import load_runs
+
+    runs = load_runs(args.input, jobs=args.jobs)
+    by_K = {}
+    for (K, seed), run in runs.items():
+        if run['meanQ']:
+            by_K.setdefault(K, []).append(run)
+
+    if not by_K:
+        print("Error: No .meanQ files found matching '%s<K>.<seed>.meanQ'." % args.input)
+        return 1
+
+    rows = []
+    print('%3s %5s %6s  mode sizes (representative seed)' % ('K', 'reps', 'modes'))
+    for K in sorted(by_K):
+        try:
+            stacked, S, labels, modes = find_modes(by_K[K], threshold=args.threshold)
+        except ValueError as e:
+            sys.stderr.write("Warning: K=%d skipped: %s\n" % (K, e))
+            continue
+
+        sizes = ', '.join('%d (%d)' % (m.size, stacked[m.representative]['seed']) for m in modes)
+        print('%3d %5d %6d  %s' % (K, len(stacked), len(modes), sizes))
+        for i, mode in enumerate(modes):
+            rep = stacked[mode.representative]
+            likelihoods = [stacked[j]['likelihood'] for j in mode.members if stacked[j]['likelihood'] is not None]
+            rows.append((K, i, mode.size, rep['seed'], os.path.basename(rep['meanQ']), mode.mean_similarity,
+                         max(likelihoods) if likelihoods else float('nan'),
+                         ';'.join(str(stacked[j]['seed']) for j in mode.members)))
+
+    with open(args.output, 'w') as handle:
+        handle.write('K,Mode,Size,Representative_Seed,Representative_File,Mean_Similarity,Best_LLBO,Seeds\n')
+        for row in rows:
+            handle.write('%d,%d,%d,%d,%s,%.6f,%.6f,%s\n' % row)
+    print("Mode table saved to %s" % args.output)
+    return 0
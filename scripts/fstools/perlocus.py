@@ -0,0 +1,343 @@
+"""
+Streaming readers for the --full outputs and per-locus statistics.
+
+structure.py --full writes, next to the .meanQ, three more matrices:
+
+    .meanP   L x K   posterior mean allele frequency of each locus in each component
+    .varP    L x 2K  Beta posterior parameters of those frequencies, the K
+                     'a' values followed by the K 'b' values
+    .varQ    N x K   Dirichlet posterior parameters of the admixture proportions
+
+With hundreds of thousands of loci the per-locus files do not fit in
+memory as Python objects, so they are read in fixed-size row chunks
+(iter_chunks) and every statistic here is accumulated one chunk at a time.
+Memory stays at a few chunks plus O(K x top) for the ranked loci, whatever L.
+
+Per-locus divergence follows Fst: with component weights w (the mean
+ancestry of each component in the run's .meanQ) and the weighted mean
+frequency pbar = sum_k w_k p_k, component k contributes
+d_k = (p_k - pbar)^2 / (pbar (1 - pbar)) and the locus Fst is sum_k w_k d_k.
+Loci with the largest d_k are the ones that most set component k apart.
+"""
+import itertools
+import os
+import sys
+import warnings
+
+import numpy as np
+
+from fstools.profiling import stage
+
+# Rows parsed per chunk; a K=10 .varP chunk is then about 8 MB in float64
+CHUNK_ROWS = 50000
+
+# Most differentiating loci kept per component
+DEFAULT_TOP = 20
+
+# Fill value of locus_statistics' zip when one of .meanP/.varP ends first
+_EXHAUSTED = object()
+
+
+def iter_chunks(path, chunk_rows=CHUNK_ROWS, dtype=np.float64, n_cols=None):
+    """
+    Yields (start_row, block) for a whitespace-separated numeric matrix
+    file, block holding up to chunk_rows rows. Blank lines are skipped.
+
+    Arguments:
+        path : str
+            path to a .meanP, .varP, .varQ or .meanQ file
+        chunk_rows : int
+            rows per block
+        dtype : numpy dtype
+            float64, or float32 to halve the memory of each block
+        n_cols : int or None
+            expected number of columns (default: taken from the first line)
+
+    Raises ValueError if a chunk is ragged, has the wrong number of columns
+    or holds non-numeric values.
+    """
+    start = 0
+    with open(path, 'rb') as handle:
+        lines = (line for line in handle if line.strip())
+        while True:
+            block = list(itertools.islice(lines, chunk_rows))
+            if not block:
+                return
+            if n_cols is None:
+                n_cols = len(block[0].split())
+            with stage('read_chunks'), warnings.catch_warnings():
+                # One vectorized parse per chunk, as in qmatrix.parse_meanQ_text;
+                # NumPy only warns when it stops early on malformed text
+                warnings.simplefilter('error')
+                try:
+                    values = np.fromstring(b''.join(block), dtype=dtype, sep=' ')
+                except (ValueError, DeprecationWarning):
+                    raise ValueError("non-numeric value in %s after row %d" % (path, start))
+            if values.size != len(block) * n_cols:
+                raise ValueError("%s rows %d-%d do not all have %d columns"
+                                 % (path, start + 1, start + len(block), n_cols))
+            yield start, values.reshape(len(block), n_cols)
+            start += len(block)
+
+
+def divergence(P, weights):
+    """
+    Returns (D, fst) for a chunk of allele frequencies: D is the n x K
+    per-component divergence d_k and fst the per-locus weighted sum.
+    Monomorphic loci (pbar of 0 or 1) get 0.
+    """
+    P = P.astype(np.float64, copy=False)
+    pbar = np.dot(P, weights)
+    het = pbar * (1.0 - pbar)
+    scale = np.divide(1.0, het, out=np.zeros_like(het), where=het > 0)
+    D = (P - pbar[:, None]) ** 2 * scale[:, None]
+    return D, np.dot(D, weights)
+
+
+def beta_sd(varP):
+    """
+    Posterior standard deviation of each component's allele frequency from
+    a chunk of .varP rows (K 'a' columns then K 'b' columns).
+    """
+    K = varP.shape[1] // 2
+    a = varP[:, :K].astype(np.float64, copy=False)
+    b = varP[:, K:].astype(np.float64, copy=False)
+    total = a + b
+    return np.sqrt(a * b / (total * total * (total + 1.0)))
+
+
+class TopLoci(object):
+    """
+    Keeps the `top` largest values per column over a stream of n x K
+    chunks, with their row numbers, in O(K x top) memory.
+    """
+
+    def __init__(self, K, top=DEFAULT_TOP):
+        self.top = top
+        self.values = np.full((K, 0), -np.inf)
+        self.rows = np.zeros((K, 0), dtype=np.int64)
+
+    def update(self, start, D):
+        values = np.concatenate([self.values, D.T], axis=1)
+        rows = np.concatenate([self.rows, np.broadcast_to(np.arange(start, start + len(D)), D.T.shape)], axis=1)
+        if values.shape[1] > self.top:
+            keep = np.argpartition(-values, self.top - 1, axis=1)[:, :self.top]
+            values = np.take_along_axis(values, keep, axis=1)
+            rows = np.take_along_axis(rows, keep, axis=1)
+        self.values, self.rows = values, rows
+
+    def result(self):
+        """
+        (values, rows), each K x top, sorted by decreasing value per column.
+        """
+        order = np.argsort(-self.values, axis=1, kind='stable')
+        return np.take_along_axis(self.values, order, axis=1), np.take_along_axis(self.rows, order, axis=1)
+
+
+def locus_statistics(prefix, weights=None, perm=None, chunk_rows=CHUNK_ROWS, dtype=np.float64,
+                     top=DEFAULT_TOP, per_locus=None):
+    """
+    Streams the .meanP (and .varP, if present) of one run and returns its
+    per-locus summary.
+
+    Arguments:
+        prefix : str
+            run prefix, e.g. 'faststructure_K5.5'
+        weights : array or None
+            component weights (default: equal)
+        perm : list or None
+            column order to apply (the cluster alignment of the run)
+        chunk_rows : int
+            rows read per chunk
+        dtype : numpy dtype
+            dtype the chunks are parsed into (float32 halves their memory)
+        top : int
+            most differentiating loci kept per component
+        per_locus : file-like or None
+            if given, one CSV row per locus is streamed to it:
+            Locus,Fst,D_1..D_K,SD_1..SD_K (SD columns only with a .varP)
+
+    Returns a dict with 'L', 'K', 'fst_mean', 'fst_max', 'fst_max_locus' and
+    per component 'divergence_mean', 'sd_mean' (None without .varP) and
+    'top_values'/'top_loci' (1-based locus numbers, K x top).
+    """
+    meanP_path = prefix + '.meanP'
+    varP_path = prefix + '.varP'
+    has_varP = os.path.exists(varP_path)
+
+    meanP_chunks = iter_chunks(meanP_path, chunk_rows, dtype)
+    if has_varP:
+        varP_chunks = (block for _, block in iter_chunks(varP_path, chunk_rows, dtype))
+        # Either file running out first is an error, not the end of the loci
+        chunks = itertools.zip_longest(meanP_chunks, varP_chunks, fillvalue=_EXHAUSTED)
+    else:
+        chunks = zip(meanP_chunks, itertools.repeat(None))
+
+    tracker = None
+    L = 0
+    fst_sum = 0.0
+    fst_max, fst_max_locus = -np.inf, None
+    d_sum = sd_sum = None
+    for meanP_chunk, varP_block in chunks:
+        if meanP_chunk is _EXHAUSTED:
+            raise ValueError("%s has more rows than %s" % (varP_path, meanP_path))
+        if varP_block is _EXHAUSTED:
+            raise ValueError("%s has fewer rows than %s" % (varP_path, meanP_path))
+        start, P = meanP_chunk
+        K = P.shape[1]
+        if tracker is None:
+            tracker = TopLoci(K, top)
+            d_sum = np.zeros(K)
+            sd_sum = np.zeros(K)
+            if weights is None:
+                weights = np.full(K, 1.0 / K)
+            if per_locus is not None:
+                header = ['Locus', 'Fst'] + ['D_%d' % (k + 1) for k in range(K)]
+                if has_varP:
+                    header += ['SD_%d' % (k + 1) for k in range(K)]
+                per_locus.write(','.join(header) + '\n')
+        if perm is not None:
+            P = P[:, perm]
+        with stage('locus_stats'):
+            D, fst = divergence(P, weights)
+            tracker.update(start, D)
+            d_sum += D.sum(axis=0)
+            fst_sum += fst.sum()
+            i = int(np.argmax(fst))
+            if fst[i] > fst_max:
+                fst_max, fst_max_locus = float(fst[i]), start + i + 1
+            sd = None
+            if varP_block is not None:
+                if varP_block.shape != (len(P), 2 * K):
+                    raise ValueError("%s does not match %s (expected %d rows of %d columns per chunk)"
+                                     % (varP_path, meanP_path, len(P), 2 * K))
+                if perm is not None:
+                    varP_block = varP_block[:, list(perm) + [K + j for j in perm]]
+                sd = beta_sd(varP_block)
+                sd_sum += sd.sum(axis=0)
+        if per_locus is not None:
+            columns = [np.arange(start + 1, start + len(P) + 1), fst, D] + ([sd] if sd is not None else [])
+            np.savetxt(per_locus, np.column_stack(columns),
+                       fmt=['%d', '%.6g'] + ['%.6g'] * (D.shape[1] * (2 if sd is not None else 1)), delimiter=',')
+        L += len(P)
+
+    if tracker is None:
+        raise ValueError("%s is empty" % meanP_path)
+
+    top_values, top_rows = tracker.result()
+    return {
+        'L': L,
+        'K': len(d_sum),
+        'fst_mean': fst_sum / L,
+        'fst_max': fst_max,
+        'fst_max_locus': fst_max_locus,
+        'divergence_mean': d_sum / L,
+        'sd_mean': sd_sum / L if has_varP else None,
+        'top_values': top_values,
+        'top_loci': top_rows + 1,
+    }
+
+
+def varQ_sd(path, chunk_rows=CHUNK_ROWS, dtype=np.float64):
+    """
+    Mean posterior standard deviation of each admixture proportion, from
+    the Dirichlet parameters in a .varQ file, read in chunks.
+    """
+    total = None
+    N = 0
+    for start, A in iter_chunks(path, chunk_rows, dtype):
+        A = A.astype(np.float64, copy=False)
+        a0 = A.sum(axis=1, keepdims=True)
+        sd = np.sqrt(A * (a0 - A) / (a0 * a0 * (a0 + 1.0)))
+        total = sd.sum(axis=0) if total is None else total + sd.sum(axis=0)
+        N += len(A)
+    return total / N if N else None
+
+
+def component_weights(meanQ_path, perm=None):
+    """
+    Mean ancestry of each component in a run (normalized .meanQ column
+    means), used to weight the allele-frequency divergence.
+    """
+    from fstools.qmatrix import load_meanQ, normalize_rows
+    weights = normalize_rows(load_meanQ(meanQ_path)).mean(axis=0)
+    if perm is not None:
+        weights = weights[perm]
+    return weights / weights.sum()
+
+
+def write_top_loci(path, K, stats):
+    """
+    Writes the most differentiating loci as a tidy CSV:
+    K,Component,Rank,Locus,Divergence.
+    """
+    with open(path, 'w') as handle:
+        handle.write('K,Component,Rank,Locus,Divergence\n')
+        for k in range(stats['K']):
+            for rank, (locus, value) in enumerate(zip(stats['top_loci'][k], stats['top_values'][k]), 1):
+                if np.isfinite(value):
+                    handle.write('%d,%d,%d,%d,%.6g\n' % (K, k + 1, rank, locus, value))
+
+
+def add_arguments(parser):
+    parser.add_argument('K', type=int, help="K of the run to summarize")
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--seed', type=int, help="run number in the file name (default: K)")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help="most differentiating loci listed per component (default: %(default)s)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows read at a time (default: %(default)s)")
+    parser.add_argument('--float32', action='store_true', help="parse chunks as float32 to halve their memory")
+    parser.add_argument('--per-locus', metavar='CSV', help="also write every locus's Fst and divergences here")
+    parser.add_argument('--output', help="top-loci table (default: top_loci_K<K>.txt)")
+
+
+def run(args):
+    """
+    The loci command: per-locus divergence of one run, streamed from its
+    --full outputs.
+    """
+    from fstools.align import alignment_perm
+
+    seed = args.K if args.seed is None else args.seed
+    prefix = '%s%d.%d' % (args.input, args.K, seed)
+    if not os.path.exists(prefix + '.meanP'):
+        print("Error: %s.meanP not found; per-locus outputs need structure.py --full." % prefix)
+        return 1
+
+    weights = perm = None
+    if os.path.exists(prefix + '.meanQ'):
+        perm = alignment_perm(prefix + '.meanQ')
+        weights = component_weights(prefix + '.meanQ', perm)
+    else:
+        sys.stderr.write("Warning: %s.meanQ not found; components are weighted equally.\n" % prefix)
+
+    dtype = np.float32 if args.float32 else np.float64
+    per_locus = open(args.per_locus, 'w') if args.per_locus else None
+    try:
+        stats = locus_statistics(prefix, weights, perm, chunk_rows=args.chunk_rows, dtype=dtype,
+                                 top=args.top, per_locus=per_locus)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+    finally:
+        if per_locus is not None:
+            per_locus.close()
+
+    sd_Q = varQ_sd(prefix + '.varQ', args.chunk_rows, dtype) if os.path.exists(prefix + '.varQ') else None
+
+    print("%s: %d loci, K=%d%s" % (prefix, stats['L'], stats['K'], ' (aligned columns)' if perm is not None else ''))
+    print("Mean Fst %.4f; highest %.4f at locus %d" % (stats['fst_mean'], stats['fst_max'], stats['fst_max_locus']))
+    print('%9s %8s %10s %9s %9s  top loci' % ('component', 'weight', 'mean d_k', 'sd(P)', 'sd(Q)'))
+    for k in range(stats['K']):
+        print('%9d %8.3f %10.4f %9s %9s  %s' % (
+            k + 1, weights[k] if weights is not None else 1.0 / stats['K'], stats['divergence_mean'][k],
+            '%.4f' % stats['sd_mean'][k] if stats['sd_mean'] is not None else '-',
+            '%.4f' % sd_Q[k] if sd_Q is not None else '-',
+            ' '.join(str(locus) for locus in stats['top_loci'][k][:5])))
+
+    output = args.output or 'top_loci_K%d.txt' % args.K
+    write_top_loci(output, args.K, stats)
+    print("Top %d loci per component saved to %s" % (args.top, output))
+    if args.per_locus:
+        print("Per-locus values saved to %s" % args.per_locus)
+    return 0
@@ -0,0 +1,463 @@
+"""
+The plot command: admixture bar plots grouped by State/County (or by any
+hierarchy from a metadata table), one PDF per K.
+
+matplotlib and pandas are only imported once a plot is actually drawn, so
+'plot --help' and argument errors return immediately.
+"""
+import os
+
+from fstools import profiling
+from fstools.align import load_aligned_meanQ
+from fstools.ingest import best_run, discover_runs, parse_k_range, parse_log_file
+from fstools.render import (MAX_SAMPLE_LABELS, RASTER_DPI, RASTER_THRESHOLD,
+                            draw_admixture, set_sample_labels)
+
+# File names
+label_file = "name_and_state_county.txt"
+filetag = "faststructure_K"
+
+
+# ----------------------------------------------------------------------
+# --- Grouping and Sorting Data (FINAL COUNTY ORDER) ---
+# ----------------------------------------------------------------------
+
+# Default grouping for label files like 'Sample2_Nebraska_Douglas', used when no
+# --metadata table is given. Rules are checked in order; the first substring
+# found in a label assigns its (State, County). Unmatched labels go to 'Other'.
+LEVELS = ['State', 'County']
+LABEL_RULES = [
+    ('Iowa', ('Iowa', '')),
+    ('Kansas', ('Kansas', '')),
+    ('Sarpy', ('Nebraska', 'Sarpy')),
+    ('Dodge', ('Nebraska', 'Dodge')),
+    ('Douglas', ('Nebraska', 'Douglas')),
+    ('Thurston', ('Nebraska', 'Thurston')),
+]
+
+# GROUP_ORDER: Iowa -> NE Counties (Thurston, Dodge, Douglas, Sarpy) -> Kansas -> Other
+GROUP_ORDER = [
+    ('Iowa', ''),
+    ('Nebraska', 'Thurston'),
+    ('Nebraska', 'Dodge'),
+    ('Nebraska', 'Douglas'),
+    ('Nebraska', 'Sarpy'),
+    ('Kansas', ''),
+]
+
+
+def load_sample_order(label_file, metadata_file=None, levels=None, labels=None):
+    """
+    Reads the sample labels and works out the plotting order: by each
+    grouping level (outermost first), then by label. This only depends on the
+    label and metadata files, so batch mode does it once for all K.
+    Labels given directly (e.g. the sample IDs of a results store) are used
+    instead of reading label_file.
+
+    Returns (labels, grouping): labels in file order and the
+    fstools.groups.Grouping holding the row order and sorted level codes.
+    """
+    if labels is None:
+        with profiling.stage('read_labels'):
+            labels = [line.strip() for line in open(label_file)]
+
+    # pandas is only needed from here on
+    from fstools.groups import groups_from_label_rules, groups_from_metadata, read_metadata, sort_samples
+
+    with profiling.stage('group_sort'):
+        if metadata_file:
+            # Join on the 'sample' column; any number of levels
+            samples, table = read_metadata(metadata_file, levels)
+            level_table = groups_from_metadata(labels, samples, table)
+        else:
+            level_table = groups_from_label_rules(labels, LABEL_RULES, GROUP_ORDER, LEVELS)
+        grouping = sort_samples(labels, level_table)
+
+    return labels, grouping
+
+
+def draw_group_labels(ax, grouping):
+    """
+    Draws separators between the finest groups and one row of labels per
+    grouping level above the plot, outermost level on top. Empty level
+    values (e.g. the County of a state-only group) get no label.
+    Returns the height of the top label row, in axes coordinates.
+    """
+    from fstools.groups import group_segments
+
+    n_levels = len(grouping.levels)
+    top_y = 1.08 + 0.07 * (n_levels - 1)
+
+    # A. Draw the separation lines between the finest groups
+    starts, _ = group_segments(grouping.codes, n_levels)
+    for start in starts[1:]:
+        ax.axvline(x=start - 0.5, color='black', linestyle='-', linewidth=2.5, zorder=2)
+
+    # B. One row of labels per level, centred on each run of equal values
+    for depth in range(n_levels):
+        starts, ends = group_segments(grouping.codes, depth + 1)
+        names = grouping.categories[depth]
+        centers = (starts + ends - 1) / 2
+        for center, code in zip(centers, grouping.codes[starts, depth]):
+            name = names[code]
+            if not name:
+                continue
+            ax.text(
+                center,
+                top_y - 0.07 * depth, # Outermost level highest
+                name.replace('_', ' '),
+                ha='center',
+                va='bottom',
+                fontsize=11 if depth == 0 else 8,
+                fontweight='bold',
+                transform=ax.get_xaxis_transform()
+            )
+    return top_y
+
+
+# ----------------------------------------------------------------------
+# --- Plotting one K ---
+# ----------------------------------------------------------------------
+
+
+def _pyplot():
+    """
+    Imports pyplot on first use, with the non-interactive Agg backend.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def meanQ_path(K, seed):
+    """
+    Name of the .meanQ file of run seed of K. structure.py appends K to the
+    output prefix, so a plain run of K=5 is 'faststructure_K5.5.meanQ'.
+    """
+    # 🚨 CORRECTED INPUT FILE NAME FOR FASTSTRUCTURE
+    return f"{filetag}{K}.{seed}.meanQ"
+
+
+# Results stores opened in this process, by directory
+_stores = {}
+
+
+def _store(path, check=False):
+    if path not in _stores:
+        from fstools.store import open_store
+        _stores[path] = open_store(path, check=check)
+    return _stores[path]
+
+
+def plot_k(K, labels, grouping, render='auto', label_mode='auto', seed=None, store=None, order='label'):
+    """
+    Reads the Q-matrix for K, puts it in the shared County/State order and
+    saves the grouped admixture plot. Returns the output PDF name.
+    seed picks the run; by default it is the one select_seeds picks.
+    With store (a store directory) the Q-matrix is a slice of its memory map
+    instead of a .meanQ file. order other than 'label' re-sorts the samples
+    inside each group by this K's ancestry (see groups.order_within_groups).
+    Raises ValueError with a readable message if the input is unusable.
+    """
+    if seed is None:
+        seeds, errors = select_seeds([K], store=store)
+        if K in errors:
+            raise ValueError(errors[K])
+        seed = seeds[K]
+    input_file = meanQ_path(K, seed) if store is None else f"{store} (K={K}, seed={seed})"
+    output_pdf = f"Admixture_County_Order_K{K}.pdf"
+
+    # --- 1. Read Q-matrix from .meanQ file ---
+    print(f"Reading Q-matrix from: {input_file} (K={K}).")
+
+    try:
+        # Read the Q-matrix (faststructure output is a simple space-separated matrix).
+        # Later runs reuse the memory-mapped .npy sidecar written on first read, and
+        # columns follow cluster_alignment.json (align_clusters.py) when it exists.
+        with profiling.stage('read_meanQ'):
+            Q = load_aligned_meanQ(input_file) if store is None else _store(store).Q(K, seed)
+    except FileNotFoundError:
+        raise ValueError(f"Input file not found: {input_file}")
+    except KeyError:
+        raise ValueError(f"Run not found in the store: {input_file}")
+    except Exception as e:
+        raise ValueError(f"Error reading Q-matrix: {e}")
+
+    # Validate that the number of columns matches K
+    if Q.shape[1] != K:
+        raise ValueError(f"Expected {K} columns in Q-matrix but found {Q.shape[1]}. Check K value or file integrity.")
+
+    print(f"Successfully read Q-data for {len(Q)} samples.")
+
+    # --- 2. Validate against the labels ---
+    if len(labels) != len(Q):
+        raise ValueError(f"# of labels ({len(labels)}) does not match # of samples in Q-matrix ({len(Q)}). Cannot plot.")
+
+    if order != 'label':
+        from fstools.groups import order_within_groups
+        with profiling.stage('within_order'):
+            grouping = order_within_groups(grouping, Q, order)
+
+    # Reorder the Q-matrix and labels into the shared group order
+    with profiling.stage('reorder'):
+        Q = Q[grouping.order]
+        labels = [labels[i] for i in grouping.order]
+
+    # ----------------------------------------------------------------------
+    # --- 3. Plotting the Stacked Bars (Multi-Level Labeling) ---
+    # ----------------------------------------------------------------------
+
+    # 1. Setup Figure
+    plt = _pyplot()
+    # Aligned columns keep their colour across K; tab20 once tab10 runs out
+    custom_colors = (plt.cm.tab10.colors if K <= 10 else plt.cm.tab20.colors)[:K]
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # 2. Plot Bars: one filled polygon per component (rasterized for large N)
+    with profiling.stage('draw_bars'):
+        draw_admixture(ax, Q, custom_colors, mode=render)
+
+    # 3. Add Group Separation Lines and Multi-Layered Group Labels
+    with profiling.stage('draw_labels'):
+        top_y = draw_group_labels(ax, grouping)
+
+        # 5. Axis Configuration
+        # Use smaller font size for dense sample labels; thinned for large cohorts
+        set_sample_labels(ax, labels, mode=label_mode, rotation=90, fontsize=4, ha='right')
+
+    ax.set_ylabel("Ancestry Proportion", fontsize=10)
+    ax.set_xlabel(f"Samples (Sorted by {'/'.join(reversed(grouping.levels))})", fontsize=10)
+    ax.set_title(f"Admixture Plot (K={K}) - Grouped by {'/'.join(reversed(grouping.levels))}", fontsize=12, y=top_y + 0.10)
+    ax.set_xlim(-0.5, len(Q) - 0.5)
+    ax.set_ylim(0, 1.0)
+    ax.set_yticks([0, 0.25, 0.5, 0.75, 1.0])
+    ax.tick_params(axis='y', labelsize=8)
+
+    # Adjust bottom margin to ensure rotated labels fit
+    plt.subplots_adjust(bottom=0.25)
+
+    with profiling.stage('savefig'):
+        plt.savefig(output_pdf, bbox_inches="tight", dpi=RASTER_DPI)
+    plt.close(fig)
+    return output_pdf
+
+
+# ----------------------------------------------------------------------
+# --- Batch mode: one process per K, sample order shared ---
+# ----------------------------------------------------------------------
+
+# Set once per worker process by _init_worker, so the sorted order is
+# pickled once per worker rather than once per K
+_shared = {}
+
+
+def _init_worker(labels, grouping, options, seeds, profile=False):
+    _shared.update(labels=labels, grouping=grouping, options=options, seeds=seeds)
+    if profile:
+        profiling.enable()
+
+
+def _plot_worker(K):
+    """
+    Worker entry point: returns (K, output_pdf, error_message, stages), where
+    stages are this call's --profile records (empty when not profiling).
+    """
+    try:
+        with profiling.stage('plot'):
+            output_pdf = plot_k(K, _shared['labels'], _shared['grouping'], seed=_shared['seeds'][K],
+                                **_shared['options'])
+        return K, output_pdf, None, profiling.PROFILER.snapshot()
+    except ValueError as e:
+        return K, None, str(e), profiling.PROFILER.snapshot()
+
+
+def _runs_by_k(store=None):
+    """
+    {K: [run dicts]} of every .meanQ in the current directory (or in store),
+    with 'seed' and 'likelihood'. Likelihoods are only read from the logs
+    of K values with more than one run.
+    """
+    if store is not None:
+        runs = {}
+        for run in _store(store).runs().values():
+            runs.setdefault(run['K'], []).append(run)
+        return runs
+
+    runs = {}
+    for run in discover_runs(filetag).values():
+        if run['meanQ']:
+            runs.setdefault(run['K'], []).append(dict(run, likelihood=None))
+    for K_runs in runs.values():
+        if len(K_runs) > 1:
+            for run in K_runs:
+                run['likelihood'] = parse_log_file(run['log']) if run['log'] else None
+    return runs
+
+
+def select_seeds(Ks=None, seed=None, store=None):
+    """
+    Picks the run plotted for each K: the given seed, else the run with the
+    best final likelihood (the only run, if there is one; see
+    ingest.best_run). Ks defaults to every K with a .meanQ file (or in
+    store); with a seed, only the K values that have that run.
+
+    Returns ({K: seed}, {K: error message}) for the K values that have a
+    run to plot and those that do not.
+    """
+    runs = _runs_by_k(store)
+    if Ks is None:
+        Ks = sorted(K for K in runs if seed is None or any(run['seed'] == seed for run in runs[K]))
+    where = store if store is not None else 'this directory'
+    seeds, errors = {}, {}
+    for K in Ks:
+        if K not in runs:
+            errors[K] = f"No run of K={K} found in {where}."
+        elif seed is not None:
+            if any(run['seed'] == seed for run in runs[K]):
+                seeds[K] = seed
+            else:
+                errors[K] = f"No run K={K}, seed={seed} in {where}."
+        else:
+            try:
+                seeds[K] = best_run(runs[K])['seed']
+            except ValueError as e:
+                errors[K] = str(e)
+    return seeds, errors
+
+
+def add_arguments(parser):
+    parser.add_argument('K', type=int, nargs='?', help="K value to plot")
+    parser.add_argument('--k', dest='k_range', help="plot several K in one go, e.g. '1-20' or '2,4,6-8'")
+    parser.add_argument('--all', action='store_true', help="plot every K with a .meanQ file in this directory")
+    parser.add_argument('--seed', type=int, help="run number in the file name, faststructure_K<K>.<seed>.meanQ "
+                                                "(default: the run of each K with the best final likelihood)")
+    parser.add_argument('--jobs', type=int, default=0, help="worker processes for batch mode, 0 = all CPUs (default: 0)")
+    parser.add_argument('--label-file', default=label_file,
+                        help="sample labels, one per line in .meanQ row order (default: %(default)s)")
+    parser.add_argument('--metadata', help="TSV with a 'sample' column (matching the label file) and one "
+                                           "column per grouping level, outermost first; replaces the "
+                                           "built-in State/County label rules")
+    parser.add_argument('--levels', help="comma-separated metadata columns to group by (default: all but 'sample')")
+    parser.add_argument('--render', choices=['auto', 'vector', 'raster'], default='auto',
+                        help="draw bars as vector polygons or as a rasterized layer; "
+                             f"'auto' rasterizes above {RASTER_THRESHOLD} samples (default: auto)")
+    parser.add_argument('--labels', choices=['auto', 'all', 'thin', 'none'], default='auto',
+                        help="per-sample x labels: every sample, at most "
+                             f"{MAX_SAMPLE_LABELS} evenly spaced, or none (default: auto)")
+    parser.add_argument('--order', choices=['label', 'dominant', 'embedding'],
+                        help="sample order within each group: by label, by dominant component and its share, "
+                             "or along the main axis of ancestry variation (default: label, or dominant "
+                             "with --order-k)")
+    parser.add_argument('--order-k', type=int, metavar='K',
+                        help="take the within-group order from this K's Q-matrix and use it for every K, "
+                             "so samples keep their place across plots (needs aligned columns)")
+    parser.add_argument('--store', metavar='DIR', help="read Q-matrices (and sample IDs, if it has them) from a "
+                                                       "results store ('fstools store') instead of .meanQ files")
+
+
+def run(args):
+    # --order-k fixes an ancestry order, which the per-label order does not have
+    order = args.order
+    if args.order_k is not None:
+        if order == 'label':
+            print("Error: --order-k needs --order dominant or --order embedding.")
+            return 2
+        order = order or 'dominant'
+    order = order or 'label'
+
+    if args.store:
+        # Opened (and checked for changed sources) once here; workers reuse or reopen it
+        try:
+            _store(args.store, check=True)
+        except (IOError, OSError, ValueError) as e:
+            print(f"Error: Cannot open results store: {e}")
+            return 1
+
+    try:
+        if args.all:
+            Ks = None
+        elif args.k_range:
+            Ks = parse_k_range(args.k_range)
+        elif args.K is not None:
+            Ks = [args.K]
+        else:
+            print("Error: give a K value, --k <range> or --all.")
+            return 2
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-20.")
+        return 1
+
+    # One run per K, chosen here so every worker plots the same one
+    seeds, errors = select_seeds(Ks, args.seed, args.store)
+    for K, error in sorted(errors.items()):
+        print(f"Error (K={K}): {error}")
+    if not seeds:
+        if not errors:
+            print(f"Error: No {filetag}<K>.<seed>.meanQ files found"
+                  f"{'' if args.seed is None else f' for seed {args.seed}'} in this directory.")
+        return 1
+    Ks = sorted(seeds)
+    for K in Ks:
+        if args.seed is None:
+            print(f"K={K}: plotting run {seeds[K]}.")
+
+    # ----------------------------------------------------------------------
+    # --- Read Labels and compute the group order (once for all K) ---
+    # ----------------------------------------------------------------------
+    print("Grouping and sorting samples...")
+    try:
+        # A store's sample IDs take the place of the label file
+        stored = _store(args.store).samples if args.store else None
+        labels, grouping = load_sample_order(args.label_file, args.metadata,
+                                             args.levels.split(',') if args.levels else None, labels=stored)
+    except FileNotFoundError as e:
+        print(f"Error: File not found: {e.filename}")
+        return 1
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Successfully grouped and reordered {len(labels)} samples by {', '.join(grouping.levels)}.")
+
+    if order != 'label' and args.order_k is not None:
+        # One order for every K, computed here once and shipped to the workers with the grouping
+        from fstools.groups import order_within_groups
+        try:
+            order_seeds, order_errors = select_seeds([args.order_k], args.seed, args.store)
+            if order_errors:
+                raise ValueError(order_errors[args.order_k])
+            order_seed = order_seeds[args.order_k]
+            with profiling.stage('within_order'):
+                Q = load_aligned_meanQ(meanQ_path(args.order_k, order_seed)) if args.store is None \
+                    else _store(args.store).Q(args.order_k, order_seed)
+                grouping = order_within_groups(grouping, Q, order)
+        except (IOError, OSError, KeyError, ValueError) as e:
+            print(f"Error: Cannot take the sample order from K={args.order_k}: {e}")
+            return 1
+        print(f"Samples ordered within groups by {order} at K={args.order_k}, for every K.")
+        order = 'label'
+
+    options = {'render': args.render, 'label_mode': args.labels, 'store': args.store, 'order': order}
+
+    failed = len(errors)
+    if len(Ks) == 1:
+        _shared.update(labels=labels, grouping=grouping, options=options, seeds=seeds)
+        results = [_plot_worker(Ks[0])]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        jobs = min(args.jobs or os.cpu_count(), len(Ks))
+        print(f"Plotting {len(Ks)} K values on {jobs} worker processes.")
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(labels, grouping, options, seeds, profiling.is_enabled())) as pool:
+            results = list(pool.map(_plot_worker, Ks))
+
+    for K, output_pdf, error, stages in results:
+        # Stage times from the workers add up (CPU time across processes)
+        profiling.PROFILER.merge(stages)
+        if error:
+            print(f"Error (K={K}): {error}")
+            failed += 1
+        else:
+            print(f"✅ Labeled and Grouped Plot saved to {output_pdf}")
+
+    return 1 if failed else 0
@@ -0,0 +1,317 @@
+"""
+Per-stage timing and memory instrumentation (the --profile flag).
+
+Library code marks its expensive steps with
+
+    with stage('parse_logs'):
+        ...
+
+and a script turns recording on with enable() when --profile is given.
+While disabled, stage() hands back one shared no-op context manager, so
+instrumented code pays a single attribute check per stage.
+
+When enabled, every stage records its call count, wall and CPU time, and
+its peak resident set size (RSS). RSS is read from /proc/self/statm by a
+background thread every few milliseconds, so short spikes inside a stage
+are caught too; elsewhere only the process high-water mark
+(ru_maxrss) is available. Nested stages are reported as 'outer/inner'.
+Worker processes keep their own records; snapshot() and merge() carry
+them back to the parent.
+
+report() prints the breakdown. dump() writes it as JSON, or the cProfile
+statistics (readable with pstats or snakeviz) when enable(cprofile=True)
+was used.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+_clock = time.perf_counter
+
+# Seconds between RSS samples while profiling
+SAMPLE_INTERVAL = 0.005
+
+_STATM = '/proc/self/statm'
+
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, or None where
+    /proc/self/statm does not exist.
+    """
+    try:
+        with open(_STATM, 'r') as handle:
+            pages = int(handle.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss(children=False):
+    """
+    Peak RSS in bytes of this process (or of its finished child processes,
+    e.g. pool workers), or None without the resource module.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux reports kilobytes, macOS bytes
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class _NullStage(object):
+    """Context manager that does nothing; returned while profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """Context manager that records one call of a named stage."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler._stack.append(self.name)
+        self.path = '/'.join(profiler._stack)
+        # The sampler raises _peak; keep the enclosing stage's value aside
+        self.outer_peak = profiler._peak
+        rss = current_rss()
+        profiler._peak = rss or 0
+        if self.path not in profiler.records:
+            # Created on entry so parents are listed before their sub-stages
+            profiler.records[self.path] = {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                           'rss_start': rss, 'rss_peak': 0}
+        self.start_cpu = _cpu_time()
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        wall = _clock() - self.start
+        cpu = _cpu_time() - self.start_cpu
+        profiler = self.profiler
+        peak = max(profiler._peak, current_rss() or 0) or max_rss()
+        profiler._peak = max(self.outer_peak, peak)
+        profiler._stack.pop()
+
+        record = profiler.records[self.path]
+        record['calls'] += 1
+        record['wall_s'] += wall
+        record['cpu_s'] += cpu
+        record['rss_peak'] = max(record['rss_peak'], peak or 0)
+        return False
+
+
+class Profiler(object):
+    """
+    Collects stage records for one process. Use the module-level functions
+    rather than creating one directly.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = OrderedDict()
+        self._stack = []
+        self._peak = 0
+        self._started = None
+        self._elapsed = None
+        self._pid = None
+        self._sampler = None
+        self._cprofile = None
+
+    def enable(self, cprofile=False):
+        if self.enabled and self._pid == os.getpid():
+            return
+        # A forked worker inherits the parent's records but not its sampler
+        # thread: start over in the new process
+        self.records = OrderedDict()
+        self._stack = []
+        self._peak = 0
+        self._pid = os.getpid()
+        self.enabled = True
+        self._started = _clock()
+        self._elapsed = None
+        if current_rss() is not None:
+            self._sampler = threading.Thread(target=self._sample)
+            self._sampler.daemon = True
+            self._sampler.start()
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def disable(self):
+        self.enabled = False
+        if self._started is not None:
+            self._elapsed = _clock() - self._started
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    def _sample(self):
+        while self.enabled:
+            rss = current_rss()
+            if rss is not None and rss > self._peak:
+                self._peak = rss
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def snapshot(self):
+        """
+        Returns the records collected so far as a plain dict (picklable),
+        and clears them; used to send a worker's stages to the parent.
+        """
+        records, self.records = self.records, OrderedDict()
+        return records
+
+    def merge(self, records):
+        """
+        Adds records from snapshot() of another process to this one.
+        """
+        for path, other in records.items():
+            record = self.records.get(path)
+            if record is None:
+                self.records[path] = dict(other)
+                continue
+            record['calls'] += other['calls']
+            record['wall_s'] += other['wall_s']
+            record['cpu_s'] += other['cpu_s']
+            record['rss_peak'] = max(record['rss_peak'], other['rss_peak'])
+
+    def summary(self):
+        """
+        Returns the breakdown as a JSON-ready dict.
+        """
+        mib = float(1 << 20)
+        if self._elapsed is not None:
+            total = self._elapsed
+        else:
+            total = _clock() - self._started if self._started is not None else 0.0
+        stages = []
+        for path, record in self.records.items():
+            stages.append({
+                'stage': path,
+                'calls': record['calls'],
+                'wall_s': record['wall_s'],
+                'cpu_s': record['cpu_s'],
+                'rss_start_mb': record['rss_start'] / mib if record['rss_start'] else None,
+                'rss_peak_mb': record['rss_peak'] / mib if record['rss_peak'] else None,
+            })
+        self_peak, child_peak = max_rss(), max_rss(children=True)
+        return {
+            'total_wall_s': total,
+            'max_rss_mb': self_peak / mib if self_peak else None,
+            'children_max_rss_mb': child_peak / mib if child_peak else None,
+            'stages': stages,
+        }
+
+    def report(self, out=sys.stderr):
+        summary = self.summary()
+        total = summary['total_wall_s'] or 1.0
+
+        def mb(value):
+            return '%10.1f' % value if value is not None else '%10s' % '-'
+
+        out.write('\nProfile: %.3f s wall, peak RSS%s MiB, workers%s MiB\n'
+                  % (summary['total_wall_s'], mb(summary['max_rss_mb']), mb(summary['children_max_rss_mb'])))
+        out.write('%-32s %6s %10s %10s %7s %10s\n' % ('stage', 'calls', 'wall s', 'cpu s', 'wall%', 'peak MiB'))
+        for s in summary['stages']:
+            # Indent nested stages under their parent
+            depth = s['stage'].count('/')
+            name = '  ' * depth + s['stage'].rsplit('/', 1)[-1]
+            out.write('%-32s %6d %10.4f %10.4f %6.1f%% %s\n'
+                      % (name, s['calls'], s['wall_s'], s['cpu_s'], 100.0 * s['wall_s'] / total, mb(s['rss_peak_mb'])))
+        out.flush()
+
+    def dump(self, path):
+        """
+        Writes the stage breakdown as JSON if path ends in '.json', else the
+        cProfile statistics (falling back to JSON if cProfile was not on).
+        """
+        if not path.endswith('.json') and self._cprofile is not None:
+            self._cprofile.dump_stats(path)
+            return
+        with open(path, 'w') as handle:
+            json.dump(self.summary(), handle, indent=1)
+
+
+# One profiler per process, shared by every module
+PROFILER = Profiler()
+
+
+def stage(name):
+    """
+    Context manager timing the named stage; a no-op unless profiling is on.
+    """
+    if not PROFILER.enabled:
+        return _NULL_STAGE
+    return _Stage(PROFILER, name)
+
+
+def enable(cprofile=False):
+    PROFILER.enable(cprofile)
+
+
+def is_enabled():
+    return PROFILER.enabled
+
+
+def add_arguments(parser):
+    """
+    Adds --profile and --profile-out to an argparse parser.
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help="print the time and peak memory of each stage to stderr")
+    parser.add_argument('--profile-out', metavar='PATH',
+                        help="also write the profile: .json for the stage breakdown, "
+                             "any other name for cProfile statistics (implies --profile)")
+
+
+def enable_from_args(args):
+    """
+    Turns profiling on if the parsed arguments ask for it. cProfile is only
+    switched on when its statistics will be written, as it slows every
+    Python call down.
+    """
+    if args.profile or args.profile_out:
+        enable(cprofile=bool(args.profile_out) and not args.profile_out.endswith('.json'))
+
+
+def finish(out_path=None, out=sys.stderr):
+    """
+    Stops profiling, prints the breakdown and writes out_path if given.
+    Does nothing when profiling was never enabled.
+    """
+    if not PROFILER.enabled:
+        return
+    PROFILER.disable()
+    PROFILER.report(out)
+    if out_path:
+        PROFILER.dump(out_path)
+        out.write('Profile written to %s\n' % out_path)
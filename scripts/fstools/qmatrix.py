@@ -0,0 +1,191 @@
+"""
+Loader for fastStructure .meanQ files with a binary sidecar cache.
+
+Parsing text is by far the slowest part of reading a Q-matrix, and every
+script reads the same files over and over. The first load of a .meanQ file
+writes a .npy copy into a hidden cache directory next to it; later loads from
+any script memory-map that copy instead of parsing text again. The cache
+entry is keyed on the source path, size and mtime, so editing or rewriting a
+.meanQ file makes its sidecar stale and it is rebuilt on the next load.
+"""
+import json
+import os
+import sys
+import warnings
+
+import numpy as np
+
+# Hidden directory, created next to the .meanQ files, holding the sidecars
+CACHE_DIRNAME = '.fstools_cache'
+
+
+def parse_meanQ_text(path):
+    """
+    Parses a whitespace-separated .meanQ file into an N x K float64 array
+    with a single vectorized NumPy call. Blank lines are ignored.
+
+    Arguments:
+        path : str
+            path to the .meanQ file
+
+    Raises ValueError if the file is ragged or holds non-numeric values.
+    """
+    with open(path, 'rb') as handle:
+        data = handle.read()
+
+    # Number of columns is taken from the first non-empty line
+    first_line = data.lstrip().split(b'\n', 1)[0]
+    n_cols = len(first_line.split())
+    if n_cols == 0:
+        return np.empty((0, 0))
+
+    with warnings.catch_warnings():
+        # NumPy only warns when it stops early on malformed text
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(data, dtype=np.float64, sep=' ')
+        except (ValueError, DeprecationWarning):
+            raise ValueError("non-numeric value in %s" % path)
+
+    # Every non-empty line must have the first line's columns, not just the total
+    widths = _values_per_line(data)
+    ragged = np.flatnonzero((widths != n_cols) & (widths > 0))
+    if ragged.size:
+        raise ValueError("%s line %d has %d values, expected %d"
+                         % (path, ragged[0] + 1, widths[ragged[0]], n_cols))
+    n_rows = np.count_nonzero(widths)
+    if values.size != n_rows * n_cols:
+        raise ValueError("%s has %d values, expected %d rows x %d columns"
+                         % (path, values.size, n_rows, n_cols))
+    return values.reshape(n_rows, n_cols)
+
+
+def _values_per_line(data):
+    """
+    Number of whitespace-separated fields on each line of data (bytes),
+    counted on the raw bytes without splitting into Python strings.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    newline = raw == ord('\n')
+    blank = newline | (raw == ord(' ')) | (raw == ord('\t')) | (raw == ord('\r'))
+    # A field starts at a non-blank byte that follows a blank one (or the start)
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    breaks = np.flatnonzero(newline)
+    line = np.searchsorted(breaks, np.flatnonzero(starts))
+    return np.bincount(line, minlength=breaks.size + 1)
+
+
+def _source_key(path):
+    """
+    Returns the identity of a source file that a sidecar must match.
+    """
+    st = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def sidecar_paths(path):
+    """
+    Returns the (.npy, .json) sidecar paths used to cache a .meanQ file.
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+    base = os.path.join(cache_dir, os.path.basename(path))
+    return base + '.npy', base + '.json'
+
+
+def _read_sidecar(path, key, mmap):
+    """
+    Returns the cached matrix for path if its sidecar matches key, else None.
+    """
+    npy_path, key_path = sidecar_paths(path)
+    try:
+        with open(key_path, 'r') as handle:
+            if json.load(handle) != key:
+                return None
+        return np.load(npy_path, mmap_mode='r' if mmap else None)
+    except (IOError, OSError, ValueError):
+        # Missing, half-written or unreadable sidecar: treat as stale
+        return None
+
+
+def _write_sidecar(path, key, Q):
+    """
+    Writes Q and its key next to path. The .npy is moved into place before
+    the key, so a reader never sees a key pointing at a partial array.
+    """
+    npy_path, key_path = sidecar_paths(path)
+    cache_dir = os.path.dirname(npy_path)
+    suffix = '.tmp%d' % os.getpid()
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(npy_path + suffix, 'wb') as handle:
+            np.save(handle, Q)
+        os.rename(npy_path + suffix, npy_path)
+        with open(key_path + suffix, 'w') as handle:
+            json.dump(key, handle)
+        os.rename(key_path + suffix, key_path)
+    except (IOError, OSError) as e:
+        # A read-only results directory should not stop anyone from plotting
+        sys.stderr.write("Warning: Could not write cache for %s: %s\n" % (path, e))
+
+
+def load_meanQ(path, cache=True, mmap=True):
+    """
+    Loads the raw (unnormalized) N x K matrix stored in a .meanQ file.
+
+    With cache=True a matching sidecar is memory-mapped if present, and
+    written if missing or stale. The returned array is read-only when it
+    comes from a memory-mapped sidecar; take a copy before editing it in
+    place.
+
+    Arguments:
+        path : str
+            path to the .meanQ file
+        cache : bool
+            read and write the .npy sidecar
+        mmap : bool
+            memory-map the sidecar instead of reading it into RAM
+
+    Raises IOError if the file cannot be opened and ValueError if it is not
+    a numeric matrix.
+    """
+    if not cache:
+        return parse_meanQ_text(path)
+
+    key = _source_key(path)
+    Q = _read_sidecar(path, key, mmap)
+    if Q is not None:
+        return Q
+
+    Q = parse_meanQ_text(path)
+    if Q.size:
+        _write_sidecar(path, key, Q)
+    return Q
+
+
+def normalize_rows(Q):
+    """
+    Returns a copy of Q with every row scaled to sum to 1. All-zero rows are
+    left as zeros instead of dividing by zero.
+    """
+    Q_sum = Q.sum(axis=1, keepdims=True)
+    Q_sum[Q_sum == 0] = 1.0
+    return Q / Q_sum
+
+
+def k_phi_star(Q):
+    """
+    Returns the number of model components used to explain structure in
+    the data (K_phi_star): the smallest number of components, taken in
+    decreasing order of total ancestry, needed to explain N-1 individuals.
+
+    Arguments:
+        Q : array
+            N x K admixture proportions; rows are normalized here
+    """
+    Q = normalize_rows(Q)
+    N = Q.shape[0]
+    # Cumulative sum of sorted column sums (components)
+    C = np.cumsum(np.sort(Q.sum(0))[::-1])
+    return int(np.sum(C < N - 1) + 1)
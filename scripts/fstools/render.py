@@ -0,0 +1,156 @@
+"""
+Fast drawing of stacked admixture bars.
+
+ax.bar creates one Rectangle per sample per component, which means millions
+of artists (and a huge PDF) for large cohorts. Here each ancestry component
+is drawn as ONE filled step polygon spanning every sample, all in a single
+collection. Above a sample-count threshold the bars are instead drawn as one
+image, while text, separators and axes stay vector on top.
+"""
+import numpy as np
+
+# Above this many samples the bar layer is rasterized by default
+RASTER_THRESHOLD = 5000
+
+# Pixel size of the raster bar layer
+RASTER_WIDTH = 4000
+RASTER_HEIGHT = 500
+
+# savefig resolution; only affects PNG output and the raster bar layer
+RASTER_DPI = 300
+
+# At most this many per-sample tick labels are drawn in 'thin' mode
+MAX_SAMPLE_LABELS = 200
+
+
+def resolve_render_mode(n_samples, mode='auto', raster_threshold=RASTER_THRESHOLD):
+    """
+    Returns 'vector' or 'raster' for the requested mode and sample count.
+    """
+    if mode == 'auto':
+        return 'raster' if n_samples > raster_threshold else 'vector'
+    if mode not in ('vector', 'raster'):
+        raise ValueError("render mode must be 'auto', 'vector' or 'raster', not %r" % mode)
+    return mode
+
+
+def _step_polygon(lower, upper):
+    """
+    Returns the vertices of one polygon covering lower..upper for every
+    sample, each sample being a unit-wide step centred on its index.
+    """
+    N = lower.size
+    # -0.5, 0.5, 0.5, 1.5, ... , N-0.5: left and right edge of every sample
+    x = np.repeat(np.arange(N + 1) - 0.5, 2)[1:-1]
+    top = np.column_stack([x, np.repeat(upper, 2)])
+    bottom = np.column_stack([x[::-1], np.repeat(lower, 2)[::-1]])
+    return np.vstack([top, bottom])
+
+
+def _draw_vector(ax, Q, colors):
+    """
+    Adds all K components as polygons of a single PolyCollection.
+    """
+    from matplotlib.collections import PolyCollection
+
+    tops = np.cumsum(Q, axis=1)
+    lowers = np.hstack([np.zeros((Q.shape[0], 1)), tops[:, :-1]])
+    polygons = [_step_polygon(lowers[:, i], tops[:, i]) for i in range(Q.shape[1])]
+    collection = PolyCollection(polygons, facecolors=colors[:Q.shape[1]], edgecolors='none',
+                                linewidths=0, zorder=1)
+    # Limits are set explicitly, which skips a slow per-vertex autoscale
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+
+def _draw_raster(ax, Q, colors, width, height):
+    """
+    Adds the bars as one RGBA image. When there are more samples than pixel
+    columns, each column shows the mean ancestry of the samples it covers.
+    """
+    from matplotlib.colors import to_rgba_array
+
+    N, K = Q.shape
+    if N > width:
+        starts = np.unique(np.arange(width) * N // width)
+        counts = np.diff(np.r_[starts, N])
+        Q = np.add.reduceat(Q, starts, axis=0) / counts[:, None]
+
+    tops = np.cumsum(Q, axis=1)
+    # Component index at every pixel: number of component tops below it
+    y = (np.arange(height) + 0.5) / height
+    component = np.zeros((height, Q.shape[0]), dtype=np.intp)
+    for i in range(K - 1):
+        component += y[:, None] >= tops[None, :, i]
+
+    rgba = to_rgba_array(colors[:K])[component]
+    return ax.imshow(rgba, origin='lower', extent=(-0.5, N - 0.5, 0, 1), aspect='auto',
+                     interpolation='none', zorder=1)
+
+
+def draw_admixture(ax, Q, colors, mode='auto', raster_threshold=RASTER_THRESHOLD,
+                   raster_width=RASTER_WIDTH, raster_height=RASTER_HEIGHT):
+    """
+    Draws Q as stacked bars, one unit-wide bar per sample centred on
+    x = 0 .. N-1 (the same layout as ax.bar(range(N), ..., width=1.0)).
+
+    Arguments:
+        ax : matplotlib Axes
+        Q : array-like
+            N x K ancestry proportions, already in plotting order
+        colors : sequence
+            one matplotlib colour per component
+        mode : str
+            'vector', 'raster' or 'auto' (raster above raster_threshold samples)
+        raster_threshold : int
+            sample count at which 'auto' switches to raster
+        raster_width, raster_height : int
+            pixel size of the raster layer; samples are averaged into
+            raster_width columns when there are more of them
+
+    Returns the artist holding the bars (a PolyCollection or an image).
+    """
+    Q = np.asarray(Q, dtype=np.float64)
+    N = Q.shape[0]
+    if resolve_render_mode(N, mode, raster_threshold) == 'raster':
+        artist = _draw_raster(ax, Q, colors, raster_width, raster_height)
+    else:
+        artist = _draw_vector(ax, Q, colors)
+    ax.set_xlim(-0.5, N - 0.5)
+    ax.set_ylim(0, 1)
+    return artist
+
+
+def set_sample_labels(ax, labels, mode='auto', max_labels=MAX_SAMPLE_LABELS, **text_kw):
+    """
+    Sets per-sample x tick labels.
+
+    Arguments:
+        ax : matplotlib Axes
+        labels : sequence of str
+            one label per sample, in plotting order
+        mode : str
+            'all' labels every sample, 'thin' labels at most max_labels evenly
+            spaced samples, 'none' removes sample ticks, and 'auto' picks
+            'all' up to max_labels samples and 'thin' above that
+        max_labels : int
+            tick budget for 'thin' mode
+        text_kw :
+            passed on to ax.set_xticklabels (rotation, fontsize, ...)
+    """
+    N = len(labels)
+    if mode == 'auto':
+        mode = 'all' if N <= max_labels else 'thin'
+
+    if mode == 'none':
+        ax.set_xticks([])
+        return
+    if mode == 'all':
+        positions = np.arange(N)
+    elif mode == 'thin':
+        positions = np.unique(np.linspace(0, N - 1, min(N, max_labels)).round().astype(int))
+    else:
+        raise ValueError("label mode must be 'auto', 'all', 'thin' or 'none', not %r" % mode)
+
+    ax.set_xticks(positions)
+    ax.set_xticklabels([labels[i] for i in positions], **text_kw)
@@ -0,0 +1,552 @@
+"""
+The report command: every result in one static HTML file.
+
+The page has the likelihood-vs-K curve, the K_phi_star table with
+choosek's two answers, per-K convergence summaries (when the logs have
+traces) and an admixture panel for every K, in the plots' group order.
+Everything, scripts included, is inside the one file: it opens offline,
+from a file system or an e-mail attachment, with no server.
+
+The page stays small and quick for large cohorts because no panel draws
+one bar per sample up front. The samples are averaged into pixel-wide bins
+(never across a group boundary, like the raster layer of render.py), and
+each component of the binned bars is one SVG path. The full-resolution
+Q-matrix of every panel is embedded as base64 of one byte per value,
+inside an inert script tag; it is only decoded when that panel is opened
+for zooming, and then drawn on a canvas for the visible range only.
+"""
+import base64
+import html
+import json
+import os
+import sys
+
+import numpy as np
+
+from fstools.profiling import stage
+
+OUTPUT_FILENAME = 'faststructure_report.html'
+
+# Bins (pixel columns) of the static admixture panels
+DEFAULT_WIDTH = 1200
+
+# matplotlib's tab10 and tab20, as in the PDF plots (aligned columns keep their colour)
+TAB10 = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+         '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+TAB20 = ['#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78', '#2ca02c', '#98df8a', '#d62728', '#ff9896',
+         '#9467bd', '#c5b0d5', '#8c564b', '#c49c94', '#e377c2', '#f7b6d2', '#7f7f7f', '#c7c7c7',
+         '#bcbd22', '#dbdb8d', '#17becf', '#9edae5']
+
+# At most this many group names are written under a panel
+MAX_GROUP_NAMES = 40
+
+
+def palette(K):
+    """
+    One colour per component, cycling through tab20 beyond 20.
+    """
+    colors = TAB10 if K <= 10 else TAB20
+    return [colors[i % len(colors)] for i in range(K)]
+
+
+def bin_samples(Q, width, breaks=()):
+    """
+    Averages the rows of Q (N x K, in plotting order) into at most width
+    bins plus one per break: a bin never spans a break (a group start).
+    Returns (starts, ends, means).
+    """
+    N = len(Q)
+    starts = np.unique(np.r_[np.arange(min(width, N)) * N // max(min(width, N), 1),
+                             np.asarray(breaks, dtype=np.int64)])
+    starts = starts[(starts >= 0) & (starts < N)]
+    ends = np.r_[starts[1:], N]
+    means = np.add.reduceat(np.asarray(Q, dtype=np.float64), starts, axis=0) / (ends - starts)[:, None]
+    return starts, ends, means
+
+
+def svg_admixture(starts, ends, means, colors, separators=()):
+    """
+    Binned stacked bars as an SVG drawn in sample units (x from 0 to N,
+    y from 0 to 1), stretched to the page width: one path per component
+    and a line at every separator.
+    """
+    N = int(ends[-1])
+    # SVG y grows downwards: component 1 sits at the bottom
+    tops = 1.0 - np.cumsum(means, axis=1)
+    parts = ['<svg class="bars" viewBox="0 0 %d 1" preserveAspectRatio="none">' % N]
+    # Each component fills from the baseline up to its cumulative top, drawn last
+    # component first so that the ones below paint over it: only the top outline
+    # of a path is needed, as vertical/horizontal steps
+    for k in reversed(range(len(colors))):
+        steps = ''.join('V%.3gH%d' % (y, end) for y, end in zip(tops[:, k], ends))
+        parts.append('<path fill="%s" d="M%d 1%sV1Z"/>' % (colors[k], starts[0], steps))
+    for position in separators:
+        if 0 < position < N:
+            parts.append('<line x1="%d" x2="%d" y1="0" y2="1" class="sep"/>' % (position, position))
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def _ticks(low, high, count=5):
+    """
+    About count round tick values covering low..high.
+    """
+    if not high > low:
+        return [low]
+    step = 10 ** np.floor(np.log10((high - low) / count))
+    for multiple in (1, 2, 5, 10):
+        if (high - low) / (step * multiple) <= count:
+            break
+    step *= multiple
+    return list(np.arange(np.ceil(low / step), np.floor(high / step) + 1) * step)
+
+
+def svg_likelihood(runs, best_K=None, width=640, height=320):
+    """
+    The marginal likelihood of every run against K as an SVG: one dot per
+    run, a line through the best run of each K, and best_K highlighted.
+    """
+    points = sorted((run['K'], run['likelihood']) for run in runs if run['likelihood'] is not None)
+    if not points:
+        return '<p>No marginal likelihoods were found in the logs.</p>'
+    Ks = np.array([K for K, _ in points], dtype=np.float64)
+    lls = np.array([ll for _, ll in points])
+    margin_left, margin_right, margin_top, margin_bottom = 80, 20, 15, 40
+    k_low, k_high = Ks.min() - 0.5, Ks.max() + 0.5
+    span = lls.max() - lls.min()
+    ll_low, ll_high = lls.min() - 0.05 * span - 1e-9, lls.max() + 0.05 * span + 1e-9
+
+    def sx(K):
+        return margin_left + (K - k_low) / (k_high - k_low) * (width - margin_left - margin_right)
+
+    def sy(ll):
+        return margin_top + (ll_high - ll) / (ll_high - ll_low) * (height - margin_top - margin_bottom)
+
+    parts = ['<svg class="curve" width="%d" height="%d" viewBox="0 0 %d %d">' % (width, height, width, height)]
+    for tick in _ticks(ll_low, ll_high):
+        parts.append('<line class="grid" x1="%d" x2="%d" y1="%.1f" y2="%.1f"/>'
+                     % (margin_left, width - margin_right, sy(tick), sy(tick)))
+        parts.append('<text x="%d" y="%.1f" text-anchor="end" dy="4">%s</text>' % (margin_left - 6, sy(tick), '%.6g' % tick))
+    for K in np.unique(Ks):
+        parts.append('<text x="%.1f" y="%d" text-anchor="middle">%d</text>' % (sx(K), height - margin_bottom + 16, K))
+    parts.append('<text x="%.1f" y="%d" text-anchor="middle">K</text>' % ((margin_left + width - margin_right) / 2.0, height - 6))
+    best = [(K, lls[Ks == K].max()) for K in np.unique(Ks)]
+    parts.append('<polyline class="line" points="%s"/>' % ' '.join('%.1f,%.1f' % (sx(K), sy(ll)) for K, ll in best))
+    for K, ll in points:
+        parts.append('<circle class="%s" cx="%.1f" cy="%.1f" r="3.5"><title>K=%d: %.6f</title></circle>'
+                     % ('best' if K == best_K else 'run', sx(K), sy(ll), K, ll))
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def encode_full(Q):
+    """
+    Q (N x K proportions, rows in plotting order) as base64 of one byte per
+    value (0..255), row after row: the panel's full-resolution data.
+    """
+    return base64.b64encode(np.round(np.clip(Q, 0.0, 1.0) * 255).astype(np.uint8).tobytes()).decode('ascii')
+
+
+def _script_json(value):
+    """
+    JSON that can sit inside a <script> element.
+    """
+    return json.dumps(value).replace('</', '<\\/')
+
+
+def _table(header, rows):
+    lines = ['<table><tr>%s</tr>' % ''.join('<th>%s</th>' % html.escape(str(cell)) for cell in header)]
+    for row in rows:
+        lines.append('<tr>%s</tr>' % ''.join('<td>%s</td>' % html.escape(str(cell)) for cell in row))
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def k_rows(runs):
+    """
+    Rows of the K_phi_star table: per K, the runs, best and mean
+    likelihood and the K_phi_star of each run (in seed order).
+    """
+    rows = []
+    for K in sorted(set(run['K'] for run in runs)):
+        mine = sorted((run for run in runs if run['K'] == K), key=lambda run: run['seed'])
+        lls = [run['likelihood'] for run in mine if run['likelihood'] is not None]
+        rows.append((K, len(mine), '%.6f' % max(lls) if lls else '-',
+                     '%.6f' % np.mean(lls) if lls else '-',
+                     ', '.join('-' if run['k_phi_star'] is None else str(run['k_phi_star']) for run in mine)))
+    return rows
+
+
+def convergence_rows(runs, jobs=1):
+    """
+    Per-K convergence rows (runs, converged, mean iterations, largest
+    final delta, hours) from the traces of the runs' logs; empty when no
+    log has a readable trace.
+    """
+    from fstools.convergence import read_traces, summarize_trace
+
+    logged = [run for run in runs if run['log']]
+    traces = read_traces([run['log'] for run in logged], jobs=jobs)
+    summaries = [(run['K'], summarize_trace(trace)) for run, trace in zip(logged, traces)
+                 if trace is not None and len(trace.iteration)]
+    rows = []
+    for K in sorted(set(K for K, _ in summaries)):
+        mine = [s for k, s in summaries if k == K]
+        rows.append((K, len(mine), sum(s['converged'] for s in mine),
+                     '%.1f' % np.mean([s['iterations'] for s in mine]),
+                     '%.3g' % np.nanmax([s['final_delta'] for s in mine]),
+                     '%.3f' % (np.nansum([s['wall_s'] for s in mine]) / 3600.0)))
+    return rows
+
+
+def panel_html(K, seed, likelihood, Q, grouping, width, full=True):
+    """
+    One admixture panel: the binned bars, the group names and (with full)
+    the embedded full-resolution data. Q is in file order.
+    """
+    from fstools.groups import group_segments
+
+    Q = np.asarray(Q, dtype=np.float64)[grouping.order]
+    totals = Q.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1.0
+    Q /= totals
+    colors = palette(K)
+    depth = len(grouping.levels)
+    fine, _ = group_segments(grouping.codes, depth)
+    outer, _ = group_segments(grouping.codes, 1)
+    with stage('bin_samples'):
+        starts, ends, means = bin_samples(Q, width, fine)
+    with stage('svg_panel'):
+        bars = svg_admixture(starts, ends, means, colors, outer)
+
+    title = 'K=%d <small>seed %d%s, %d samples</small>' % (
+        K, seed, '' if likelihood is None else ', LLBO %.6f' % likelihood, len(Q))
+    legend = ''.join('<span class="swatch" style="background:%s"></span>%d ' % (color, k + 1)
+                     for k, color in enumerate(colors))
+    parts = ['<section class="panel" id="panel-K%d">' % K,
+             '<h3>%s <span class="legend">%s</span>%s</h3>' % (
+                 title, legend, ' <button class="zoom" data-k="%d">Zoom</button>' % K if full else ''),
+             '<div class="view" data-k="%d" data-n="%d" data-colors="%s">%s'
+             '<canvas hidden></canvas><div class="tip" hidden></div></div>'
+             % (K, len(Q), html.escape(json.dumps(colors)), bars)]
+    if full:
+        with stage('encode_full'):
+            parts.append('<script type="application/octet-stream" id="q-K%d">%s</script>' % (K, encode_full(Q)))
+    parts.append('</section>')
+    return '\n'.join(parts)
+
+
+def group_names_html(grouping):
+    """
+    The group names under the panels, placed in percent of the sample
+    axis: the finest level if there are few enough groups, else the
+    outermost.
+    """
+    from fstools.groupstats import group_names
+    from fstools.groups import group_segments
+
+    N = len(grouping.order)
+    depth = len(grouping.levels)
+    starts, ends = group_segments(grouping.codes, depth)
+    if len(starts) > MAX_GROUP_NAMES:
+        depth = 1
+        starts, ends = group_segments(grouping.codes, depth)
+    if len(starts) > MAX_GROUP_NAMES:
+        return ''
+    names = group_names(grouping, starts, depth)
+    return '<div class="groups">%s</div>' % ''.join(
+        '<span style="left:%.3f%%;width:%.3f%%" title="%s">%s</span>'
+        % (100.0 * s / N, 100.0 * (e - s) / N, html.escape(name or '(all)'), html.escape(name or '(all)'))
+        for s, e, name in zip(starts, ends, names))
+
+
+def sample_index_json(labels, grouping):
+    """
+    What the zoomed panels need about the samples, in plotting order: the
+    labels, the starts and names of the finest groups (for the hover
+    text), and the starts of the outermost groups, where the separators go
+    as in the static panels.
+    """
+    from fstools.groupstats import group_names
+    from fstools.groups import group_segments
+
+    depth = len(grouping.levels)
+    starts, _ = group_segments(grouping.codes, depth)
+    outer, _ = group_segments(grouping.codes, 1)
+    return _script_json({
+        'labels': [labels[i] for i in grouping.order],
+        'groupStarts': [int(s) for s in starts],
+        'groupNames': group_names(grouping, starts, depth),
+        'separatorStarts': [int(s) for s in outer],
+    })
+
+
+STYLE = """
+body { font-family: sans-serif; margin: 2em auto; max-width: 1300px; color: #222; }
+h1 { font-size: 1.5em; } h2 { margin-top: 1.8em; border-bottom: 1px solid #ccc; }
+h3 { font-size: 1em; margin: 1.2em 0 0.3em; } h3 small { color: #666; font-weight: normal; }
+table { border-collapse: collapse; font-size: 0.9em; }
+th, td { padding: 2px 10px; border-bottom: 1px solid #ddd; text-align: right; }
+.answer { font-size: 1.05em; }
+svg.curve text { font-size: 11px; fill: #444; }
+svg.curve .grid { stroke: #e4e4e4; } svg.curve .line { fill: none; stroke: #1f77b4; stroke-width: 1.5; }
+svg.curve .run { fill: #1f77b4; } svg.curve .best { fill: #d62728; }
+.view { position: relative; height: 160px; cursor: default; }
+.view svg.bars, .view canvas { position: absolute; left: 0; top: 0; width: 100%; height: 100%; }
+.view .sep { stroke: #000; stroke-width: 1; vector-effect: non-scaling-stroke; }
+.view.zoomed { cursor: grab; }
+.tip { position: absolute; background: rgba(255,255,255,0.95); border: 1px solid #999; padding: 3px 6px;
+       font-size: 12px; pointer-events: none; white-space: nowrap; z-index: 2; }
+.groups { position: relative; height: 1.4em; font-size: 11px; color: #444; }
+.groups span { position: absolute; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; text-align: center; }
+.legend { font-size: 0.8em; font-weight: normal; margin-left: 1em; }
+.swatch { display: inline-block; width: 0.8em; height: 0.8em; margin: 0 2px 0 6px; vertical-align: middle; }
+button.zoom { font-size: 0.8em; margin-left: 1em; }
+"""
+
+# Zooming: a panel's data is decoded on its first 'Zoom' click, then drawn on
+# a canvas for the visible samples (each pixel column averages the samples it
+# covers). Wheel zooms around the pointer, drag pans, double click resets.
+SCRIPT = """
+(function () {
+  var index = null;
+  function samples() {
+    if (!index) index = JSON.parse(document.getElementById('samples').textContent);
+    return index;
+  }
+  function decode(k) {
+    var text = atob(document.getElementById('q-K' + k).textContent.trim());
+    var data = new Uint8Array(text.length);
+    for (var i = 0; i < text.length; i++) data[i] = text.charCodeAt(i);
+    return data;
+  }
+  function groupOf(i) {
+    var starts = samples().groupStarts, lo = 0, hi = starts.length - 1;
+    while (lo < hi) { var mid = (lo + hi + 1) >> 1; if (starts[mid] <= i) lo = mid; else hi = mid - 1; }
+    return samples().groupNames[lo];
+  }
+  function Panel(view) {
+    var self = this;
+    this.view = view; this.K = +view.dataset.k; this.N = +view.dataset.n;
+    this.colors = JSON.parse(view.dataset.colors);
+    this.canvas = view.querySelector('canvas'); this.tip = view.querySelector('.tip');
+    this.data = decode(this.K); this.lo = 0; this.hi = this.N;
+    view.querySelector('svg').style.display = 'none';
+    this.canvas.hidden = false; view.classList.add('zoomed');
+    view.addEventListener('wheel', function (e) {
+      e.preventDefault();
+      var at = self.at(e), span = (self.hi - self.lo) * (e.deltaY < 0 ? 0.8 : 1.25);
+      span = Math.max(10, Math.min(self.N, span));
+      var fraction = (at - self.lo) / (self.hi - self.lo);
+      self.setRange(at - fraction * span, at - fraction * span + span);
+    }, {passive: false});
+    var dragging = null;
+    view.addEventListener('mousedown', function (e) { dragging = {x: e.clientX, lo: self.lo}; });
+    window.addEventListener('mouseup', function () { dragging = null; });
+    view.addEventListener('mousemove', function (e) {
+      if (dragging) {
+        var shift = (dragging.x - e.clientX) / view.clientWidth * (self.hi - self.lo);
+        self.setRange(dragging.lo + shift, dragging.lo + shift + self.hi - self.lo);
+      }
+      self.hover(e);
+    });
+    view.addEventListener('mouseleave', function () { self.tip.hidden = true; });
+    view.addEventListener('dblclick', function () { self.setRange(0, self.N); });
+    window.addEventListener('resize', function () { self.draw(); });
+    this.draw();
+  }
+  Panel.prototype.at = function (e) {
+    var box = this.view.getBoundingClientRect();
+    return this.lo + (e.clientX - box.left) / box.width * (this.hi - this.lo);
+  };
+  Panel.prototype.setRange = function (lo, hi) {
+    var span = hi - lo;
+    lo = Math.max(0, Math.min(this.N - span, lo));
+    this.lo = lo; this.hi = lo + span; this.draw();
+  };
+  Panel.prototype.draw = function () {
+    var ratio = window.devicePixelRatio || 1, c = this.canvas;
+    var w = Math.round(this.view.clientWidth * ratio), h = Math.round(this.view.clientHeight * ratio);
+    c.width = w; c.height = h;
+    var ctx = c.getContext('2d'), K = this.K, data = this.data, sums = new Float64Array(K);
+    var perPixel = (this.hi - this.lo) / w;
+    for (var x = 0; x < w; x++) {
+      var a = Math.floor(this.lo + x * perPixel), b = Math.max(a + 1, Math.floor(this.lo + (x + 1) * perPixel));
+      b = Math.min(b, this.N); sums.fill(0);
+      for (var i = a; i < b; i++) for (var k = 0; k < K; k++) sums[k] += data[i * K + k];
+      var total = 0; for (k = 0; k < K; k++) total += sums[k];
+      var y = h;
+      for (k = 0; k < K; k++) {
+        var bar = total > 0 ? sums[k] / total * h : 0;
+        ctx.fillStyle = this.colors[k]; ctx.fillRect(x, y - bar, 1, bar); y -= bar;
+      }
+    }
+    ctx.fillStyle = '#000';
+    var starts = samples().separatorStarts;
+    for (var g = 1; g < starts.length; g++) {
+      if (starts[g] > this.lo && starts[g] < this.hi) {
+        ctx.fillRect(Math.round((starts[g] - this.lo) / perPixel), 0, Math.max(1, Math.round(ratio)), h);
+      }
+    }
+  };
+  Panel.prototype.hover = function (e) {
+    var i = Math.floor(this.at(e));
+    if (i < 0 || i >= this.N) { this.tip.hidden = true; return; }
+    var parts = [], total = 0, k;
+    for (k = 0; k < this.K; k++) total += this.data[i * this.K + k];
+    for (k = 0; k < this.K; k++) parts.push((k + 1) + ': ' + (this.data[i * this.K + k] / (total || 1)).toFixed(3));
+    this.tip.textContent = samples().labels[i] + ' (' + (groupOf(i) || 'all') + ') ' + parts.join(' ');
+    var box = this.view.getBoundingClientRect();
+    this.tip.style.left = Math.min(e.clientX - box.left + 12, box.width - 260) + 'px';
+    this.tip.style.top = (e.clientY - box.top + 12) + 'px';
+    this.tip.hidden = false;
+  };
+  document.querySelectorAll('button.zoom').forEach(function (button) {
+    button.addEventListener('click', function () {
+      new Panel(document.querySelector('.view[data-k="' + button.dataset.k + '"]'));
+      button.disabled = true; button.textContent = 'wheel: zoom, drag: pan, double click: reset';
+    });
+  });
+})();
+"""
+
+
+def write_report(path, title, runs, panels, labels, grouping, convergence, answers, full=True):
+    """
+    Writes the page. panels are the panel_html strings, answers the
+    (best_K_mle, modal_k_phi_star) of choosek; without full the sample
+    index for zooming is left out.
+    """
+    best_K, modal = answers
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+             '<title>%s</title>' % html.escape(title), '<style>%s</style></head><body>' % STYLE,
+             '<h1>%s</h1>' % html.escape(title),
+             '<p>%d runs over K=%s; %d samples.</p>' % (
+                 len(runs), ', '.join(str(K) for K in sorted(set(run['K'] for run in runs))), len(labels)),
+             '<p class="answer">Model complexity that maximizes marginal likelihood: <b>%s</b><br>'
+             'Model components used to explain structure in data (modal K_phi_star): <b>%s</b></p>'
+             % ('-' if best_K is None else best_K, '-' if modal is None else modal),
+             '<h2>Marginal likelihood</h2>', svg_likelihood(runs, best_K),
+             '<h2>K_phi_star</h2>',
+             _table(['K', 'Runs', 'Best LLBO', 'Mean LLBO', 'K_phi_star by seed'], k_rows(runs))]
+    parts.append('<h2>Convergence</h2>')
+    if convergence:
+        parts.append(_table(['K', 'Runs', 'Converged', 'Mean iterations', 'Max final delta', 'Hours'], convergence))
+    else:
+        parts.append('<p>No convergence traces were found in the logs.</p>')
+    parts.append('<h2>Admixture</h2>')
+    parts.append('<p>Samples grouped by %s; bars are averaged into pixel-wide bins.%s</p>'
+                 % (html.escape('/'.join(grouping.levels)), ' <i>Zoom</i> loads a panel at full resolution.' if full else ''))
+    for panel in panels:
+        parts.append(panel)
+        parts.append(group_names_html(grouping))
+    if full:
+        parts.append('<script type="application/json" id="samples">%s</script>' % sample_index_json(labels, grouping))
+        parts.append('<script>%s</script>' % SCRIPT)
+    parts.append('</body></html>')
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as handle:
+        handle.write('\n'.join(parts))
+    os.replace(tmp, path)
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--store', metavar='DIR', help="read the runs from a results store ('fstools store')")
+    parser.add_argument('--k', dest='k_range', help="K values to show admixture panels for (default: all)")
+    parser.add_argument('--seed', type=int, help="run to show for each K (default: its best-likelihood run)")
+    parser.add_argument('--label-file', default='name_and_state_county.txt',
+                        help="sample labels, one per line in .meanQ row order (default: %(default)s)")
+    parser.add_argument('--metadata', help="TSV with a 'sample' column and one column per grouping level "
+                                           "(default: the State/County label rules of the plots)")
+    parser.add_argument('--levels', help="comma-separated metadata columns to group by (default: all but 'sample')")
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH,
+                        help="bins per admixture panel (default: %(default)s)")
+    parser.add_argument('--no-full', dest='full', action='store_false',
+                        help="leave out the full-resolution data (smaller file, no zooming)")
+    parser.add_argument('--title', default='fastStructure results', help="page title (default: %(default)s)")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+    parser.add_argument('--output', default=OUTPUT_FILENAME, help="HTML file to write (default: %(default)s)")
+
+
+def run(args):
+    from fstools.align import load_aligned_meanQ
+    from fstools.choosek import select_k
+    from fstools.ingest import parse_k_range
+    from fstools.plotting import load_sample_order
+    from fstools.store import open_store
+
+    if args.width < 1:
+        print("Error: --width must be at least 1.")
+        return 1
+    try:
+        Ks = parse_k_range(args.k_range) if args.k_range else None
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-10.")
+        return 1
+
+    store = None
+    try:
+        if args.store:
+            store = open_store(args.store)
+            runs = list(store.runs().values())
+        else:
+            from fstools.index import load_runs
+            runs = list(load_runs(args.input, jobs=args.jobs).values())
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+    if not runs:
+        print("Error: No runs found matching '%s<K>.<seed>'." % (args.input if store is None else args.store))
+        return 1
+
+    # The run shown per K: --seed, or the best by likelihood (first seed without any)
+    shown = {}
+    for run in sorted(runs, key=lambda run: (run['K'], run['seed'])):
+        K = run['K']
+        if (Ks is not None and K not in Ks) or not run['meanQ'] or (args.seed is not None and run['seed'] != args.seed):
+            continue
+        if K not in shown or (run['likelihood'] is not None
+                              and (shown[K]['likelihood'] is None or run['likelihood'] > shown[K]['likelihood'])):
+            shown[K] = run
+    if not shown:
+        print("Error: No Q-matrices to show%s." % ('' if args.seed is None else ' for seed %d' % args.seed))
+        return 1
+
+    stored = store.samples if store is not None else None
+    if stored is None and not os.path.exists(args.label_file) and not args.metadata:
+        sys.stderr.write("Warning: %s not found; samples are numbered and shown as one group.\n" % args.label_file)
+        first = next(iter(shown.values()))
+        stored = [str(i + 1) for i in range(len(load_aligned_meanQ(first['meanQ'])))]
+    try:
+        labels, grouping = load_sample_order(args.label_file, args.metadata,
+                                             args.levels.split(',') if args.levels else None, labels=stored)
+    except FileNotFoundError as e:
+        print("Error: File not found: %s" % e.filename)
+        return 1
+    except ValueError as e:
+        print("Error: %s" % e)
+        return 1
+
+    panels = []
+    for K, run in sorted(shown.items()):
+        try:
+            with stage('read_meanQ'):
+                Q = store.Q(K, run['seed']) if store is not None else load_aligned_meanQ(run['meanQ'])
+        except (IOError, OSError, KeyError, ValueError) as e:
+            sys.stderr.write("Warning: Cannot read the Q-matrix of K=%d: %s. Skipping.\n" % (K, e))
+            continue
+        if len(Q) != len(labels):
+            sys.stderr.write("Warning: K=%d has %d samples but there are %d labels. Skipping.\n"
+                             % (K, len(Q), len(labels)))
+            continue
+        panels.append(panel_html(K, run['seed'], run['likelihood'], Q, grouping, args.width, args.full))
+
+    with stage('convergence'):
+        convergence = convergence_rows(runs, args.jobs)
+    with stage('write_report'):
+        write_report(args.output, args.title, runs, panels, labels, grouping, convergence, select_k(runs),
+                     args.full)
+    print("Report with %d admixture panels saved to %s (%.1f MB)"
+          % (len(panels), args.output, os.path.getsize(args.output) / 1e6))
+    return 0
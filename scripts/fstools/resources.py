@@ -0,0 +1,559 @@
+"""
+The resources command: what each run actually used, and what to request next.
+
+Every task of the old array asked for 10G and a day whatever its K. This
+harvests the runtime and peak memory of the finished tasks into one table
+by K, N (samples) and L (loci), fits a scaling model to it and proposes
+per-K --mem/--time requests that 'fstools sweep --resources' then uses.
+
+Sources, in order of preference for each run:
+
+    sacct dump   'sacct -j <jobs> --format=JobID,State,Elapsed,MaxRSS -P > sacct.txt'
+                 (pipe-separated, or sacct's default fixed-width layout);
+                 the peak memory of a task is the largest over its steps
+    .out files   the 'Resources:' line written by sweep tasks (elapsed
+                 seconds; local runs also record their peak RSS), and the
+                 K/seed/job ID lines that join a task to its sacct record
+    .err files   SLURM's time-limit and out-of-memory messages
+    .log files   fastStructure's 'Total time' when nothing else has it
+
+Runs stopped by a time or memory limit only give a lower bound: they are
+left out of the fit, and the proposal for their K is at least twice the
+time (or memory) they reached.
+
+The scaling model is a power law for time, log t = a + b log K (+ c log N
++ d log L when those vary between runs), and a linear model for memory,
+m = a + b K (N + L) (+ c N L), the sizes of fastStructure's per-component
+and genotype arrays.
+"""
+import glob
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from fstools.profiling import stage
+
+USAGE_FILENAME = 'resource_usage.txt'
+PROPOSAL_FILENAME = 'resource_proposal.txt'
+
+# Requests are the larger of the model and the most any run of K used, times these
+MEM_SAFETY = 1.5
+TIME_SAFETY = 2.0
+
+# Requests are rounded up to these steps, and never go below one step
+MEM_STEP_MB = 512
+TIME_STEP_S = 15 * 60
+
+# States that mean the task hit its limit; its usage is only a lower bound
+LIMIT_STATES = ('TIMEOUT', 'OUT_OF_MEMORY')
+
+# Which of elapsed_s / max_rss_mb each limit cut off
+_LIMITED = {'TIMEOUT': 'elapsed_s', 'OUT_OF_MEMORY': 'max_rss_mb'}
+
+_OUT_PATTERNS = {
+    'K': re.compile(r'K value: (\d+)'),
+    'task': re.compile(r'Task ID: (\d+)'),
+    'seed': re.compile(r'Seed: (\d+)'),
+    'run': re.compile(r'Run: (\d+)'),
+    'job': re.compile(r'Job ID: (\d+_\d+)'),
+    'elapsed': re.compile(r'Resources: elapsed=([\d.]+) s'),
+    'max_rss': re.compile(r'max_rss=(\d+) KB'),
+}
+
+_ERR_STATES = (
+    ('DUE TO TIME LIMIT', 'TIMEOUT'),
+    ('oom-kill', 'OUT_OF_MEMORY'),
+    ('Out Of Memory', 'OUT_OF_MEMORY'),
+    ('structure.py exited with status', 'FAILED'),
+)
+
+_MEM_UNITS = {'': 1.0 / (1 << 20), 'K': 1.0 / 1024, 'M': 1.0, 'G': 1024.0, 'T': 1024.0 * 1024}
+
+
+def parse_elapsed(text):
+    """
+    Seconds in a SLURM duration: '[D-]HH:MM:SS', 'MM:SS' or 'MM:SS.mmm'.
+    Returns None for an empty or unparsable value.
+    """
+    text = text.strip()
+    days = 0
+    if '-' in text:
+        days, text = text.split('-', 1)
+    try:
+        parts = [float(part) for part in text.split(':')]
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + part
+        return int(days) * 86400 + seconds
+    except ValueError:
+        return None
+
+
+def parse_memory(text):
+    """
+    Megabytes in a SLURM memory value such as '812344K', '1.5G' or '10Gn'
+    (ReqMem's per-node/per-CPU suffix is ignored). Unsuffixed values are
+    bytes. Returns None for an empty or unparsable value.
+    """
+    match = re.match(r'^([\d.]+)([KMGT]?)[nc]?$', text.strip())
+    if not match:
+        return None
+    return float(match.group(1)) * _MEM_UNITS[match.group(2)]
+
+
+def format_memory(mb):
+    """
+    A --mem value for mb megabytes: whole gigabytes as 'NG', else 'NM'.
+    """
+    mb = int(math.ceil(mb))
+    return '%dG' % (mb // 1024) if mb % 1024 == 0 else '%dM' % mb
+
+
+def format_time(seconds):
+    """
+    A --time value for seconds: 'D-HH:MM:SS'.
+    """
+    seconds = int(math.ceil(seconds))
+    return '%d-%02d:%02d:%02d' % (seconds // 86400, seconds % 86400 // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def _split_fixed(lines):
+    """
+    Rows of sacct's default layout: a header, a line of dashes marking the
+    column widths, then the values.
+    """
+    spans = [match.span() for match in re.finditer(r'-+', lines[1])]
+    header = [lines[0][a:b].strip() for a, b in spans]
+    return header, [[line[a:b].strip() for a, b in spans] for line in lines[2:]]
+
+
+def read_sacct(path):
+    """
+    Reads a sacct dump into {job_task: record}, where job_task is
+    '<array job>_<task>' (or the plain job ID) and record holds 'state',
+    'elapsed_s', 'max_rss_mb', 'req_mem_mb' and 'time_limit_s' (None where
+    the dump lacks the column). Steps (.batch, .extern, .0) only contribute
+    their peak memory, and elapsed time when the job line has none.
+    """
+    with open(path, 'r') as handle:
+        lines = [line.rstrip('\n') for line in handle if line.strip()]
+    if len(lines) < 2:
+        return OrderedDict()
+    if '|' in lines[0]:
+        header = lines[0].rstrip('|').split('|')
+        rows = [line.split('|') for line in lines[1:]]
+    elif re.match(r'^[- ]+$', lines[1]):
+        header, rows = _split_fixed(lines)
+    else:
+        raise ValueError("%s is not a sacct dump (use 'sacct -P' or the default layout)" % path)
+    header = [name.strip() for name in header]
+    if 'JobID' not in header:
+        raise ValueError("%s has no JobID column" % path)
+
+    records = OrderedDict()
+    for row in rows:
+        values = dict(zip(header, row))
+        job_id = values['JobID'].strip()
+        base, _, step = job_id.partition('.')
+        # Pending array ranges ('123_[4-10]') have no usage yet
+        if not re.match(r'^\d+(_\d+)?$', base):
+            continue
+        record = records.setdefault(base, {'state': None, 'elapsed_s': None, 'max_rss_mb': None,
+                                           'req_mem_mb': None, 'time_limit_s': None})
+        elapsed = parse_elapsed(values.get('Elapsed', ''))
+        rss = parse_memory(values.get('MaxRSS', ''))
+        if rss is not None:
+            record['max_rss_mb'] = max(record['max_rss_mb'] or 0.0, rss)
+        if not step:
+            # 'CANCELLED by 1234' -> 'CANCELLED'
+            record['state'] = values.get('State', '').split(' ')[0] or None
+            record['elapsed_s'] = elapsed
+            record['req_mem_mb'] = parse_memory(values.get('ReqMem', ''))
+            record['time_limit_s'] = parse_elapsed(values.get('Timelimit', ''))
+        elif record['elapsed_s'] is None:
+            record['elapsed_s'] = elapsed
+    return records
+
+
+def read_task_output(path):
+    """
+    Reads the task fields of a sweep (or old run_faststructure.sh) .out
+    file, and the state implied by its .err file: returns a dict with 'K',
+    'task', 'seed', 'run', 'job', 'elapsed_s', 'max_rss_mb' and 'state'
+    (None where not found; 'COMPLETED' once the Resources line is there).
+    """
+    with open(path, 'r', errors='replace') as handle:
+        text = handle.read()
+    fields = {}
+    for name, pattern in _OUT_PATTERNS.items():
+        match = pattern.search(text)
+        fields[name] = match.group(1) if match else None
+    for name in ('K', 'task', 'seed', 'run'):
+        if fields[name] is not None:
+            fields[name] = int(fields[name])
+    elapsed = fields.pop('elapsed')
+    fields['elapsed_s'] = float(elapsed) if elapsed is not None else None
+    rss = fields.pop('max_rss')
+    fields['max_rss_mb'] = int(rss) / 1024.0 if rss is not None else None
+    fields['state'] = 'COMPLETED' if fields['elapsed_s'] is not None else None
+
+    err_path = path[:-4] + '.err'
+    if os.path.exists(err_path):
+        with open(err_path, 'r', errors='replace') as handle:
+            err = handle.read()
+        for message, state in _ERR_STATES:
+            if message in err:
+                fields['state'] = state
+                break
+    return fields
+
+
+def count_rows(path, block_size=1 << 20):
+    """
+    Number of lines in a file, counted in binary blocks without parsing.
+    """
+    rows = 0
+    last = b'\n'
+    with open(path, 'rb') as handle:
+        while True:
+            block = handle.read(block_size)
+            if not block:
+                break
+            rows += block.count(b'\n')
+            last = block[-1:]
+    return rows + (last != b'\n')
+
+
+def data_dimensions(data, fmt='str'):
+    """
+    (N, L) of a structure.py input: a .str file has two rows per sample
+    and 6 leading columns, a PLINK set one .fam line per sample and one
+    .bim line per locus.
+    """
+    if fmt == 'bed':
+        return count_rows(data + '.fam'), count_rows(data + '.bim')
+    path = data + '.str'
+    with open(path, 'r') as handle:
+        first = handle.readline()
+    return count_rows(path) // 2, len(first.split()) - 6
+
+
+def harvest(filetag, out_files, sacct_files=(), samples=None, loci=None):
+    """
+    Builds the usage table: one row per (K, run) found in out_files, with
+    the sacct record of its task where the dumps have one.
+
+    Arguments:
+        filetag : str
+            output file tag of the runs, for the .log/.meanQ/.meanP files
+        out_files : list of str
+            task .out files (their .err files are read alongside)
+        sacct_files : list of str
+            sacct dumps
+        samples, loci : int or None
+            N and L of the input; by default counted from each run's .meanQ
+            and .meanP rows
+
+    Returns a list of dicts with K, run, seed, N, L, state, elapsed_s,
+    max_rss_mb, req_mem_mb, time_limit_s and source (where the numbers
+    came from), sorted by K and run.
+    """
+    from fstools.logs import read_trace
+
+    accounting = OrderedDict()
+    for path in sacct_files:
+        accounting.update(read_sacct(path))
+    # Old .out files have no job ID; their array task ID is enough when the dump holds one array
+    jobs = set(key.split('_')[0] for key in accounting if '_' in key)
+    single_job = jobs.pop() if len(jobs) == 1 else None
+
+    rows = OrderedDict()
+    with stage('read_task_outputs'):
+        for path in out_files:
+            fields = read_task_output(path)
+            if fields['K'] is None:
+                sys.stderr.write("Warning: %s has no 'K value:' line. Skipping.\n" % path)
+                continue
+            # Old run_faststructure.sh runs: one per K, numbered K
+            run = fields['run'] if fields['run'] is not None else fields['K']
+            job = fields['job']
+            if job is None and single_job is not None and fields['task'] is not None:
+                job = '%s_%d' % (single_job, fields['task'])
+            row = {'K': fields['K'], 'run': run, 'seed': fields['seed'], 'job': job,
+                   'state': fields['state'], 'elapsed_s': fields['elapsed_s'], 'max_rss_mb': fields['max_rss_mb'],
+                   'req_mem_mb': None, 'time_limit_s': None, 'source': 'out'}
+            # A later attempt of the same run (a retried batch) replaces an earlier one
+            previous = rows.get((row['K'], run))
+            if previous is None or os.path.getmtime(path) >= previous['mtime']:
+                row['mtime'] = os.path.getmtime(path)
+                rows[(row['K'], run)] = row
+
+    for row in rows.values():
+        record = accounting.get(row['job'])
+        if record is None:
+            continue
+        for name in ('state', 'elapsed_s', 'max_rss_mb', 'req_mem_mb', 'time_limit_s'):
+            if record[name] is not None:
+                row[name] = record[name]
+        row['source'] = 'sacct'
+
+    with stage('run_dimensions'):
+        for (K, run), row in rows.items():
+            prefix = '%s%d.%d' % (filetag, K, run)
+            if row['elapsed_s'] is None and os.path.exists(prefix + '.log'):
+                try:
+                    row['elapsed_s'] = read_trace(prefix + '.log').total_time
+                except (IOError, OSError, ValueError):
+                    pass
+                if row['elapsed_s'] is not None:
+                    row['source'] = 'log'
+            row['N'] = samples if samples is not None else (
+                count_rows(prefix + '.meanQ') if os.path.exists(prefix + '.meanQ') else None)
+            row['L'] = loci if loci is not None else (
+                count_rows(prefix + '.meanP') if os.path.exists(prefix + '.meanP') else None)
+    return [rows[key] for key in sorted(rows)]
+
+
+def write_usage(path, rows):
+    with open(path, 'w') as handle:
+        handle.write('K,Run,Seed,N,L,State,Elapsed_s,MaxRSS_MB,ReqMem_MB,Timelimit_s,Source\n')
+        for row in rows:
+            values = [row['K'], row['run'], row['seed'], row['N'], row['L'], row['state'], row['elapsed_s'],
+                      row['max_rss_mb'], row['req_mem_mb'], row['time_limit_s'], row['source']]
+            handle.write(','.join('' if value is None else
+                                  '%.1f' % value if isinstance(value, float) else str(value)
+                                  for value in values) + '\n')
+
+
+def _varying(rows, name):
+    values = set(row[name] for row in rows)
+    return len(values) > 1 and None not in values
+
+
+def fit_scaling(rows):
+    """
+    Fits the time and memory models to the rows of runs that completed
+    (or whose state is unknown) and have the value measured.
+
+    Returns {'time': model, 'memory': model}, a model being a dict with
+    'terms' (names), 'coef', 'r2' and 'n' (rows used), or None if too few
+    rows were usable. Terms for N and L are only included when they vary.
+    """
+    models = {}
+    # Failed runs stopped early and runs at a limit were cut off; neither shows the full cost
+    usable = [row for row in rows if row['state'] in (None, 'COMPLETED')]
+
+    timed = [row for row in usable if row['elapsed_s'] and row['elapsed_s'] > 0]
+    terms = ['log K'] + [name for name, key in (('log N', 'N'), ('log L', 'L')) if _varying(timed, key)]
+    models['time'] = _least_squares(
+        timed, terms, lambda row: [math.log(row['K'])] + [math.log(row[key]) for key in _size_keys(terms)],
+        lambda row: math.log(row['elapsed_s']))
+
+    sized = [row for row in usable if row['max_rss_mb'] and row['N'] and row['L']]
+    terms = ['K(N+L)'] + (['NL'] if _varying(sized, 'N') or _varying(sized, 'L') else [])
+    models['memory'] = _least_squares(
+        sized, terms, lambda row: [row['K'] * (row['N'] + row['L'])] + [row['N'] * row['L']] * (len(terms) - 1),
+        lambda row: row['max_rss_mb'])
+    return models
+
+
+def _size_keys(terms):
+    # ['log K', 'log N'] -> ['N']: the row fields of the terms after K
+    return [term.split()[1] for term in terms[1:]]
+
+
+def _least_squares(rows, terms, features, target):
+    """
+    Ordinary least squares with an intercept; None unless there are more
+    distinct K values than coefficients.
+    """
+    if len(set(row['K'] for row in rows)) < len(terms) + 1:
+        return None
+    X = np.array([[1.0] + features(row) for row in rows])
+    y = np.array([target(row) for row in rows])
+    coef = np.linalg.lstsq(X, y, rcond=None)[0]
+    residual = y - X.dot(coef)
+    spread = ((y - y.mean()) ** 2).sum()
+    return {'terms': ['1'] + terms, 'coef': coef, 'r2': 1.0 - (residual ** 2).sum() / spread if spread > 0 else 1.0,
+            'n': len(rows)}
+
+
+def predict(models, K, N, L):
+    """
+    (seconds, megabytes) the models predict for one run, either None when
+    its model (or N/L for memory) is missing.
+    """
+    seconds = mb = None
+    model = models.get('time')
+    if model is not None:
+        x = [1.0, math.log(K)] + [math.log({'N': N, 'L': L}[key]) for key in _size_keys(model['terms'][1:])]
+        seconds = math.exp(np.dot(model['coef'], x))
+    model = models.get('memory')
+    if model is not None and N and L:
+        x = [1.0, K * (N + L)] + [N * L] * (len(model['terms']) - 2)
+        mb = float(np.dot(model['coef'], x))
+    return seconds, mb
+
+
+def _round_up(value, step):
+    return max(step, step * math.ceil(value / float(step)))
+
+
+def propose(rows, models, Ks, samples=None, loci=None, mem_safety=MEM_SAFETY, time_safety=TIME_SAFETY):
+    """
+    Per-K requests for the next sweep: the larger of the model prediction
+    and the most any run of K used (twice that for runs cut off by that
+    limit), times the safety factor, rounded up to MEM_STEP_MB / TIME_STEP_S.
+
+    N and L default to the largest seen in rows. Returns an OrderedDict
+    {K: {'mem_mb', 'time_s', 'basis'}}; mem_mb or time_s is None when
+    there is nothing to base it on, and basis says where each came from.
+    """
+    known = [row for row in rows if row['N'] and row['L']]
+    N = samples or max([row['N'] for row in known] or [None])
+    L = loci or max([row['L'] for row in known] or [None])
+    proposal = OrderedDict()
+    for K in Ks:
+        predicted_s, predicted_mb = predict(models, K, N, L)
+        of_K = [row for row in rows if row['K'] == K]
+        basis = []
+        values = {}
+        for name, key, predicted, safety, step in (('time', 'elapsed_s', predicted_s, time_safety, TIME_STEP_S),
+                                                   ('mem', 'max_rss_mb', predicted_mb, mem_safety, MEM_STEP_MB)):
+            used = [row[key] * (2.0 if _LIMITED.get(row['state']) == key else 1.0) for row in of_K if row[key]]
+            candidates = ([('observed', max(used))] if used else []) + \
+                         ([('model', predicted)] if predicted is not None and predicted > 0 else [])
+            if not candidates:
+                values[name] = None
+                continue
+            source, value = max(candidates, key=lambda candidate: candidate[1])
+            values[name] = _round_up(value * safety, step)
+            basis.append('%s from %s' % (name, source))
+        proposal[K] = {'mem_mb': values['mem'], 'time_s': values['time'], 'basis': ', '.join(basis)}
+    return proposal
+
+
+def write_proposal(path, proposal):
+    """
+    Writes the proposal as 'K,Mem,Time' lines in SLURM notation, read back
+    by read_proposal (and 'fstools sweep --resources'). K values without a
+    memory or time estimate are left out.
+    """
+    with open(path, 'w') as handle:
+        handle.write('K,Mem,Time\n')
+        for K, request in proposal.items():
+            if request['mem_mb'] is not None and request['time_s'] is not None:
+                handle.write('%d,%s,%s\n' % (K, format_memory(request['mem_mb']), format_time(request['time_s'])))
+
+
+def read_proposal(path):
+    """
+    Reads a 'K,Mem,Time' file into {K: (mem, time)}, the values kept as
+    written. Raises ValueError on a malformed line.
+    """
+    requests = {}
+    with open(path, 'r') as handle:
+        for number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line or line.startswith('K,') or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) != 3 or not parts[0].isdigit():
+                raise ValueError("%s line %d: expected 'K,Mem,Time', got '%s'" % (path, number, line))
+            requests[int(parts[0])] = (parts[1], parts[2])
+    return requests
+
+
+def _describe(model, unit):
+    if model is None:
+        return 'too few K values to fit'
+    terms = ' + '.join('%.4g%s' % (c, '' if term == '1' else ' ' + term) for term, c in zip(model['terms'], model['coef']))
+    return '%s = %s  (R^2 %.3f, %d runs)' % (unit, terms, model['r2'], model['n'])
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_results/faststructure_K', metavar='FILETAG',
+                        help="output file tag of the runs (default: %(default)s)")
+    parser.add_argument('--out-files', nargs='+', metavar='FILE',
+                        help="task .out files (default: <results dir>/sweep/*.out; "
+                             "for the old script, e.g. 'faststructure_K*.out')")
+    parser.add_argument('--sacct', nargs='+', default=[], metavar='FILE',
+                        help="sacct dumps, e.g. from 'sacct -j JOB --format=JobID,State,Elapsed,MaxRSS,ReqMem,Timelimit -P'")
+    parser.add_argument('--data', help="structure.py input (without extension) to take N and L from")
+    parser.add_argument('--format', dest='fmt', default='str', choices=['str', 'bed'],
+                        help="format of --data (default: %(default)s)")
+    parser.add_argument('--samples', type=int, help="N, if not counted from the outputs")
+    parser.add_argument('--loci', type=int, help="L, if not counted from the .meanP files")
+    parser.add_argument('--k', dest='k_range', help="K values to propose requests for (default: those harvested)")
+    parser.add_argument('--mem-safety', type=float, default=MEM_SAFETY, help="(default: %(default)s)")
+    parser.add_argument('--time-safety', type=float, default=TIME_SAFETY, help="(default: %(default)s)")
+    parser.add_argument('--output', default=USAGE_FILENAME, help="usage table to write (default: %(default)s)")
+    parser.add_argument('--proposal', default=PROPOSAL_FILENAME,
+                        help="per-K requests to write, for 'sweep --resources' (default: %(default)s)")
+
+
+def run(args):
+    from fstools.ingest import parse_k_range
+    from fstools.sweep import SWEEP_DIRNAME
+
+    out_files = args.out_files
+    if out_files is None:
+        out_files = sorted(glob.glob(os.path.join(os.path.dirname(args.input) or '.', SWEEP_DIRNAME, '*.out')))
+    if not out_files:
+        print("Error: No task .out files found; pass them with --out-files.")
+        return 1
+
+    samples, loci = args.samples, args.loci
+    if args.data:
+        try:
+            N, L = data_dimensions(args.data, args.fmt)
+        except (IOError, OSError) as e:
+            print("Error: Cannot read %s: %s" % (args.data, e))
+            return 1
+        samples = samples or N
+        loci = loci or L
+
+    try:
+        rows = harvest(args.input, out_files, args.sacct, samples, loci)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+    if not rows:
+        print("Error: None of the .out files describe a run.")
+        return 1
+    if any(row['L'] is None for row in rows):
+        sys.stderr.write("Warning: L is unknown for some runs (no .meanP); pass --loci or --data "
+                         "to include them in the memory model.\n")
+    write_usage(args.output, rows)
+
+    try:
+        Ks = parse_k_range(args.k_range) if args.k_range else sorted(set(row['K'] for row in rows))
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-10.")
+        return 1
+
+    with stage('fit_scaling'):
+        models = fit_scaling(rows)
+    proposal = propose(rows, models, Ks, samples, loci, args.mem_safety, args.time_safety)
+
+    print('%4s %5s %8s %12s %12s %12s %12s' % ('K', 'runs', 'at limit', 'max hours', 'max MB', 'time', 'mem'))
+    for K, request in proposal.items():
+        of_K = [row for row in rows if row['K'] == K]
+        hours = [row['elapsed_s'] / 3600.0 for row in of_K if row['elapsed_s']]
+        mb = [row['max_rss_mb'] for row in of_K if row['max_rss_mb']]
+        print('%4d %5d %8d %12s %12s %12s %12s  %s' % (
+            K, len(of_K), sum(row['state'] in LIMIT_STATES for row in of_K),
+            '%.3f' % max(hours) if hours else '-', '%.0f' % max(mb) if mb else '-',
+            format_time(request['time_s']) if request['time_s'] is not None else '-',
+            format_memory(request['mem_mb']) if request['mem_mb'] is not None else '-', request['basis']))
+    print("\nTime:   %s" % _describe(models['time'], 'log seconds'))
+    print("Memory: %s" % _describe(models['memory'], 'MB'))
+
+    write_proposal(args.proposal, proposal)
+    print("\nUsage of %d runs saved to %s" % (len(rows), args.output))
+    print("Requests saved to %s; use them with: fstools sweep --resources %s" % (args.proposal, args.proposal))
+    return 0
@@ -0,0 +1,402 @@
+"""
+Consolidated, memory-mapped store of every Q-matrix of a sweep.
+
+The store command packs all runs into one directory (by default
+'fstools_store' in the results directory):
+
+    manifest.json   sample IDs, metadata columns, and per K the seeds,
+                    final likelihoods, K_phi_star values, whether columns
+                    are aligned, and the size/mtime of every source file
+    Q_K<K>.npy      reps x N x K float64 array, one slice per run in seed order
+
+Readers memory-map the .npy files, so ResultsStore.Q(K, seed) is a
+zero-copy view and processes plotting different K share the same pages of
+the page cache. Run-level values (likelihood, K_phi_star) come from the
+manifest alone, so choosek and metrics answered from a store read one JSON
+file and never load NumPy. Columns are stored in the order saved by
+align_clusters.py when that alignment is current.
+
+The store is a snapshot: if a .meanQ or .log changes afterwards, stale()
+lists it and the commands using the store warn until it is rebuilt.
+A rebuild writes a complete new store next to the old one and swaps the
+directories only once every run has been packed and checked, so a failed
+rebuild leaves the previous store as it was.
+"""
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+from fstools.ingest import best_run
+from fstools.profiling import stage
+
+STORE_DIRNAME = 'fstools_store'
+MANIFEST_FILENAME = 'manifest.json'
+
+# Bump when the layout changes; older stores must be rebuilt
+STORE_VERSION = 1
+
+
+def default_store_dir(filetag):
+    return os.path.join(os.path.dirname(filetag), STORE_DIRNAME)
+
+
+def _stamp(path):
+    if not path:
+        return None
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def read_metadata_columns(path):
+    """
+    Reads a metadata TSV (header line with a 'sample' column) into an
+    {column: [values]} dict of strings, without pandas.
+    """
+    with open(path, 'r') as handle:
+        rows = list(csv.reader(handle, delimiter='\t'))
+    if not rows or 'sample' not in rows[0]:
+        raise ValueError("metadata file %s has no 'sample' column" % path)
+    header = rows[0]
+    columns = OrderedDict((name, []) for name in header)
+    for row in rows[1:]:
+        if not row:
+            continue
+        row = row + [''] * (len(header) - len(row))
+        for name, value in zip(header, row):
+            columns[name].append(value)
+    return columns
+
+
+def build_store(filetag, store_dir=None, label_file=None, metadata_file=None, jobs=1, use_index=True):
+    """
+    Packs every run of filetag into a store directory.
+
+    Arguments:
+        filetag : str
+            output file tag, e.g. 'faststructure_K' or 'results/faststructure_K'
+        store_dir : str or None
+            where to write the store (default: 'fstools_store' next to the runs)
+        label_file : str or None
+            sample IDs, one per line in .meanQ row order
+        metadata_file : str or None
+            TSV with a 'sample' column, copied into the manifest
+        jobs : int
+            parsing processes for runs missing from the results index
+        use_index : bool
+            take likelihoods and K_phi_star from the results index
+
+    Returns the manifest dict. Raises ValueError if the runs of one K have
+    different numbers of samples, the label file does not match them, or
+    store_dir is an existing directory that is not a store.
+    """
+    store_dir = store_dir or default_store_dir(filetag)
+    if os.path.isdir(store_dir) and os.listdir(store_dir) \
+            and not os.path.exists(os.path.join(store_dir, MANIFEST_FILENAME)):
+        raise ValueError("%s exists and is not a results store; not replacing it" % store_dir)
+    parent = os.path.dirname(os.path.abspath(store_dir))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+
+    # Built in a sibling directory (same file system) and swapped in whole at the end
+    build_dir = tempfile.mkdtemp(prefix=os.path.basename(store_dir) + '.', suffix='.tmp', dir=parent)
+    try:
+        # mkdtemp makes it private; give it the permissions of a normal new directory
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(build_dir, 0o777 & ~umask)
+        manifest = _pack_runs(filetag, build_dir, label_file, metadata_file, jobs, use_index)
+        _swap_dirs(build_dir, store_dir)
+    finally:
+        if os.path.isdir(build_dir):
+            shutil.rmtree(build_dir, ignore_errors=True)
+    return manifest
+
+
+def _swap_dirs(new_dir, store_dir):
+    """
+    Puts new_dir in place of store_dir, removing the old store.
+    """
+    if not os.path.isdir(store_dir):
+        os.rename(new_dir, store_dir)
+        return
+    old_dir = new_dir + '.old'
+    os.rename(store_dir, old_dir)
+    try:
+        os.rename(new_dir, store_dir)
+    except OSError:
+        os.rename(old_dir, store_dir)
+        raise
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _pack_runs(filetag, store_dir, label_file, metadata_file, jobs, use_index):
+    """
+    Writes the arrays and manifest of build_store into the empty directory
+    store_dir. Returns the manifest dict.
+    """
+    import numpy as np
+
+    from fstools.align import ALIGNMENT_FILENAME, load_aligned_meanQ, read_alignment
+    from fstools.index import load_runs
+
+    runs = load_runs(filetag, jobs=jobs, use_index=use_index)
+    by_K = OrderedDict()
+    for (K, seed), run in runs.items():
+        if run['meanQ']:
+            by_K.setdefault(K, []).append(run)
+
+    results_dir = os.path.dirname(filetag)
+    alignment = read_alignment(results_dir)
+    samples = None
+    if label_file:
+        with open(label_file, 'r') as handle:
+            samples = [line.strip() for line in handle if line.strip()]
+
+    manifest = {
+        'version': STORE_VERSION,
+        'filetag': os.path.basename(filetag),
+        'results_dir': os.path.abspath(results_dir or '.'),
+        'n_samples': None,
+        'samples': samples,
+        'metadata': read_metadata_columns(metadata_file) if metadata_file else None,
+        # Kept with its file name, so checking a store never needs to import align (NumPy)
+        'alignment': dict(_stamp(os.path.join(results_dir, ALIGNMENT_FILENAME)), file=ALIGNMENT_FILENAME)
+                     if alignment else None,
+        'K': OrderedDict(),
+    }
+
+    for K, K_runs in by_K.items():
+        name = 'Q_K%d.npy' % K
+        path = os.path.join(store_dir, name)
+        stack = None
+        with stage('pack_K'):
+            for i, run in enumerate(K_runs):
+                Q = load_aligned_meanQ(run['meanQ'])
+                if stack is None:
+                    if manifest['n_samples'] is None:
+                        manifest['n_samples'] = Q.shape[0]
+                    if Q.shape[0] != manifest['n_samples']:
+                        raise ValueError("%s has %d samples, other runs have %d"
+                                         % (run['meanQ'], Q.shape[0], manifest['n_samples']))
+                    stack = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                                      shape=(len(K_runs),) + Q.shape)
+                if Q.shape != stack.shape[1:]:
+                    raise ValueError("%s has shape %s, expected %s" % (run['meanQ'], Q.shape, stack.shape[1:]))
+                stack[i] = Q
+            stack.flush()
+            del stack
+
+        manifest['K'][str(K)] = {
+            'file': name,
+            'seeds': [run['seed'] for run in K_runs],
+            'likelihood': [run['likelihood'] for run in K_runs],
+            'k_phi_star': [run['k_phi_star'] for run in K_runs],
+            # load_aligned_meanQ only applies an alignment made after the file's last change
+            'aligned': [alignment.get(os.path.basename(run['meanQ']), {}).get('source') == _stamp(run['meanQ'])
+                        for run in K_runs],
+            'sources': [{'meanQ': os.path.basename(run['meanQ']), 'log': os.path.basename(run['log'] or '') or None,
+                         'meanQ_stamp': _stamp(run['meanQ']), 'log_stamp': _stamp(run['log'])}
+                        for run in K_runs],
+        }
+
+    if samples is not None and manifest['n_samples'] is not None and len(samples) != manifest['n_samples']:
+        raise ValueError("%s lists %d samples but the Q-matrices have %d rows"
+                         % (label_file, len(samples), manifest['n_samples']))
+
+    with open(os.path.join(store_dir, MANIFEST_FILENAME), 'w') as handle:
+        json.dump(manifest, handle, indent=1)
+    return manifest
+
+
+class ResultsStore(object):
+    """
+    Read access to a store directory written by build_store. The per-K
+    arrays are memory-mapped on first use and kept open.
+    """
+
+    def __init__(self, store_dir):
+        self.path = store_dir
+        with open(os.path.join(store_dir, MANIFEST_FILENAME), 'r') as handle:
+            self.manifest = json.load(handle)
+        if self.manifest.get('version') != STORE_VERSION:
+            raise ValueError("%s was written by another version of fstools; rebuild it with 'fstools store'"
+                             % store_dir)
+        self._stacks = {}
+
+    @property
+    def Ks(self):
+        return sorted(int(K) for K in self.manifest['K'])
+
+    @property
+    def samples(self):
+        return self.manifest['samples']
+
+    @property
+    def metadata(self):
+        return self.manifest['metadata']
+
+    def seeds(self, K):
+        return list(self.manifest['K'][str(K)]['seeds'])
+
+    def stack(self, K):
+        """
+        The reps x N x K read-only memory map of every run of K, in the
+        order of seeds(K). Raises KeyError if the store has no runs of K.
+        """
+        if K not in self._stacks:
+            import numpy as np
+            entry = self.manifest['K'][str(K)]
+            self._stacks[K] = np.load(os.path.join(self.path, entry['file']), mmap_mode='r')
+        return self._stacks[K]
+
+    def Q(self, K, seed=None):
+        """
+        The N x K Q-matrix of one run, as a view into the memory map. seed
+        defaults to the best_seed(K). Raises KeyError if the run is not in
+        the store.
+        """
+        seeds = self.seeds(K)
+        if seed is None:
+            seed = self.best_seed(K)
+        if seed not in seeds:
+            raise KeyError("no run K=%d, seed=%d in %s" % (K, seed, self.path))
+        return self.stack(K)[seeds.index(seed)]
+
+    def best_seed(self, K):
+        """
+        Seed of the run of K with the highest final likelihood (see
+        ingest.best_run). Raises KeyError if the store has no runs of K and
+        ValueError if it has several without a likelihood.
+        """
+        entry = self.manifest['K'][str(K)]
+        return best_run([{'K': K, 'seed': seed, 'likelihood': likelihood}
+                         for seed, likelihood in zip(entry['seeds'], entry['likelihood'])])['seed']
+
+    def runs(self):
+        """
+        Run dicts keyed by (K, seed), like fstools.index.load_runs, filled
+        in from the manifest alone.
+        """
+        results_dir = self.manifest['results_dir']
+        runs = OrderedDict()
+        for K in self.Ks:
+            entry = self.manifest['K'][str(K)]
+            for i, seed in enumerate(entry['seeds']):
+                source = entry['sources'][i]
+                runs[(K, seed)] = {
+                    'K': K, 'seed': seed,
+                    'log': os.path.join(results_dir, source['log']) if source['log'] else None,
+                    'meanQ': os.path.join(results_dir, source['meanQ']),
+                    'likelihood': entry['likelihood'][i],
+                    'k_phi_star': entry['k_phi_star'][i],
+                }
+        return runs
+
+    def stale(self):
+        """
+        Source files that changed or disappeared since the store was built.
+        """
+        results_dir = self.manifest['results_dir']
+        changed = []
+        for K in self.Ks:
+            for source in self.manifest['K'][str(K)]['sources']:
+                for kind in ('meanQ', 'log'):
+                    if not source[kind]:
+                        continue
+                    path = os.path.join(results_dir, source[kind])
+                    try:
+                        if _stamp(path) != source[kind + '_stamp']:
+                            changed.append(path)
+                    except OSError:
+                        changed.append(path)
+        saved = self.manifest['alignment']
+        if saved is not None:
+            alignment = os.path.join(results_dir, saved['file'])
+            if os.path.exists(alignment) and dict(_stamp(alignment), file=saved['file']) != saved:
+                changed.append(alignment)
+        return changed
+
+
+def open_store(store_dir, check=True):
+    """
+    Opens a store, warning on stderr when its sources changed since it was
+    built (check=True).
+    """
+    with stage('open_store'):
+        store = ResultsStore(store_dir)
+        if check:
+            changed = store.stale()
+            if changed:
+                sys.stderr.write("Warning: %d file(s) changed since the store in %s was built (e.g. %s). "
+                                 "Re-run 'fstools store' to include them.\n" % (len(changed), store_dir, changed[0]))
+    return store
+
+
+def iter_stacks(filetag, store=None, Ks=None):
+    """
+    Yields (K, seeds, stack) for every K (or those in Ks), stack being the
+    reps x N x K array of its runs in seed order: the store's memory map if
+    store (a ResultsStore) is given, else the aligned .meanQ files of
+    filetag stacked in memory.
+    """
+    if store is not None:
+        for K in store.Ks:
+            if Ks is None or K in Ks:
+                yield K, store.seeds(K), store.stack(K)
+        return
+
+    import numpy as np
+
+    from fstools.align import load_aligned_meanQ
+    from fstools.ingest import discover_runs
+
+    by_K = OrderedDict()
+    for (K, seed), run in discover_runs(filetag, extensions=('meanQ',)).items():
+        if Ks is None or K in Ks:
+            by_K.setdefault(K, []).append((seed, run['meanQ']))
+    for K, runs in by_K.items():
+        with stage('read_meanQ'):
+            Qs = [load_aligned_meanQ(path) for _, path in runs]
+        shapes = set(Q.shape for Q in Qs)
+        if len(shapes) > 1:
+            raise ValueError("the runs of K=%d do not all have the same shape: %s"
+                             % (K, ', '.join(str(shape) for shape in sorted(shapes))))
+        yield K, [seed for seed, _ in runs], np.stack(Qs)
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--output', help="store directory (default: %s next to the runs)" % STORE_DIRNAME)
+    parser.add_argument('--label-file', help="sample IDs, one per line in .meanQ row order "
+                                             "(default: name_and_state_county.txt if present)")
+    parser.add_argument('--metadata', help="TSV with a 'sample' column to keep in the store")
+    parser.add_argument('--jobs', type=int, default=1, help="parsing processes, 0 = all CPUs (default: %(default)s)")
+
+
+def run(args):
+    """
+    The store command: packs every run into a memory-mappable store.
+    """
+    label_file = args.label_file
+    if label_file is None and os.path.exists('name_and_state_county.txt'):
+        label_file = 'name_and_state_county.txt'
+    store_dir = args.output or default_store_dir(args.input)
+    try:
+        manifest = build_store(args.input, store_dir, label_file=label_file, metadata_file=args.metadata,
+                               jobs=args.jobs)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+
+    if not manifest['K']:
+        print("Error: No .meanQ files found matching '%s<K>.<seed>.meanQ'." % args.input)
+        return 1
+    n_runs = sum(len(entry['seeds']) for entry in manifest['K'].values())
+    print("Stored %d runs over %d K values (%d samples%s) in %s"
+          % (n_runs, len(manifest['K']), manifest['n_samples'],
+             ', IDs from ' + label_file if label_file else '', store_dir))
+    return 0
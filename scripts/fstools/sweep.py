@@ -0,0 +1,532 @@
+"""
+The sweep command: runs structure.py over a grid of K values and replicates.
+
+Replaces the fixed SLURM array of the old run_faststructure.py. The grid is
+every K in --k times --reps replicates; each (K, replicate) is one task
+with its own random seed, seed_base + K + 1000 * (replicate - 1), so the
+first replicate keeps the old script's seed (29092025 + K). Output files
+follow the usual '<filetag><K>.<run>.<ext>' naming, where replicate 1 is the
+plain structure.py name '<filetag><K>.<K>' (see ingest.replicate_run). An
+output of the old script is therefore the finished first replicate, and its
+seed is never run a second time under another name.
+
+A task whose outputs are already complete is never run again: its log
+holds the final likelihood and its .meanQ (plus .meanP/.varP/.varQ for
+--full) exists. structure.py writes into a '.fstools_running' directory
+and the files are only moved next to the finished runs once it exits
+cleanly, the log last, so a timed-out or failed task never leaves a half
+written run behind. Calling the command again after a failure therefore
+resubmits exactly the tasks that did not finish.
+
+Two backends:
+    slurm  writes a job array script and a task list under '<outdir>/sweep'
+           (and submits it with --submit); array task i runs line i
+    local  runs the tasks on a process pool on this machine
+"""
+import glob
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from fstools.ingest import parse_k_range, resolve_jobs, run_seeds
+from fstools.logs import read_final_likelihood
+from fstools.profiling import stage
+
+# Seed of the first replicate of K is DEFAULT_SEED_BASE + K, as in the old script
+DEFAULT_SEED_BASE = 29092025
+SEED_STRIDE = 1000
+
+# Where structure.py writes until a task has finished
+RUNNING_DIRNAME = '.fstools_running'
+
+# Batch scripts, task lists and the per-task .out/.err files
+SWEEP_DIRNAME = 'sweep'
+
+FULL_EXTENSIONS = ('meanP', 'varP', 'varQ')
+
+# Outputs are moved into place in this order; a run is complete once its log arrives
+MOVE_ORDER = ('meanQ',) + FULL_EXTENSIONS + ('log',)
+
+# K:    number of components
+# run:  number in the file names ('faststructure_K5.<run>.meanQ')
+# seed: random seed passed to structure.py
+Task = namedtuple('Task', ['K', 'run', 'seed'])
+
+SLURM_TEMPLATE = """#!/bin/bash
+#SBATCH --partition=%(partition)s
+#SBATCH --job-name=%(job_name)s
+#SBATCH --nodes=1
+#SBATCH --ntasks=1
+#SBATCH --cpus-per-task=1
+#SBATCH --mem=%(mem)s
+#SBATCH --time=%(time)s
+#SBATCH --array=%(array)s
+#SBATCH --output=%(logdir)s/%(batch)s_%%a.out
+#SBATCH --error=%(logdir)s/%(batch)s_%%a.err
+
+# Written by 'fstools sweep'. Array task i runs line i of the task file:
+# K, run number used in the file names, random seed.
+TASKS=%(tasks)s
+OUTDIR=%(outdir)s
+RUNNING=${OUTDIR}/%(running)s
+
+read K RUN SEED < <(sed -n "${SLURM_ARRAY_TASK_ID}p" "${TASKS}")
+PREFIX=%(tag)s${K}.${RUN}
+
+mkdir -p "${RUNNING}"
+cd %(workdir)s
+
+echo "Starting fastStructure run on $HOSTNAME"
+echo "K value: ${K}, Task ID: ${SLURM_ARRAY_TASK_ID}, Seed: ${SEED}"
+echo "Run: ${RUN}, Job ID: ${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}"
+echo "Input file: %(data)s"
+
+# --- Execution ---
+%(setup)s
+%(structure)s \\
+    -K ${K} \\
+    --input=%(data)s \\
+    --output="${RUNNING}/${PREFIX}" \\
+    --format=%(format)s \\
+    --seed=${SEED}%(full)s
+status=$?
+if [ ${status} -ne 0 ]; then
+    echo "structure.py exited with status ${status}" >&2
+    exit ${status}
+fi
+
+# structure.py appends K to the prefix; move the outputs next to the finished
+# runs under their final names, the log last
+for ext in %(extensions)s; do
+    if [ -e "${RUNNING}/${PREFIX}.${K}.${ext}" ]; then
+        mv "${RUNNING}/${PREFIX}.${K}.${ext}" "${OUTDIR}/${PREFIX}.${ext}"
+    fi
+done
+
+echo "Finished K=${K}"
+echo "Output files: ${OUTDIR}/${PREFIX}.*"
+# Read back by 'fstools resources'; peak memory comes from sacct
+echo "Resources: elapsed=${SECONDS} s"
+"""
+
+
+def task_seed(K, replicate, seed_base=DEFAULT_SEED_BASE):
+    """
+    Random seed of replicate (1-based) of K; replicate 1 gets seed_base + K.
+    """
+    return seed_base + K + SEED_STRIDE * (replicate - 1)
+
+
+def expand_grid(Ks, reps=1, seed_base=DEFAULT_SEED_BASE):
+    """
+    Returns the list of Tasks for every K in Ks and replicates 1..reps,
+    sorted by K then replicate.
+    """
+    tasks = []
+    for K in Ks:
+        for replicate, run in enumerate(run_seeds(K, reps), 1):
+            tasks.append(Task(K, run, task_seed(K, replicate, seed_base)))
+    return tasks
+
+
+def output_prefix(filetag, task):
+    """
+    Final output prefix of a task, e.g. 'results/faststructure_K5.5'.
+    """
+    return '%s%d.%d' % (filetag, task.K, task.run)
+
+
+def running_prefix(filetag, task):
+    """
+    Prefix passed to structure.py --output while the task runs.
+    """
+    prefix = output_prefix(filetag, task)
+    return os.path.join(os.path.dirname(prefix), RUNNING_DIRNAME, os.path.basename(prefix))
+
+
+def task_status(filetag, task, full=True):
+    """
+    Returns 'done' if the outputs of task are complete, 'incomplete' if it
+    was started but did not finish (failed, timed out or still running) and
+    'pending' if it never ran.
+    """
+    prefix = output_prefix(filetag, task)
+    try:
+        finished = read_final_likelihood(prefix + '.log') is not None
+    except (IOError, OSError, ValueError):
+        finished = False
+    needed = ('meanQ',) + (FULL_EXTENSIONS if full else ())
+    if finished and all(os.path.isfile(prefix + '.' + ext) for ext in needed):
+        return 'done'
+
+    if glob.glob(running_prefix(filetag, task) + '.*') or os.path.exists(prefix + '.log'):
+        return 'incomplete'
+    return 'pending'
+
+
+def check_tasks(filetag, tasks, full=True):
+    """
+    Returns an {task: status} dict for every task (see task_status).
+    """
+    with stage('check_outputs'):
+        return dict((task, task_status(filetag, task, full)) for task in tasks)
+
+
+def collect_outputs(filetag, task):
+    """
+    Moves the files structure.py wrote for task to their final names.
+    Returns the number of files moved.
+    """
+    source = '%s.%d' % (running_prefix(filetag, task), task.K)
+    target = output_prefix(filetag, task)
+    moved = 0
+    for ext in MOVE_ORDER:
+        if os.path.exists(source + '.' + ext):
+            os.replace(source + '.' + ext, target + '.' + ext)
+            moved += 1
+    return moved
+
+
+def print_status(tasks, status, out=sys.stdout):
+    """
+    Prints how many tasks of each K are done, incomplete and pending.
+    """
+    out.write('%3s %5s %6s %11s %8s\n' % ('K', 'runs', 'done', 'incomplete', 'pending'))
+    for K in sorted(set(task.K for task in tasks)):
+        states = [status[task] for task in tasks if task.K == K]
+        out.write('%3d %5d %6d %11d %8d\n' % (K, len(states), states.count('done'),
+                                               states.count('incomplete'), states.count('pending')))
+
+
+# --- SLURM backend ---
+
+def _next_batch(sweep_dir):
+    """
+    Name of the next batch in sweep_dir: 'batch_001', 'batch_002', ...
+    Earlier task lists are never overwritten, as their arrays may still run.
+    """
+    numbers = [0]
+    for path in glob.glob(os.path.join(sweep_dir, 'batch_*.tasks')):
+        try:
+            numbers.append(int(os.path.basename(path)[6:-6]))
+        except ValueError:
+            pass
+    return 'batch_%03d' % (max(numbers) + 1)
+
+
+def write_slurm_batch(tasks, filetag, data, structure='structure.py', setup=(), fmt='str', full=True,
+                      partition='guest', mem='10G', time_limit='1-00:00:00', max_running=None):
+    """
+    Writes a SLURM array script and its task list for tasks.
+
+    Arguments:
+        tasks : list of Task
+            the tasks to run, one array task each
+        filetag : str
+            output file tag, e.g. 'faststructure_results/faststructure_K'
+        data : str
+            structure.py --input (without the .str/.bed extension)
+        structure : str
+            command that runs structure.py
+        setup : list of str
+            shell lines run before structure.py, e.g. 'module load faststructure/1.0'
+        fmt : str
+            structure.py --format
+        full : bool
+            pass --full
+        partition, mem, time_limit : str
+            SLURM resources of every array task
+        max_running : int or None
+            at most this many array tasks run at once
+
+    Returns the path of the script.
+    """
+    outdir = os.path.abspath(os.path.dirname(filetag) or '.')
+    sweep_dir = os.path.join(outdir, SWEEP_DIRNAME)
+    if not os.path.isdir(sweep_dir):
+        os.makedirs(sweep_dir)
+    batch = _next_batch(sweep_dir)
+    tasks_path = os.path.join(sweep_dir, batch + '.tasks')
+    script_path = os.path.join(sweep_dir, batch + '.sh')
+
+    with open(tasks_path, 'w') as handle:
+        for task in tasks:
+            handle.write('%d %d %d\n' % task)
+
+    Ks = sorted(set(task.K for task in tasks))
+    array = '1-%d' % len(tasks)
+    if max_running:
+        array += '%%%d' % max_running
+    values = {
+        'partition': partition,
+        'job_name': 'FastStr_K%d-%d' % (Ks[0], Ks[-1]),
+        'mem': mem,
+        'time': time_limit,
+        'array': array,
+        'logdir': sweep_dir,
+        'batch': batch,
+        'tasks': shlex.quote(tasks_path),
+        'outdir': shlex.quote(outdir),
+        'running': RUNNING_DIRNAME,
+        'tag': shlex.quote(os.path.basename(filetag)),
+        'workdir': shlex.quote(os.getcwd()),
+        'data': shlex.quote(os.path.abspath(data)),
+        'setup': '\n'.join(setup),
+        'structure': structure,
+        'format': fmt,
+        'full': ' \\\n    --full' if full else '',
+        'extensions': ' '.join(MOVE_ORDER),
+    }
+    with open(script_path, 'w') as handle:
+        handle.write(SLURM_TEMPLATE % values)
+    return script_path
+
+
+# --- Local backend ---
+
+def structure_command(structure, task, data, output, fmt='str', full=True):
+    """
+    The structure.py argument list for one task.
+    """
+    command = shlex.split(structure) + ['-K', str(task.K), '--input=%s' % data, '--output=%s' % output,
+                                        '--format=%s' % fmt, '--seed=%d' % task.seed]
+    if full:
+        command.append('--full')
+    return command
+
+
+def call_with_usage(command, stdout, stderr, timeout=None):
+    """
+    Runs command like subprocess.call, but reaps it with os.wait4 so the
+    peak RSS of the run itself is known, not just of this process's children
+    as a whole.
+
+    Returns (exit status, peak RSS in KiB or None, timed_out). On timeout
+    the process is killed and its status is negative.
+    """
+    process = subprocess.Popen(command, stdout=stdout, stderr=stderr)
+    killed = []
+
+    def kill():
+        killed.append(True)
+        process.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout is not None else None
+    if timer is not None:
+        timer.start()
+    try:
+        if not hasattr(os, 'wait4'):
+            # Windows: no per-child usage
+            return process.wait(), None, bool(killed)
+        _, status, usage = os.wait4(process.pid, 0)
+        # Popen must not wait for the pid again
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        # Linux reports kilobytes, macOS bytes
+        rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        return process.returncode, rss, bool(killed)
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+def run_task(task, settings):
+    """
+    Runs one task on this machine and moves its outputs into place.
+
+    settings holds the sweep options: 'filetag', 'data', 'structure',
+    'format', 'full', 'timeout' (seconds or None) and 'logdir', where
+    structure.py's stdout/stderr go ('<tag><K>.<run>.out' / '.err').
+
+    Returns (task, outcome, seconds); outcome is 'done', 'timed out' or a
+    short failure reason.
+    """
+    filetag = settings['filetag']
+    output = running_prefix(filetag, task)
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    name = os.path.join(settings['logdir'], os.path.basename(output_prefix(filetag, task)))
+    command = structure_command(settings['structure'], task, settings['data'], output,
+                                settings['format'], settings['full'])
+
+    start = time.time()
+    with open(name + '.out', 'w') as out, open(name + '.err', 'w') as err:
+        out.write('Starting fastStructure run on %s\n' % os.uname()[1])
+        out.write('K value: %d, Run: %d, Seed: %d\n' % task)
+        out.write('Command: %s\n' % ' '.join(shlex.quote(arg) for arg in command))
+        out.flush()
+        try:
+            code, rss, timed_out = call_with_usage(command, out, err, settings['timeout'])
+        except OSError as e:
+            err.write('%s\n' % e)
+            return task, 'failed (%s)' % e, time.time() - start
+        seconds = time.time() - start
+        # Read back by 'fstools resources', like the SLURM task logs plus the peak memory
+        out.write('Resources: elapsed=%.1f s%s\n' % (seconds, ', max_rss=%d KB' % rss if rss is not None else ''))
+        # Worded like SLURM's own messages, so both read back the same way
+        if timed_out:
+            err.write('*** CANCELLED DUE TO TIME LIMIT (--timeout %g s) ***\n' % settings['timeout'])
+        elif code != 0:
+            err.write('structure.py exited with status %d\n' % code)
+
+    if timed_out:
+        return task, 'timed out', seconds
+    if code != 0:
+        return task, 'failed (exit status %d)' % code, seconds
+    collect_outputs(filetag, task)
+    if task_status(filetag, task, settings['full']) != 'done':
+        return task, 'failed (outputs incomplete)', seconds
+    return task, 'done', seconds
+
+
+def _run_task(item):
+    # Pool.imap_unordered passes a single argument
+    return run_task(*item)
+
+
+def run_local(tasks, settings, jobs=1, log=sys.stdout):
+    """
+    Runs tasks on a pool of jobs worker processes (0 = one per CPU),
+    printing each result as it finishes. Returns the list of
+    (task, outcome, seconds) in completion order.
+    """
+    if not os.path.isdir(settings['logdir']):
+        os.makedirs(settings['logdir'])
+    jobs = min(resolve_jobs(jobs), len(tasks))
+    items = [(task, settings) for task in tasks]
+    results = []
+    with stage('run_local'):
+        if jobs <= 1:
+            outcomes = map(_run_task, items)
+            pool = None
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs)
+            outcomes = pool.imap_unordered(_run_task, items)
+        try:
+            for task, outcome, seconds in outcomes:
+                log.write('K=%-3d run %-4d seed %-10d %-28s %9.1f s\n' % (task + (outcome, seconds)))
+                log.flush()
+                results.append((task, outcome, seconds))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--input', default='faststructure_results/faststructure_K', metavar='FILETAG',
+                        help="output file tag; its directory receives the results (default: %(default)s)")
+    parser.add_argument('--data', default='input_for_faststructure',
+                        help="structure.py --input, without the .str/.bed extension (default: %(default)s)")
+    parser.add_argument('--k', dest='k_range', default='1-10', help="K values, e.g. '1-10' or '2,4,6' (default: %(default)s)")
+    parser.add_argument('--reps', type=int, default=1, help="replicate runs per K (default: %(default)s)")
+    parser.add_argument('--seed-base', type=int, default=DEFAULT_SEED_BASE,
+                        help="replicate r of K gets seed BASE + K + 1000*(r-1) (default: %(default)s)")
+    parser.add_argument('--format', dest='fmt', default='str', choices=['str', 'bed'],
+                        help="structure.py --format (default: %(default)s)")
+    parser.add_argument('--no-full', dest='full', action='store_false',
+                        help="do not pass --full (no .meanP/.varP/.varQ)")
+    parser.add_argument('--structure', default='structure.py', help="command that runs structure.py (default: %(default)s)")
+    parser.add_argument('--backend', default='slurm', choices=['slurm', 'local'],
+                        help="write a SLURM job array or run on this machine (default: %(default)s)")
+    parser.add_argument('--status', action='store_true', help="only print which runs are done, incomplete or pending")
+    parser.add_argument('--dry-run', action='store_true', help="list the tasks that would run, and stop")
+
+    slurm = parser.add_argument_group('slurm backend')
+    slurm.add_argument('--partition', default='guest', help="(default: %(default)s)")
+    slurm.add_argument('--mem', default='10G', help="memory per task (default: %(default)s)")
+    slurm.add_argument('--time', dest='time_limit', default='1-00:00:00', help="time limit per task (default: %(default)s)")
+    slurm.add_argument('--resources', metavar='FILE',
+                       help="per-K --mem/--time from 'fstools resources'; K values it lacks get --mem/--time")
+    slurm.add_argument('--max-running', type=int, help="array tasks allowed to run at once")
+    slurm.add_argument('--setup', action='append', default=[], metavar='LINE',
+                       help="shell line run before structure.py, e.g. 'module load faststructure/1.0' (repeatable)")
+    slurm.add_argument('--submit', action='store_true', help="submit the script with sbatch")
+
+    local = parser.add_argument_group('local backend')
+    local.add_argument('--jobs', type=int, default=1, help="runs at once, 0 = all CPUs (default: %(default)s)")
+    local.add_argument('--timeout', type=float, help="seconds before a run is stopped and counted as failed")
+
+
+def run(args):
+    try:
+        Ks = parse_k_range(args.k_range)
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-10.")
+        return 1
+    if args.reps < 1:
+        print("Error: --reps must be at least 1.")
+        return 1
+
+    tasks = expand_grid(Ks, args.reps, args.seed_base)
+    status = check_tasks(args.input, tasks, args.full)
+    todo = [task for task in tasks if status[task] != 'done']
+
+    print_status(tasks, status)
+    if args.status:
+        return 0
+    if not todo:
+        print("All %d runs are complete." % len(tasks))
+        return 0
+
+    print("%d of %d runs to do (%d incomplete)."
+          % (len(todo), len(tasks), sum(status[task] == 'incomplete' for task in todo)))
+    if args.dry_run:
+        for task in todo:
+            print('K=%-3d run %-4d seed %d  -> %s' % (task + (output_prefix(args.input, task),)))
+        return 0
+
+    if args.backend == 'local':
+        if args.setup:
+            sys.stderr.write("Warning: --setup only applies to SLURM scripts; ignored.\n")
+        outdir = os.path.dirname(args.input) or '.'
+        settings = {'filetag': args.input, 'data': args.data, 'structure': args.structure, 'format': args.fmt,
+                    'full': args.full, 'timeout': args.timeout, 'logdir': os.path.join(outdir, SWEEP_DIRNAME)}
+        results = run_local(todo, settings, jobs=args.jobs)
+        failed = [result for result in results if result[1] != 'done']
+        print("%d runs finished, %d failed; run the same command again to retry the failed ones."
+              % (len(results) - len(failed), len(failed)) if failed else "All %d runs finished." % len(results))
+        return 1 if failed else 0
+
+    requests = {}
+    if args.resources:
+        from fstools.resources import read_proposal
+        try:
+            requests = read_proposal(args.resources)
+        except (IOError, OSError, ValueError) as e:
+            print("Error: Cannot read %s: %s" % (args.resources, e))
+            return 1
+
+    # One array per distinct (mem, time), as all tasks of an array get the same request
+    groups = {}
+    for task in todo:
+        groups.setdefault(requests.get(task.K, (args.mem, args.time_limit)), []).append(task)
+    scripts = []
+    with stage('write_batch'):
+        for (mem, time_limit), group in sorted(groups.items(), key=lambda item: item[1][0]):
+            scripts.append(write_slurm_batch(group, args.input, args.data, structure=args.structure,
+                                             setup=args.setup, fmt=args.fmt, full=args.full,
+                                             partition=args.partition, mem=mem, time_limit=time_limit,
+                                             max_running=args.max_running))
+            print("Job array script written to %s (%d tasks, --mem=%s --time=%s)"
+                  % (scripts[-1], len(group), mem, time_limit))
+    if any(status[task] == 'incomplete' for task in todo):
+        sys.stderr.write("Warning: incomplete runs are included; make sure the earlier array has "
+                         "left the queue (squeue -u $USER) before submitting.\n")
+    if not args.submit:
+        print("Submit with: %s" % ' && '.join('sbatch %s' % script for script in scripts))
+        return 0
+    for script in scripts:
+        try:
+            status = subprocess.call(['sbatch', script])
+        except OSError as e:
+            print("Error: could not run sbatch: %s" % e)
+            return 1
+        if status != 0:
+            return status
+    return 0
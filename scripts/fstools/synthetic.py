@@ -0,0 +1,241 @@
+"""
+Synthetic fastStructure output trees for testing and benchmarking.
+
+Writes the files a K sweep leaves behind - '<filetag><K>.<seed>.log' and
+'.meanQ', plus '.meanP', '.varQ' and '.varP' for --full runs - together with
+a matching label file, at any number of samples (N), loci (L), K values and
+replicates. The data follow a simple ground truth so every script gives
+meaningful answers on it:
+
+    - samples belong to the State/County groups of the plot scripts, and
+      each group has its own ancestry mix over k_true components
+    - runs with K > k_true leave their extra components nearly empty, so
+      K_phi_star levels off at k_true
+    - the final likelihood rises until k_true and then slowly drops
+    - every replicate numbers its components in a random order, as
+      fastStructure does
+
+Large files are written in row chunks, so memory stays bounded at any N/L.
+"""
+import os
+
+import numpy as np
+
+from fstools.ingest import run_seeds
+
+# Groups used for labels, in the style of 'Sample2_Nebraska_Douglas'
+GROUPS = ['Iowa', 'Nebraska_Thurston', 'Nebraska_Dodge', 'Nebraska_Douglas',
+          'Nebraska_Sarpy', 'Kansas']
+
+LABEL_FILENAME = 'name_and_state_county.txt'
+
+# Rows generated and written per chunk for the large per-locus files
+CHUNK_ROWS = 50000
+
+# fastStructure's default convergence tolerance on the likelihood change
+TOLERANCE = 1e-6
+
+
+def sample_labels(N, rng):
+    """
+    Returns (labels, groups): N labels and the group index of each sample.
+    Groups are interleaved, like a label file in sequencing order.
+    """
+    groups = rng.randint(0, len(GROUPS), size=N)
+    labels = ['Sample%d_%s' % (i + 1, GROUPS[g]) for i, g in enumerate(groups)]
+    return labels, groups
+
+
+def true_ancestry(groups, k_true, rng, concentration=0.5):
+    """
+    Returns the N x k_true true admixture proportions: each group draws
+    around its own mean ancestry.
+    """
+    means = rng.dirichlet(np.full(k_true, concentration), size=len(GROUPS))
+    # A large concentration keeps samples close to their group mean
+    alpha = 20.0 * means[groups] + 1e-3
+    gamma = rng.gamma(alpha)
+    return gamma / gamma.sum(axis=1, keepdims=True)
+
+
+def fitted_Q(truth, K, rng, noise=200.0):
+    """
+    Returns the N x K matrix one run at K would report. Below k_true the
+    last true components are merged; above it the extra ones get tiny
+    proportions. Columns come out in a random order.
+    """
+    N, k_true = truth.shape
+    if K <= k_true:
+        Q = np.column_stack([truth[:, :K - 1], truth[:, K - 1:].sum(axis=1)])
+    else:
+        Q = np.column_stack([truth, np.full((N, K - k_true), 1e-5)])
+    # Replicate-to-replicate noise around the fitted solution
+    gamma = rng.gamma(noise * Q + 1e-4)
+    Q = gamma / gamma.sum(axis=1, keepdims=True)
+    return Q[:, rng.permutation(K)]
+
+
+def final_likelihood(K, k_true, rng):
+    """
+    Per-site marginal likelihood: gains up to k_true, small penalty after.
+    """
+    return -0.95 + 0.02 * min(K, k_true) - 0.002 * K + rng.normal(0, 5e-4)
+
+
+def write_log(path, K, N, L, final, rng):
+    """
+    Writes a log with one line per iteration converging geometrically to
+    final, then the three summary lines, in fastStructure's format. The
+    delta of iteration i is 0.05 * rate**i, so it first drops below
+    TOLERANCE at the last iteration, as in a run that stopped there.
+    """
+    n_iter = int(30 + 12 * K + rng.randint(0, 20))
+    # Half a step past TOLERANCE: the last delta is below it, the one before above
+    rate = (TOLERANCE / 0.05) ** (1.0 / (n_iter - 1.5))
+    # Time per iteration grows with the data size and the number of components
+    it_time = 1e-7 * N * max(L, 1) * K / 1000.0 + 0.01
+    lines = []
+    total_time = 0.0
+    previous = final - 0.05 / (1.0 - rate)
+    for it in range(n_iter):
+        value = final - 0.05 * rate ** (it + 1) / (1.0 - rate)
+        seconds = it_time * (1.0 + 0.1 * rng.random_sample())
+        total_time += seconds
+        lines.append('Iteration=%d, Marginal Likelihood=%.10f, delta=%.10f, Iteration time=%.4f'
+                     % (it, value, abs(value - previous), seconds))
+        previous = value
+    lines.append('Marginal Likelihood = %.10f' % final)
+    lines.append('Total time = %.4f seconds' % total_time)
+    lines.append('Total iterations = %d ' % n_iter)
+    with open(path, 'w') as handle:
+        handle.write('\n'.join(lines) + '\n')
+
+
+def _write_matrix(path, rows, chunk_rows, make_chunk):
+    """
+    Writes a rows x n text matrix in fastStructure's '%.6f' two-space
+    format, generating it chunk by chunk with make_chunk(n_rows).
+    """
+    with open(path, 'wb') as handle:
+        for start in range(0, rows, chunk_rows):
+            np.savetxt(handle, make_chunk(min(chunk_rows, rows - start)), fmt='%.6f', delimiter='  ')
+
+
+def write_full_outputs(prefix, Q, L, rng, chunk_rows=CHUNK_ROWS):
+    """
+    Writes the --full extras for one run: .meanP (L x K allele
+    frequencies), .varP (L x 2K Beta parameters) and .varQ (N x K Dirichlet
+    parameters).
+    """
+    K = Q.shape[1]
+    _write_matrix(prefix + '.meanP', L, chunk_rows, lambda n: rng.beta(0.5, 0.5, size=(n, K)))
+    _write_matrix(prefix + '.varP', L, chunk_rows, lambda n: rng.gamma(2.0, 50.0, size=(n, 2 * K)))
+    # varQ is Q scaled by a per-sample concentration; N x K fits in memory
+    np.savetxt(prefix + '.varQ', Q * rng.gamma(50.0, 10.0, size=(Q.shape[0], 1)) + 1e-3,
+               fmt='%.6f', delimiter='  ')
+
+
+def write_structure_input(path, truth, L, rng, missing=0.01):
+    """
+    Writes a structure-format (--format=str) genotype file: two rows per
+    sample, six metadata columns, alleles 1/2 and -9 for missing calls.
+    Genotypes are drawn from the true ancestry one sample at a time, so only
+    the k_true x L allele frequencies are ever held in memory.
+    """
+    P = rng.beta(0.5, 0.5, size=(truth.shape[1], L))
+    with open(path, 'w') as handle:
+        for i in range(truth.shape[0]):
+            p = np.dot(truth[i], P)
+            alleles = (rng.random_sample((2, L)) < p).astype(np.int8) + 1
+            alleles[rng.random_sample((2, L)) < missing] = -9
+            for row in alleles:
+                handle.write('Sample%d 0 0 0 0 0 ' % (i + 1))
+                handle.write(' '.join(map(str, row.tolist())) + '\n')
+
+
+def write_synthetic_results(outdir, N=1000, L=5000, Ks=range(1, 11), reps=1, full=False,
+                            k_true=4, filetag='faststructure_K', seed=0, structure_input=False):
+    """
+    Writes a synthetic results tree.
+
+    Arguments:
+        outdir : str
+            directory to write into (created if needed)
+        N : int
+            number of samples
+        L : int
+            number of loci (used for --full outputs, the log timings and
+            the structure input)
+        Ks : iterable of int
+            K values to write runs for
+        reps : int
+            replicate runs per K
+        full : bool
+            also write .meanP/.varP/.varQ, as structure.py --full does
+        k_true : int
+            number of ancestral populations in the ground truth
+        filetag : str
+            output prefix inside outdir
+        seed : int
+            random seed; the same arguments always give the same files
+        structure_input : bool
+            also write the genotypes as 'input_for_faststructure.str'
+
+    Returns a list of the run file prefixes written.
+    """
+    rng = np.random.RandomState(seed)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    labels, groups = sample_labels(N, rng)
+    with open(os.path.join(outdir, LABEL_FILENAME), 'w') as handle:
+        handle.write('\n'.join(labels) + '\n')
+    truth = true_ancestry(groups, k_true, rng)
+
+    prefixes = []
+    for K in Ks:
+        for run_seed in run_seeds(K, reps):
+            prefix = os.path.join(outdir, '%s%d.%d' % (filetag, K, run_seed))
+            Q = fitted_Q(truth, K, rng)
+            np.savetxt(prefix + '.meanQ', Q, fmt='%.6f', delimiter='  ')
+            write_log(prefix + '.log', K, N, L, final_likelihood(K, k_true, rng), rng)
+            if full:
+                write_full_outputs(prefix, Q, L, rng)
+            prefixes.append(prefix)
+
+    if structure_input:
+        write_structure_input(os.path.join(outdir, 'input_for_faststructure.str'), truth, L, rng)
+    return prefixes
+
+
+def add_arguments(parser):
+    parser.add_argument('outdir', help="directory to write the results into")
+    parser.add_argument('--samples', type=int, default=1000, help="number of samples N (default: %(default)s)")
+    parser.add_argument('--loci', type=int, default=5000, help="number of loci L (default: %(default)s)")
+    parser.add_argument('--k', dest='k_range', default='1-10', help="K values, e.g. '1-10' or '2,4,6' (default: %(default)s)")
+    parser.add_argument('--reps', type=int, default=1, help="replicate runs per K (default: %(default)s)")
+    parser.add_argument('--k-true', type=int, default=4, help="ancestral populations in the simulated data (default: %(default)s)")
+    parser.add_argument('--full', action='store_true', help="also write .meanP/.varP/.varQ like structure.py --full")
+    parser.add_argument('--str-input', action='store_true',
+                        help="also write the genotypes as input_for_faststructure.str (--format=str)")
+    parser.add_argument('--input', default='faststructure_K', help="output file tag (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: %(default)s)")
+
+
+def run(args):
+    """
+    The synth command: writes a fake results tree.
+    """
+    from fstools.ingest import parse_k_range
+    try:
+        Ks = parse_k_range(args.k_range)
+    except ValueError:
+        print("Error: K values must be integers, e.g. --k 1-10.")
+        return 1
+
+    prefixes = write_synthetic_results(args.outdir, N=args.samples, L=args.loci, Ks=Ks, reps=args.reps,
+                                       full=args.full, k_true=args.k_true, filetag=args.input,
+                                       seed=args.seed, structure_input=args.str_input)
+    print("Wrote %d runs (N=%d, L=%d, K=%s, %d per K) to %s"
+          % (len(prefixes), args.samples, args.loci, args.k_range, args.reps, args.outdir))
+    return 0
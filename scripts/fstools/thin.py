@@ -0,0 +1,300 @@
+"""
+The thin command: locus subsets of a structure.py input for pilot sweeps.
+
+A pilot sweep on a few thousand loci narrows the K range at a fraction of
+the cost of the full input. This writes such subsets of a --format=str
+file, streamed one row at a time: only the first line is read to learn
+the number of loci (L), the kept columns are chosen up front, and then each
+row is split, its kept columns joined and written, so memory does not grow
+with N. Several replicate subsets are written in the same single pass.
+
+Loci are chosen by
+
+    --fraction F / --count N   a uniform random subset of that size
+    --spacing BP               with --positions: walking along each
+                               chromosome, keep a locus only if it lies at
+                               least BP after the last kept one
+
+--spacing can be combined with --fraction/--count to subsample what the
+spacing leaves. Next to each output '<prefix>.str' go '<prefix>.loci', the
+1-based input column of every kept locus (with its chromosome and position
+when known, for mapping per-locus results back), and '<prefix>.thin.json',
+which records the source file, the method and the random seed, so the
+same subset can be written again. A seed is drawn and recorded when none
+is given.
+"""
+import json
+import operator
+import os
+import sys
+
+import numpy as np
+
+from fstools.profiling import stage
+
+# Metadata columns before the genotypes in a structure.py .str file
+STR_META_COLUMNS = 6
+
+SIDECAR_SUFFIX = '.thin.json'
+LOCI_SUFFIX = '.loci'
+
+
+def str_path(prefix):
+    """
+    The .str file of a structure.py --input prefix (given with or without
+    its extension).
+    """
+    return prefix if prefix.endswith('.str') else prefix + '.str'
+
+
+def count_str_loci(path):
+    """
+    Number of loci in a .str file, from its first line.
+    """
+    with open(path, 'r') as handle:
+        first = handle.readline()
+    if not first.strip():
+        raise ValueError("%s is empty" % path)
+    L = len(first.split()) - STR_META_COLUMNS
+    if L < 1:
+        raise ValueError("%s has no genotype columns after the %d metadata columns" % (path, STR_META_COLUMNS))
+    return L
+
+
+def read_positions(path):
+    """
+    Reads locus positions, one line per locus in column order: returns
+    (chromosomes, positions) arrays. Takes a PLINK .bim or .map file (chromosome
+    in column 1, base-pair position in column 4) or plain 'chromosome position'
+    lines.
+    """
+    chromosomes, positions = [], []
+    with open(path, 'r') as handle:
+        for number, line in enumerate(handle, 1):
+            fields = line.split()
+            if not fields:
+                continue
+            try:
+                if len(fields) == 2:
+                    chromosomes.append(fields[0])
+                    positions.append(int(fields[1]))
+                elif len(fields) >= 4:
+                    chromosomes.append(fields[0])
+                    positions.append(int(fields[3]))
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError("%s line %d: expected 'chromosome position' or a .bim/.map line" % (path, number))
+    return np.array(chromosomes), np.array(positions, dtype=np.int64)
+
+
+def thin_by_spacing(chromosomes, positions, spacing):
+    """
+    Indices of the loci kept by walking each chromosome in position order
+    and keeping a locus only if it is at least spacing bp past the last one
+    kept. Returned in column order.
+    """
+    # Sort by chromosome, then position, remembering each locus's column
+    order = np.lexsort((positions, chromosomes))
+    kept = []
+    last_chromosome, last_position = None, None
+    for i in order:
+        if chromosomes[i] != last_chromosome or positions[i] - last_position >= spacing:
+            kept.append(i)
+            last_chromosome, last_position = chromosomes[i], positions[i]
+    return np.sort(np.array(kept, dtype=np.int64))
+
+
+def choose_loci(L, rng, fraction=None, count=None, candidates=None):
+    """
+    Sorted indices of a uniform random subset of the L loci (or of
+    candidates, if given): fraction of them or count of them. With neither,
+    all candidates are kept.
+    """
+    if candidates is None:
+        candidates = np.arange(L)
+    n = len(candidates)
+    if fraction is not None:
+        n = int(round(fraction * len(candidates)))
+    elif count is not None:
+        n = min(count, len(candidates))
+    if n == len(candidates):
+        return np.asarray(candidates)
+    return np.sort(rng.choice(candidates, size=n, replace=False))
+
+
+def thin_str(source, outputs, selections):
+    """
+    Streams the .str file source once, writing for every output path the
+    metadata columns and the selected loci of each row.
+
+    Arguments:
+        source : str
+            input .str file
+        outputs : list of str
+            output .str paths
+        selections : list of arrays
+            sorted 0-based locus indices for each output
+
+    Returns the number of rows written. Raises ValueError on a row whose
+    number of columns differs from the first.
+    """
+    getters = []
+    for kept in selections:
+        columns = list(range(STR_META_COLUMNS)) + [STR_META_COLUMNS + int(i) for i in kept]
+        # itemgetter of a single column returns the item, not a tuple
+        getters.append(operator.itemgetter(*columns) if len(columns) > 1 else lambda row, c=columns[0]: (row[c],))
+
+    handles = [open(path + '.tmp', 'w') for path in outputs]
+    rows = 0
+    width = None
+    try:
+        with open(source, 'r') as handle, stage('thin_rows'):
+            for line in handle:
+                fields = line.split()
+                if not fields:
+                    continue
+                if width is None:
+                    width = len(fields)
+                elif len(fields) != width:
+                    raise ValueError("%s row %d has %d columns, the first row %d"
+                                     % (source, rows + 1, len(fields), width))
+                for getter, out in zip(getters, handles):
+                    out.write(' '.join(getter(fields)))
+                    out.write('\n')
+                rows += 1
+    except BaseException:
+        for out, path in zip(handles, outputs):
+            out.close()
+            os.remove(path + '.tmp')
+        raise
+    # Renamed only when complete, so a pilot sweep never reads a partial subset
+    for out, path in zip(handles, outputs):
+        out.close()
+        os.replace(path + '.tmp', path)
+    return rows
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def write_loci(path, kept, chromosomes=None, positions=None):
+    """
+    Writes the 1-based input column of each kept locus, with its chromosome
+    and position when known.
+    """
+    with open(path, 'w') as handle:
+        if chromosomes is None:
+            handle.write('Locus\n')
+            np.savetxt(handle, kept + 1, fmt='%d')
+        else:
+            handle.write('Locus\tChromosome\tPosition\n')
+            for i in kept:
+                handle.write('%d\t%s\t%d\n' % (i + 1, chromosomes[i], positions[i]))
+
+
+def output_prefixes(prefix, replicates):
+    if replicates == 1:
+        return [prefix]
+    return ['%s_r%d' % (prefix, r) for r in range(1, replicates + 1)]
+
+
+def add_arguments(parser):
+    parser.add_argument('data', help="structure.py --input to thin (the .str file, extension optional)")
+    parser.add_argument('--output', help="output prefix, written as <prefix>.str (default: <data>_thin)")
+    how = parser.add_argument_group('which loci (at least one)')
+    how.add_argument('--fraction', type=float, help="keep this fraction of the loci, at random")
+    how.add_argument('--count', type=int, help="keep this many loci, at random")
+    how.add_argument('--spacing', type=int, metavar='BP', help="keep loci at least BP apart (needs --positions)")
+    parser.add_argument('--positions', help="locus positions in column order: a PLINK .bim/.map file "
+                                            "or 'chromosome position' lines")
+    parser.add_argument('--seed', type=int, help="random seed (default: drawn and recorded in the sidecar)")
+    parser.add_argument('--replicates', type=int, default=1,
+                        help="independent subsets to write in one pass, as <prefix>_r1, _r2, ... "
+                             "with seeds SEED, SEED+1, ... (default: %(default)s)")
+
+
+def run(args):
+    source = str_path(args.data)
+    if args.fraction is None and args.count is None and args.spacing is None:
+        print("Error: Give --fraction, --count or --spacing.")
+        return 1
+    if args.fraction is not None and args.count is not None:
+        print("Error: --fraction and --count cannot be combined.")
+        return 1
+    if args.fraction is not None and not 0 < args.fraction <= 1:
+        print("Error: --fraction must be in (0, 1].")
+        return 1
+    if args.count is not None and args.count < 1 or args.replicates < 1:
+        print("Error: --count and --replicates must be at least 1.")
+        return 1
+    if args.spacing is not None and not args.positions:
+        print("Error: --spacing needs --positions.")
+        return 1
+
+    try:
+        L = count_str_loci(source)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: Cannot read %s: %s" % (source, e))
+        return 1
+
+    chromosomes = positions = candidates = None
+    if args.positions:
+        try:
+            chromosomes, positions = read_positions(args.positions)
+        except (IOError, OSError, ValueError) as e:
+            print("Error: %s" % e)
+            return 1
+        if len(positions) != L:
+            print("Error: %s lists %d loci but %s has %d." % (args.positions, len(positions), source, L))
+            return 1
+    if args.spacing is not None:
+        with stage('thin_by_spacing'):
+            candidates = thin_by_spacing(chromosomes, positions, args.spacing)
+        print("Spacing of %d bp keeps %d of %d loci" % (args.spacing, len(candidates), L))
+        if args.replicates > 1 and args.fraction is None and args.count is None:
+            sys.stderr.write("Warning: spacing alone is deterministic; the %d replicates will be identical.\n"
+                             % args.replicates)
+
+    # Recorded either way, so an unseeded subset can be written again
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % (2 ** 31))
+    seeds = [seed + r for r in range(args.replicates)]
+    selections = [choose_loci(L, np.random.RandomState(s), args.fraction, args.count, candidates) for s in seeds]
+    if min(len(kept) for kept in selections) == 0:
+        print("Error: No loci left to keep.")
+        return 1
+
+    base = args.output or os.path.splitext(source)[0] + '_thin'
+    prefixes = output_prefixes(base, args.replicates)
+    for prefix in prefixes:
+        if os.path.dirname(prefix) and not os.path.isdir(os.path.dirname(prefix)):
+            os.makedirs(os.path.dirname(prefix))
+    try:
+        rows = thin_str(source, [prefix + '.str' for prefix in prefixes], selections)
+    except (IOError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+
+    for prefix, kept, replicate_seed in zip(prefixes, selections, seeds):
+        write_loci(prefix + LOCI_SUFFIX, kept, chromosomes, positions)
+        sidecar = {
+            'source': os.path.abspath(source),
+            'source_stamp': _stamp(source),
+            'samples': rows // 2,
+            'loci_in': L,
+            'loci_out': len(kept),
+            'fraction': args.fraction,
+            'count': args.count,
+            'spacing': args.spacing,
+            'positions': os.path.abspath(args.positions) if args.positions else None,
+            'seed': replicate_seed,
+            'loci_file': os.path.basename(prefix + LOCI_SUFFIX),
+        }
+        with open(prefix + SIDECAR_SUFFIX, 'w') as handle:
+            json.dump(sidecar, handle, indent=1)
+        print("%s.str: %d of %d loci, %d rows (seed %d)" % (prefix, len(kept), L, rows, replicate_seed))
+    print("Run a pilot sweep on it with: python run_faststructure.py --data %s --input pilot/faststructure_K"
+          % prefixes[0])
+    return 0
@@ -0,0 +1,153 @@
+"""
+Live monitoring of a running K sweep.
+
+Polls the results directory, picks up .log/.meanQ pairs as array tasks
+finish, and reprints the best-K answers plus a per-K progress table whenever
+something changes. Each poll is one directory stat; the file list is only
+re-read and re-indexed when the directory changed or some run is still
+being written.
+"""
+import os
+import sqlite3
+import sys
+import time
+
+from fstools.aggregate import format_kphi_counts, summarize_by_K
+from fstools.choosek import select_k
+from fstools.index import DEFAULT_SETTLE, ResultsIndex
+from fstools.ingest import PARSERS, discover_runs, ingest_runs
+
+
+def _is_complete(run):
+    """
+    A run counts once its log has a final likelihood and its .meanQ has
+    been parsed; both files must also have been quiet for the settle period.
+    """
+    return run['likelihood'] is not None and run['k_phi_star'] is not None
+
+
+def format_progress(results, expect=None):
+    """
+    Returns the status report for the current set of runs as a string:
+    best K by likelihood, modal K_phi_star and one progress row per K.
+
+    Arguments:
+        results : OrderedDict
+            runs keyed by (K, seed), as returned by ResultsIndex.refresh
+        expect : int
+            runs expected per K (shown as done/expected), or None
+
+    Runs whose files are still being written, or that never produced a
+    final likelihood or a .meanQ, are counted as pending.
+    """
+    done = [run for run in results.values() if _is_complete(run)]
+    lines = [time.strftime('[%H:%M:%S]') + ' %d complete run(s)' % len(done)]
+
+    if done:
+        best_K_mle, most_frequent_K = select_k(done)
+        lines.append("Model complexity that maximizes marginal likelihood = %d" % best_K_mle)
+        lines.append("Model components used to explain structure in data (modal bestK) = %d" % most_frequent_K)
+
+    # Every K with at least one file, including ones with no finished run yet
+    all_Ks = sorted(set(run['K'] for run in results.values()))
+    pending = dict((K, 0) for K in all_Ks)
+    for run in results.values():
+        if not _is_complete(run):
+            pending[run['K']] += 1
+
+    summary = summarize_by_K([r['K'] for r in done], [r['likelihood'] for r in done],
+                             [r['k_phi_star'] for r in done]) if done else None
+    row_of = dict((K, i) for i, K in enumerate(summary['K'])) if summary else {}
+
+    lines.append('%4s %9s %8s %16s %16s  %s' % ('K', 'done', 'pending', 'best LLBO', 'mean LLBO', 'K_phi_star'))
+    for K in all_Ks:
+        i = row_of.get(K)
+        n_done = summary['n_runs'][i] if i is not None else 0
+        done_text = '%d/%d' % (n_done, expect) if expect else '%d' % n_done
+        if i is None:
+            lines.append('%4d %9s %8d %16s %16s  %s' % (K, done_text, pending[K], '-', '-', '-'))
+        else:
+            lines.append('%4d %9s %8d %16.6f %16.6f  %s' % (
+                K, done_text, pending[K], summary['ll_max'][i], summary['ll_mean'][i],
+                format_kphi_counts(summary['kphi_counts'][i])))
+    return '\n'.join(lines)
+
+
+def parse_settled(filetag, jobs=1, min_age=0):
+    """
+    Parses every run of filetag without the index, for when it cannot be
+    used. Like ResultsIndex.refresh, files modified within min_age seconds
+    are left out as still being written.
+    """
+    runs = discover_runs(filetag)
+    now = time.time()
+    for run in runs.values():
+        for kind in PARSERS:
+            if run.get(kind) and min_age and now - os.stat(run[kind]).st_mtime < min_age:
+                run[kind] = None
+    return ingest_runs(runs, jobs=jobs)
+
+
+def _open_index(results_dir):
+    try:
+        return ResultsIndex(results_dir)
+    except sqlite3.Error as e:
+        sys.stderr.write("Warning: Results index unavailable (%s). Parsing all files on each poll.\n" % e)
+        return None
+
+
+def watch(filetag, interval=30.0, settle=DEFAULT_SETTLE, expect=None, jobs=1):
+    """
+    Polls the results for filetag until interrupted (Ctrl-C), printing an
+    updated report each time a run completes or a new one starts.
+
+    Arguments:
+        filetag : str
+            output prefix, e.g. 'results/faststructure_K'
+        interval : float
+            seconds between polls
+        settle : float
+            files modified within this many seconds are ignored as
+            partially written
+        expect : int
+            runs expected per K, for the progress column
+        jobs : int
+            worker processes for parsing newly finished files
+    """
+    results_dir = os.path.dirname(filetag) or '.'
+    # Read-only or locked index: every poll parses all files, like load_runs
+    index = _open_index(results_dir)
+    last_dir_mtime, last_report, pending = None, None, True
+    try:
+        while True:
+            dir_mtime = os.stat(results_dir).st_mtime
+            # A new file changes the directory mtime; growing files do not,
+            # so keep re-checking while any run is still incomplete.
+            if pending or dir_mtime != last_dir_mtime:
+                last_dir_mtime = dir_mtime
+                results = None
+                if index is not None:
+                    try:
+                        results = index.refresh(filetag, jobs=jobs, min_age=settle)
+                    except sqlite3.Error as e:
+                        sys.stderr.write("Warning: Results index unavailable (%s). "
+                                         "Parsing all files on each poll.\n" % e)
+                        index.close()
+                        index = None
+                if results is None:
+                    results = parse_settled(filetag, jobs=jobs, min_age=settle)
+                pending = any(not _is_complete(run) for run in results.values())
+
+                report = format_progress(results, expect=expect)
+                # Only reprint when the table itself changed
+                body = report.split('\n', 1)[-1]
+                if body != last_report:
+                    last_report = body
+                    sys.stdout.write(report + '\n\n')
+                    sys.stdout.flush()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        sys.stdout.write("Stopped watching %s\n" % results_dir)
+    finally:
+        if index is not None:
+            index.close()
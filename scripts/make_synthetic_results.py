@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# Wrapper for 'python -m fstools synth': write a fake fastStructure results tree.
+import sys
+
+from fstools.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main(['synth'] + sys.argv[1:]))
@@ -1,32 +1,41 @@
 #!/usr/bin/env python3
 import matplotlib.pyplot as plt
-import pandas as pd
+
+from fstools import profiling
+from fstools.align import load_aligned_meanQ
+from fstools.render import RASTER_DPI, draw_admixture, set_sample_labels
 
 # --- Config ---
 K = 2
 input_file = f"faststructure_K{K}.2.meanQ"
 label_file = "../name_and_state_cleaned.txt"
 output_pdf = f"Admixture_K{K}_custom_matplotlib.pdf"
+render_mode = "auto"  # 'vector', 'raster', or 'auto' (raster above RASTER_THRESHOLD samples)
+label_mode = "auto"   # 'all', 'thin', 'none', or 'auto' (thin above MAX_SAMPLE_LABELS samples)
+profile = False       # True prints the time and peak memory of each step to stderr
+
+if profile:
+    profiling.enable()
 
 # --- Read data ---
-Q = pd.read_csv(input_file, sep=r"\s+", header=None)
-labels = [line.strip() for line in open(label_file)]
+with profiling.stage('read_meanQ'):
+    Q = load_aligned_meanQ(input_file)  # aligned column order if align_clusters.py was run
+with profiling.stage('read_labels'):
+    labels = [line.strip() for line in open(label_file)]
 
 # --- Custom colors for each ancestry component ---
 # Change/add colors as needed; should match K
 colors = ['#1f77b4', '#ff7f0e']  # Example: blue & orange
 
 # --- Plot setup ---
-fig, ax = plt.subplots(figsize=(max(6, len(labels) * 0.25), 4))  # auto-width scaling
-bottom = pd.Series([0]*len(labels))
-
-for i in range(Q.shape[1]):
-    ax.bar(range(len(Q)), Q[i], bottom=bottom, color=colors[i])
-    bottom += Q[i]
+fig, ax = plt.subplots(figsize=(min(max(6, len(labels) * 0.25), 60), 4))  # auto-width scaling, capped
+# One filled polygon per component instead of one bar per sample
+with profiling.stage('draw_bars'):
+    draw_admixture(ax, Q, colors, mode=render_mode)
 
 # --- X-axis labels ---
-ax.set_xticks(range(len(labels)))
-ax.set_xticklabels(labels, rotation=90, fontsize=6)
+with profiling.stage('draw_labels'):
+    set_sample_labels(ax, labels, mode=label_mode, rotation=90, fontsize=6)
 
 # --- Axis labels and title ---
 ax.set_ylabel("Ancestry Proportion", fontsize=10)
@@ -34,6 +43,8 @@ ax.set_xlabel("Samples", fontsize=10)
 ax.set_title(f"Admixture Plot (K={K})", fontsize=12)
 ax.set_xlim(-0.5, len(labels) - 0.5)
 
-plt.tight_layout()
-plt.savefig(output_pdf, bbox_inches="tight")
+with profiling.stage('savefig'):
+    plt.tight_layout()
+    plt.savefig(output_pdf, bbox_inches="tight", dpi=RASTER_DPI)
 print(f"✅ Plot saved to {output_pdf}")
+profiling.finish()
@@ -0,0 +1,24 @@
+"""
+Shared fixtures: a small synthetic results tree with a known answer.
+"""
+import os
+
+import pytest
+
+from fstools.synthetic import write_synthetic_results
+
+# Ground truth of the synthetic tree
+K_TRUE = 4
+KS = range(1, 7)
+REPS = 3
+
+
+@pytest.fixture(scope='session')
+def results_tree(tmp_path_factory):
+    """
+    Writes 3 replicates of K=1..6 for 120 samples drawn from K_TRUE
+    populations and returns their file tag.
+    """
+    outdir = str(tmp_path_factory.mktemp('results'))
+    write_synthetic_results(outdir, N=120, L=50, Ks=KS, reps=REPS, k_true=K_TRUE, seed=1)
+    return os.path.join(outdir, 'faststructure_K')
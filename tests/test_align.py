@@ -0,0 +1,33 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from fstools.align import linear_sum_assignment
+
+
+def brute_force(cost):
+    """Lowest total cost over every assignment of rows to distinct columns."""
+    n, m = cost.shape
+    if n <= m:
+        return min(cost[np.arange(n), list(cols)].sum() for cols in itertools.permutations(range(m), n))
+    return brute_force(cost.T)
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (3, 3), (5, 5), (6, 6), (3, 5), (5, 3), (2, 6)])
+def test_matches_brute_force(shape):
+    rng = np.random.RandomState(sum(shape))
+    for _ in range(20):
+        cost = rng.random_sample(shape)
+        rows, cols = linear_sum_assignment(cost)
+        assert len(rows) == min(shape)
+        assert list(rows) == sorted(rows)
+        assert len(set(cols)) == len(cols)
+        assert np.isclose(cost[rows, cols].sum(), brute_force(cost))
+
+
+def test_ties_and_integers():
+    cost = np.array([[1, 1, 2], [1, 1, 2], [2, 2, 0]])
+    rows, cols = linear_sum_assignment(cost)
+    assert cost[rows, cols].sum() == 2
+    assert cols[2] == 2
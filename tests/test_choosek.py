@@ -0,0 +1,33 @@
+from conftest import K_TRUE, KS, REPS
+
+from fstools.choosek import select_k
+from fstools.index import load_runs
+from fstools.metrics import compile_metrics
+
+
+def test_every_run_is_found(results_tree):
+    runs = load_runs(results_tree, use_index=False)
+    assert len(runs) == len(KS) * REPS
+    assert all(run['likelihood'] is not None and run['k_phi_star'] is not None for run in runs.values())
+
+
+def test_choosek_finds_k_true(results_tree):
+    runs = list(load_runs(results_tree, use_index=False).values())
+    assert select_k(runs) == (K_TRUE, K_TRUE)
+
+
+def test_index_gives_the_same_answers(results_tree):
+    parsed = load_runs(results_tree, use_index=False)
+    assert load_runs(results_tree) == parsed
+    # The second call is answered from the index
+    assert load_runs(results_tree) == parsed
+
+
+def test_metrics_per_k(results_tree):
+    run_table, summary = compile_metrics(results_tree, use_index=False)
+    assert run_table.shape == (len(KS) * REPS, 4)
+    assert list(summary['K']) == list(KS)
+    assert list(summary['n_runs']) == [REPS] * len(KS)
+    assert summary['K'][summary['ll_max'].argmax()] == K_TRUE
+    # Past k_true the extra components stay empty
+    assert [int(value) for value in summary['kphi_mode']] == [min(K, K_TRUE) for K in KS]
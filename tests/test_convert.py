@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from fstools.convert import pack_bed, read_vcf
+
+HEADER = (b'##fileformat=VCFv4.2\n'
+          b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\tS4\tS5\n')
+
+# Per sample: 0/0 -> 00, 0/1 and 1|0 -> 10, 1/1 -> 11, missing -> 01 (PLINK .bed)
+RECORDS = [
+    b'1\t100\trs1\tA\tG\t.\tPASS\t.\tGT\t0/0\t0/1\t1/1\t./.\t1|0\n',
+    b'1\t200\trs2\tC\tT\t.\tPASS\t.\tGT:DP\t1/1:5\t0/0:3\t./.:0\t0/1:7\t0/0:2\n',
+    b'2\t300\trs3\tG\tA,C\t.\tPASS\t.\tGT\t0/0\t0/1\t0/2\t1/2\t0/0\n',
+]
+EXPECTED = [
+    [0b00, 0b10, 0b11, 0b01, 0b10],
+    [0b11, 0b00, 0b01, 0b10, 0b00],
+]
+
+
+def expected_bytes(genotypes):
+    out = []
+    for row in genotypes:
+        row = row + [0] * (-len(row) % 4)
+        out.extend(sum(code << (2 * i) for i, code in enumerate(row[j:j + 4])) for j in range(0, len(row), 4))
+    return bytes(out)
+
+
+@pytest.fixture
+def vcf(tmp_path):
+    path = tmp_path / 'calls.vcf'
+    path.write_bytes(HEADER + b''.join(RECORDS))
+    return str(path)
+
+
+def test_vcf_records(vcf):
+    samples, records = read_vcf(vcf)
+    loci = list(records)
+    assert samples == ['S1', 'S2', 'S3', 'S4', 'S5']
+    # The multiallelic locus is skipped and counted
+    assert [locus[1] for locus in loci] == ['rs1', 'rs2']
+    assert records.skipped == 1
+    assert loci[0][5].tolist() == [1, 1, 1, 2, 2, 2, 0, 0, 2, 1]
+
+
+def test_pack_bed_codes(vcf):
+    _, records = read_vcf(vcf)
+    codes = np.array([locus[5] for locus in records])
+    assert pack_bed(codes) == expected_bytes(EXPECTED)
+
+
+def test_pack_bed_pads_each_locus_to_a_byte():
+    codes = np.array([[2, 2, 1, 1, 1, 2, 0, 0, 1, 1, 2, 1, 2, 2]], dtype=np.int8)
+    assert pack_bed(codes) == expected_bytes([[0b11, 0b00, 0b10, 0b01, 0b00, 0b10, 0b11]])
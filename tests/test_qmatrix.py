@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pytest
+
+from fstools.qmatrix import load_meanQ, parse_meanQ_text, sidecar_paths
+
+
+def write(path, text):
+    path.write_bytes(text)
+    return str(path)
+
+
+def test_parses_blank_lines_and_crlf(tmp_path):
+    path = write(tmp_path / 'a.meanQ', b'\n0.1  0.9\r\n0.2  0.8\n\n  0.3 0.7')
+    assert parse_meanQ_text(path).tolist() == [[0.1, 0.9], [0.2, 0.8], [0.3, 0.7]]
+
+
+@pytest.mark.parametrize('text', [
+    b'0.1 0.2 0.3 0.4\n0.1 0.2 0.3\n0.1 0.2 0.3 0.4 0.5\n',   # right total, wrong rows
+    b'0.1 0.9\n0.2\n',
+    b'0.1 0.9\n0.2 0.3 0.5\n',
+])
+def test_ragged_files_are_rejected(tmp_path, text):
+    path = write(tmp_path / 'ragged.meanQ', text)
+    with pytest.raises(ValueError):
+        parse_meanQ_text(path)
+    with pytest.raises(ValueError):
+        load_meanQ(path)
+    # Nothing is cached for a bad file
+    assert not os.path.exists(sidecar_paths(path)[0])
+
+
+def test_non_numeric_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        parse_meanQ_text(write(tmp_path / 'bad.meanQ', b'0.1 x\n0.2 0.8\n'))
+
+
+def test_sidecar_follows_the_source(tmp_path):
+    path = write(tmp_path / 'q.meanQ', b'0.25  0.75\n0.5  0.5\n')
+    first = load_meanQ(path)
+    assert os.path.exists(sidecar_paths(path)[0])
+    np.testing.assert_array_equal(load_meanQ(path), first)
+
+    # A rewritten file (different size) makes the sidecar stale
+    write(tmp_path / 'q.meanQ', b'0.1  0.9\n0.2  0.8\n0.3  0.7\n')
+    assert load_meanQ(path).tolist() == [[0.1, 0.9], [0.2, 0.8], [0.3, 0.7]]
@@ -0,0 +1,31 @@
+from fstools.ingest import replicate_run, run_seeds
+from fstools.sweep import DEFAULT_SEED_BASE, expand_grid, task_status
+
+
+def test_replicate_one_is_the_plain_run():
+    for K in range(1, 12):
+        assert replicate_run(K, 1) == K
+
+
+def test_run_numbers_are_unique_and_stable():
+    for K in range(1, 12):
+        runs = run_seeds(K, 20)
+        assert len(set(runs)) == 20
+        assert runs.count(K) == 1
+        # More replicates never renumber the earlier ones
+        assert run_seeds(K, 5) == runs[:5]
+
+
+def test_first_replicate_keeps_the_old_seed():
+    tasks = expand_grid([5], reps=4)
+    assert tasks[0] == (5, 5, DEFAULT_SEED_BASE + 5)
+    assert [task.run for task in tasks] == [5, 1, 2, 3]
+    assert len(set(task.seed for task in tasks)) == 4
+
+
+def test_legacy_output_is_replicate_one(tmp_path):
+    filetag = str(tmp_path / 'faststructure_K')
+    (tmp_path / 'faststructure_K5.5.log').write_text('Marginal Likelihood = -0.9\n')
+    (tmp_path / 'faststructure_K5.5.meanQ').write_text('0.5  0.5\n')
+    status = [task_status(filetag, task, full=False) for task in expand_grid([5], reps=10)]
+    assert status == ['done'] + ['pending'] * 9